@@ -16,6 +16,12 @@ single(timeout): Launches the same acquisition but the function returns the
 Finally, the underscored version _single_async is a coroutine that can be
 used in another coroutine with the await keyword.
 
+The blocking hardware transfers and the data reduction of each trace are
+executed in the worker thread of the AcquisitionExecutor of the RedPitaya
+(see async_utils), such that neither the gui freezes during transfers nor
+gui updates delay the acquisition. Results are handed back to the event
+loop, where averaging and display take place.
+
 Example:
 
     This example shows a typical acquisition use case where a sequence of
@@ -55,7 +61,7 @@ Example:
         data1, data2 = my_acquisition_coroutine(10)
 """
 from copy import copy
-from .async_utils import ensure_future, sleep_async, wait, Event
+from .async_utils import ensure_future, sleep_async, wait, Event, run_async
 
 from .module_attributes import *
 
@@ -231,7 +237,8 @@ class AcquisitionModule(Module):
         """
         self._start_trace_acquisition()
         await self._data_ready_async(min_delay_ms)
-        AcquisitionModule.lastData = self._from_raw_data_to_numbers(self._get_trace())
+        AcquisitionModule.lastData = self._from_raw_data_to_numbers(
+            await self._get_trace_async())
         return AcquisitionModule.lastData
 
     def single_async(self):
@@ -252,7 +259,7 @@ class AcquisitionModule(Module):
         self._data_ready becomes eventually True.
         """
         await sleep_async(max(self._remaining_time(), min_delay_s))
-        while not self._data_ready():
+        while not await self._data_ready_poll_async():
             await sleep_async(max(self._remaining_time(), min_delay_s))
 
     async def _do_average_single_async(self):
@@ -436,6 +443,14 @@ class AcquisitionModule(Module):
         """
         raise NotImplementedError('To implement in derived class')  # pragma: no cover
 
+    async def _data_ready_poll_async(self):
+        """
+        Same as _data_ready, executed in the worker thread of self._executor.
+        May be overwritten in derived class to poll the hardware without
+        blocking the event loop.
+        """
+        return await run_async(self._executor, self._data_ready)
+
     def _get_trace(self):
         """
         get the curve from the instrument.
@@ -443,6 +458,23 @@ class AcquisitionModule(Module):
           a 2*n array for the scope
         """
         raise NotImplementedError  # pragma: no cover
+
+    async def _get_trace_async(self):
+        """
+        Same as _get_trace, executed in the worker thread of
+        self._executor. May be overwritten in derived class to transfer the
+        data without blocking the event loop.
+        """
+        return await run_async(self._executor, self._get_trace)
+
+    @property
+    def _executor(self):
+        """
+        AcquisitionExecutor (see async_utils) in whose worker thread the
+        blocking transfers and data reductions are executed, or None to
+        execute them in the event loop.
+        """
+        return None
     
     def _from_raw_data_to_numbers(self, data):
         """
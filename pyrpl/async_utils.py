@@ -17,6 +17,12 @@ place of sleep):
   * async_sleep(time_s): await this coroutine to stall the execution for a
                          time time_s within a coroutine.
 
+Blocking hardware I/O and heavy computations of acquisitions can be moved
+to a worker thread with an AcquisitionExecutor (one per RedPitaya):
+  * await run_async(executor, function, *args): executes function(*args)
+                         in the worker thread of executor (or directly if
+                         executor is None) without blocking the event loop.
+
 These functions are provided in place of the native asyncio functions in
 order to integrate properly within the IPython (Jupyter) Kernel. For this,
 Main loop of the application:
@@ -38,7 +44,9 @@ from qtpy import QtCore, QtWidgets
 import asyncio
 from asyncio import Future, iscoroutine
 import quamash
+import queue
 import sys
+import threading
 
 
 logger = logging.getLogger(name=__name__)
@@ -138,4 +146,112 @@ class Event(asyncio.Event):
     """
 
     def __init__(self):
-        super(Event, self).__init__(loop=LOOP)
\ No newline at end of file
+        super(Event, self).__init__(loop=LOOP)
+
+class AcquisitionExecutor(object):
+    """
+    Executes blocking functions (hardware I/O, NumPy reductions) in a
+    dedicated worker thread, such that the event loop LOOP, and with it the
+    GUI, remains responsive during acquisitions.
+
+    Jobs are executed one at a time in the order of submission. Their
+    results are handed back to the thread of LOOP through a bounded queue:
+    if the event loop does not collect them (e.g. because the GUI is busy),
+    the worker stalls after RESULT_QUEUE_SIZE results instead of piling up
+    data.
+
+    The functions must not touch Qt widgets. Access to the hardware client
+    from both threads is serialized by the client itself (see
+    MonitorClient.lock).
+
+    Example::
+
+        async def _get_trace_async(self):
+            return await self._executor.run(self._get_trace)
+    """
+    RESULT_QUEUE_SIZE = 4
+
+    def __init__(self, name="acquisition"):
+        self._jobs = queue.Queue()
+        self._results = queue.Queue(maxsize=self.RESULT_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._work,
+                                        name=name,
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, function, *args):
+        """
+        Schedules function(*args) in the worker thread and returns a future
+        of LOOP for its result. Cancelling the future discards the result,
+        but does not interrupt a job that has already started.
+        """
+        if self._thread is None:
+            raise RuntimeError("AcquisitionExecutor was shut down. ")
+        future = LOOP.create_future()
+        self._jobs.put((future, function, args))
+        return future
+
+    async def run(self, function, *args):
+        """
+        Coroutine that returns function(*args), executed in the worker
+        thread.
+        """
+        return await self.submit(function, *args)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker thread once the pending jobs are done.
+        """
+        if self._thread is None:
+            return
+        self._jobs.put(None)
+        if wait and threading.current_thread() is not self._thread:
+            self._deliver()  # make room for the pending results
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def in_worker_thread(self):
+        return threading.current_thread() is self._thread
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, function, args = job
+            if future.cancelled():
+                continue
+            try:
+                result = (function(*args), None)
+            except BaseException as e:
+                result = (None, e)
+            # blocks while RESULT_QUEUE_SIZE results are not collected
+            self._results.put((future,) + result)
+            try:
+                LOOP.call_soon_threadsafe(self._deliver)
+            except RuntimeError:  # event loop closed
+                return
+
+    def _deliver(self):
+        """ sets the collected results on their futures (thread of LOOP) """
+        while True:
+            try:
+                future, result, exception = self._results.get_nowait()
+            except queue.Empty:
+                return
+            if future.done():  # cancelled in the meantime
+                continue
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+
+async def run_async(executor, function, *args):
+    """
+    Returns function(*args), executed in the worker thread of executor.
+    If executor is None, function is executed directly in the event loop.
+    """
+    if executor is None or executor.in_worker_thread():
+        return function(*args)
+    return await executor.run(function, *args)
@@ -325,8 +325,14 @@ class ExpandableProperty(propertyWrapper):
 class BaseRegister(BaseProperty):
 	"""Registers implement the necessary read/write logic for storing an attribute on the redpitaya.
 	Interface for basic register of type int. To convert the value between register format and python readable
-	format, registers need to implement "from_python" and "to_python" functions"""
+	format, registers need to implement "from_python" and "to_python" functions
+
+	Registers listed in the _setup_attributes of their module are only changed
+	by the host, such that their value can be served from the register shadow
+	of the client. Register classes whose value the FPGA may change by itself
+	set volatile = True."""
 	default = None
+	volatile = False
 	def __init__(self, address, bitmask=None, bits=None, startBit=None, isAddressStatic = False, **kwargs):
 		if address & 0x3 != 0:
 			logger.error("FPGA address 0x%X is not word aligned (not divisible by 4), trying to read from this address will result in a bus error", address)
@@ -344,6 +350,21 @@ class BaseRegister(BaseProperty):
 		self.isAddressStatic = isAddressStatic
 		BaseProperty.__init__(self, **kwargs)
 
+	def cacheable(self, obj):
+		"""
+		Whether reads of the register may be served from the register shadow.
+		"""
+		return not self.volatile and getattr(self, 'name', None) in obj._setup_attributes
+
+	def words(self, obj):
+		"""
+		Returns a list of (absolute address, bitmask) of the register words.
+		"""
+		address = self.address
+		if not self.isAddressStatic:
+			address += obj._addr_base
+		return [(address, 0xFFFFFFFF if self.bitmask is None else self.bitmask)]
+
 	def _writes(self, obj, addr, v):
 		return obj._writes(addr, v, not self.isAddressStatic)
 
@@ -361,20 +382,24 @@ class BaseRegister(BaseProperty):
 		Retrieves the value that is physically on the redpitaya device.
 		"""
 		# self.parent = obj  # store obj in memory
-		val = obj._read(self.address, not self.isAddressStatic)
-		if self.bitmask is None:
-			# print(f"{obj.redpitaya.name} address {hex(self.address + (0 if self.isAddressStatic else obj._addr_base))}, reading {hex(val)}")
-			return self.to_python(obj, val)
+		if self.cacheable(obj):
+			val = obj._read_cached(self.address, 0xFFFFFFFF if self.bitmask is None else self.bitmask,
+								   not self.isAddressStatic)
 		else:
-			# print(f"{obj.redpitaya.name} address {hex(self.address + (0 if self.isAddressStatic else obj._addr_base))}, reading {hex(val)}")
-			retVal = val & self.bitmask
-			if self.startBit is not None: 
-				# try:
-					retVal >>= self.startBit
-				# except:
-				#     retVal /= (2**self.startBit)
-			retVal = self.to_python(obj, retVal)
-			return retVal
+			val = obj._read(self.address, not self.isAddressStatic)
+		return self.words_to_python(obj, [val])
+
+	def words_to_python(self, obj, words):
+		"""
+		Converts the words read at the addresses of words() into the value
+		of the register, e.g. for words that were read in a transaction.
+		"""
+		val = int(words[0])
+		if self.bitmask is not None:
+			val &= self.bitmask
+			if self.startBit is not None:
+				val >>= self.startBit
+		return self.to_python(obj, val)
 
 	def set_value(self, obj, val):
 		"""
@@ -384,14 +409,15 @@ class BaseRegister(BaseProperty):
 			obj._write(self.address, self.from_python(obj, val), not self.isAddressStatic)
 			# print(f"{obj.redpitaya.name} address {hex(self.address + (0 if self.isAddressStatic else obj._addr_base))}, writing {hex(self.from_python(obj, val))}")
 		else:
-			act = obj._read(self.address, not self.isAddressStatic)
-			new = act & (~self.bitmask)
 			addValue = int(self.from_python(obj, val))
 			if self.startBit is not None: 
 				addValue <<= self.startBit
-			new |= (addValue & self.bitmask)
-			obj._write(self.address, new, not self.isAddressStatic)
-			# print(f"{obj.redpitaya.name} address {hex(self.address + (0 if self.isAddressStatic else obj._addr_base))}, writing {hex(new)}")
+			if self.bitmask == 0xFFFFFFFF:
+				# the register spans the full word
+				obj._write(self.address, addValue & self.bitmask, not self.isAddressStatic)
+			else:
+				# the client merges the new bits with the other bits of the word
+				obj._write_masked(self.address, addValue & self.bitmask, self.bitmask, not self.isAddressStatic)
 				
 
 	def __set__(self, obj, value):
@@ -471,6 +497,9 @@ class BoolRegister(BaseRegister, BoolProperty):
 	def from_python(self, obj, val):
 		if self.invert:
 			val = not val
+		if self.bitmask is not None:
+			# set_value only writes the bit selected by the bitmask
+			return (1 << self.bit) if val else 0
 		if val:
 			towrite = obj._read(self.address, not self.isAddressStatic) | (1 << self.bit)
 		else:
@@ -503,6 +532,8 @@ class BoolIgnoreProperty(BoolProperty):
 class IORegister(BoolRegister):
 	"""Interface for digital outputs
 	if argument outputmode is True, output mode is set, else input mode"""
+	volatile = True  # the pin state in input mode is set by the hardware
+
 	def __init__(self, read_address, write_address, direction_address,
 				 outputmode=True, **kwargs):
 		self.write_address = write_address
@@ -523,11 +554,13 @@ class IORegister(BoolRegister):
 		else:
 			self.outputmode = v
 		self.address = self.write_address if v else self.read_address
-		if v:
-			v = obj._read(self.direction_address, not self.isAddressStatic) | (1 << self.bit)
-		else:
-			v = obj._read(self.direction_address, not self.isAddressStatic) & (~(1 << self.bit))
-		obj._write(self.direction_address, v, not self.isAddressStatic)
+		obj._write_masked(self.direction_address, (1 << self.bit) if v else 0,
+						  1 << self.bit, not self.isAddressStatic)
+
+	def words(self, obj):
+		base = 0 if self.isAddressStatic else obj._addr_base
+		return [(address + base, 1 << self.bit)
+				for address in (self.read_address, self.write_address)]
 
 	def get_value(self, obj):
 		self.direction(obj)
@@ -657,7 +690,177 @@ class ArrayProperty(BaseProperty):
 			raise Exception(f"unexpected amount of values. Should give {self.len} elements, but received {len(value)}")
 		return list(value)
 
-		
+
+
+class RegisterLayout(object):
+	"""
+	Word layout of a group of registers, e.g. the fields of one or several
+	ArrayRegisters that share FPGA words.
+
+	The fields are grouped by word address and the bitmasks of the fields
+	of each word are combined. Reading all fields then takes a single read
+	of the contiguous address span, and writing them a single transaction in
+	which the updates of all fields of a word are merged. Only fields that
+	use the plain read and write logic of BaseRegister can be compiled, see
+	the attribute compilable.
+
+	registers: list of registers or ArrayRegisters. Values are given and
+	returned as (nested) lists with the same structure.
+	"""
+	FULL_MASK = 0xFFFFFFFF
+
+	def __init__(self, registers):
+		self.registers = list(registers)
+		fields = self._flatten(self.registers, None, all_fields=True)
+		self.fields = [field for field, _ in fields]
+		self.compilable = len(self.fields) > 0 and all(
+			type(field).get_value is BaseRegister.get_value
+			and type(field).set_value is BaseRegister.set_value
+			and field.bitmask is not None
+			and field.isAddressStatic == self.fields[0].isAddressStatic
+			for field in self.fields)
+		if not self.compilable:
+			return
+		self.isAddressStatic = self.fields[0].isAddressStatic
+		addresses = np.array([field.address for field in self.fields])
+		self.start = int(addresses.min())
+		self.length = int(addresses.max() - self.start) // 4 + 1
+		self.offsets = (addresses - self.start) // 4
+		self.masks = np.zeros(self.length, dtype=np.int64)
+		np.bitwise_or.at(self.masks, self.offsets,
+						 [field.bitmask & self.FULL_MASK for field in self.fields])
+		self.used = np.flatnonzero(self.masks)
+
+	@staticmethod
+	def _flatten(registers, values, all_fields=False):
+		"""
+		Returns the list of (field, value) for the leaf registers. Like zip,
+		stops at the end of shorter value lists, unless all_fields is True.
+		"""
+		pairs = []
+		if all_fields:
+			values = [None] * len(registers)
+		for register, value in zip(registers, values):
+			if isinstance(register, ArrayRegister):
+				pairs += RegisterLayout._flatten(register.registers, value,
+												 all_fields)
+			else:
+				pairs.append((register, value))
+		return pairs
+
+	def _unflatten(self, registers, values):
+		nested = []
+		for register in registers:
+			if isinstance(register, ArrayRegister):
+				nested.append(self._unflatten(register.registers, values))
+			else:
+				nested.append(next(values))
+		return nested
+
+	def words(self, obj):
+		"""
+		Returns a list of (absolute address, combined bitmask) of the used
+		words.
+		"""
+		start = obj._absolute_address(self.start, not self.isAddressStatic)
+		return [(start + 0x4 * int(i), int(self.masks[i])) for i in self.used]
+
+	def read_words(self, obj, cacheable=False):
+		"""
+		Returns the words of the address span as an array. If cacheable,
+		the words are taken from the register shadow if all bits of the
+		fields are known.
+		"""
+		# no write of another thread between the read and the shadow update
+		with obj._client.lock:
+			add_base = not self.isAddressStatic
+			if cacheable:
+				words = np.zeros(self.length, dtype=np.int64)
+				for i, (addr, mask) in zip(self.used, self.words(obj)):
+					value = obj._shadow.get(addr, mask)
+					if value is None:
+						break
+					words[i] = value
+				else:
+					return words
+			words = np.array(obj._reads(self.start, self.length, add_base),
+							 dtype=np.int64)
+			if cacheable:
+				for i, (addr, mask) in zip(self.used, self.words(obj)):
+					obj._shadow.update(addr, int(words[i]))
+			return words
+
+	def get_values(self, obj, cacheable=False):
+		"""
+		Returns the values of all fields, with the structure of registers.
+		"""
+		words = self.read_words(obj, cacheable)
+		values = [field.words_to_python(obj, [words[offset]])
+				  for field, offset in zip(self.fields, self.offsets)]
+		return self._unflatten(self.registers, iter(values))
+
+	def write(self, obj, values):
+		"""
+		Writes values (with the structure of registers, lists may be
+		shorter than the registers) in a single transaction.
+		"""
+		offsets = dict(zip(map(id, self.fields), self.offsets))
+		fields = self._flatten(self.registers, values)
+		bits = np.zeros(self.length, dtype=np.int64)
+		written = np.zeros(self.length, dtype=np.int64)
+		field_offsets = [offsets[id(field)] for field, _ in fields]
+		field_values = []
+		for field, value in fields:
+			value = int(field.from_python(obj, value))
+			if field.startBit is not None:
+				value <<= field.startBit
+			field_values.append(value & field.bitmask & self.FULL_MASK)
+		np.bitwise_or.at(bits, field_offsets, field_values)
+		np.bitwise_or.at(written, field_offsets,
+						 [field.bitmask & self.FULL_MASK for field, _ in fields])
+		# the merged words must not change before they are written
+		with obj._client.lock:
+			add_base = not self.isAddressStatic
+			start = obj._absolute_address(self.start, add_base)
+			# complete partially written words from the shadow
+			for i in np.flatnonzero(written):
+				if written[i] != self.FULL_MASK:
+					word = obj._shadow.merge(start + 0x4 * int(i), int(bits[i]),
+											 int(written[i]))
+					if word is not None:
+						bits[i], written[i] = word, self.FULL_MASK
+			partial = (written != 0) & (written != self.FULL_MASK)
+			if partial.any() and not getattr(obj._client, '_batch_supported', False):
+				# without masked writes on the server, read the span once
+				old = np.array(obj._reads(self.start, self.length, add_base),
+							   dtype=np.int64)
+				bits[partial] |= old[partial] & ~written[partial]
+				written[partial] = self.FULL_MASK
+			obj._transact(self._operations(bits, written), add_base)
+
+	def _operations(self, bits, written):
+		"""
+		Client operations that write the words: consecutive full words in
+		one write, consecutive partial words with equal masks in one masked
+		write.
+		"""
+		operations = []
+		for i in np.flatnonzero(written):
+			mask = int(written[i])
+			addr = self.start + 0x4 * int(i)
+			previous = operations[-1] if operations else None
+			if previous is not None and \
+					previous[1] + 0x4 * len(previous[2]) == addr and \
+					(previous[0] == 'w' if mask == self.FULL_MASK
+					 else previous[0] == 'm' and previous[3] == mask):
+				previous[2].append(int(bits[i]))
+			elif mask == self.FULL_MASK:
+				operations.append(('w', addr, [int(bits[i])]))
+			else:
+				operations.append(('m', addr, [int(bits[i])], mask))
+		return operations
+
+	
 T = TypeVar("T")
 class ArrayRegister(BaseRegister, ArrayProperty):
 	"""
@@ -702,8 +905,29 @@ class ArrayRegister(BaseRegister, ArrayProperty):
 	@registers.setter
 	def registers(self, value):
 		self._registers = value
-		
+		self._layout = None
+
+	@property
+	def layout(self):
+		"""
+		RegisterLayout of all sub-registers
+		"""
+		if getattr(self, '_layout', None) is None:
+			self._layout = RegisterLayout(self.registers)
+		return self._layout
+
+	def words(self, obj):
+		if self.layout.compilable:
+			return self.layout.words(obj)
+		return [word for reg in self.registers for word in reg.words(obj)]
+
 	def get_value(self, obj):
+		"""
+		Reads all sub-registers, with a single read of their address span
+		if possible.
+		"""
+		if self.layout.compilable:
+			return self.layout.get_values(obj, self.cacheable(obj))
 		values = []
 		for reg in self.registers:
 			values.append(reg.get_value(obj))
@@ -711,8 +935,11 @@ class ArrayRegister(BaseRegister, ArrayProperty):
 
 	def set_value(self, obj, val):
 		"""
-		Sets the value on the redpitaya device.
+		Sets the value on the redpitaya device, in a single transaction if
+		possible.
 		"""
+		if self.layout.compilable:
+			return self.layout.write(obj, val)
 		for reg, value in zip(self.registers, val):
 			reg.set_value(obj, value)
 
@@ -733,11 +960,22 @@ class ConstantIntRegister(IntRegister):
 
 class LongRegister(IntRegister):
 	"""Interface for register of python type int/long with arbitrary length 'bits' (effectively unsigned)"""
+	def words(self, obj):
+		address = self.address
+		if not self.isAddressStatic:
+			address += obj._addr_base
+		bitmask = (1 << (32 * self.size)) - 1 if self.bitmask is None else self.bitmask
+		return [(address + 0x4 * i, (bitmask >> (32 * i)) & 0xFFFFFFFF)
+				for i in range(self.size)]
+
 	def get_value(self, obj):
 		values = obj._reads(self.address, self.size, not self.isAddressStatic)
+		return self.words_to_python(obj, values)
+
+	def words_to_python(self, obj, words):
 		value = int(0)
 		for i in range(self.size):
-			value += int(values[i]) << (32 * i)
+			value += int(words[i]) << (32 * i)
 		if self.bitmask is None:
 			return self.to_python(obj, value)
 		else:
@@ -1753,9 +1991,9 @@ class CurveSelectProperty(SelectProperty):
 
 	def _default_options(self):
 		if self.no_curve_first:
-			return [-1] + [curve.pk for curve in CurveDB.all()]
+			return [-1] + CurveDB.all_pks()
 		else:
-			return [curve.pk for curve in CurveDB.all()] + [-1]
+			return CurveDB.all_pks() + [-1]
 		#return OrderedDict([(k, k) for k in (CurveDB.all()) + [-1]])
 
 	def validate_and_normalize(self, obj, value):
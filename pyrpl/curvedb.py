@@ -31,6 +31,8 @@ import numpy as np
 import pandas as pd
 import os
 import logging
+import sqlite3
+import threading
 import pickle as file_backend
 #import json as file_backend  # currently unable to store pandas
 
@@ -44,7 +46,15 @@ except:
     from . import user_curve_dir
     class CurveDB(object):
         _dirname = user_curve_dir
-        file_extension = '.dat'
+        file_extension = '.dat'  # legacy format: pickled [pk, params, data]
+        array_extension = '.npy'
+        # index of all curves (primary key, name, parent, params)
+        index_filename = 'curves.sqlite'
+        _index = None
+        _index_lock = threading.RLock()
+        # arrays are mapped copy-on-write from their files. Windows does not
+        # allow to replace or delete mapped files, so they are loaded there.
+        _mmap_mode = None if os.name == 'nt' else 'c'
 
         if not os.path.exists(_dirname): # if _dirname doesn't exist, some unexpected errors will occur.
             os.mkdir(_dirname)
@@ -59,10 +69,26 @@ except:
             """
             self.logger = logging.getLogger(name=__name__)
             self.params = dict()
+            # number of stored arrays whose loading is deferred, or None
+            self._stored_arrays = None
             x, y = np.array([], dtype=float), np.array([], dtype=float)
             self.data = (x, y)
             self.name = name
 
+        @property
+        def data(self):
+            """
+            the data arrays of the curve. For saved curves, they are only
+            loaded when accessed, as memory-mapped (copy-on-write) arrays.
+            """
+            if self._data is None:
+                self._data = self._load_data()
+            return self._data
+
+        @data.setter
+        def data(self, val):
+            self._data = val
+
         @property
         def name(self):
             return self.params["name"]
@@ -111,35 +137,165 @@ except:
             x, y = self.data
             pd.Series(y, index=x).plot()
 
+        # Storage: the params of all curves are kept in an sqlite index,
+        # the data arrays in one binary .npy file per array
+        @classmethod
+        def _db(cls):
+            """ returns the connection to the index, creates it if needed """
+            with cls._index_lock:
+                if CurveDB._index is None:
+                    filename = os.path.join(cls._dirname, cls.index_filename)
+                    new = not os.path.exists(filename)
+                    db = sqlite3.connect(filename, check_same_thread=False)
+                    db.execute("CREATE TABLE IF NOT EXISTS curves ("
+                               "pk INTEGER PRIMARY KEY AUTOINCREMENT, "
+                               "name TEXT, parent INTEGER, "
+                               "n_arrays INTEGER, params BLOB)")
+                    db.execute("CREATE INDEX IF NOT EXISTS curves_parent "
+                               "ON curves (parent)")
+                    db.commit()
+                    CurveDB._index = db
+                    if new:
+                        cls._import_legacy_files()
+                return CurveDB._index
+
+        @classmethod
+        def _import_legacy_files(cls):
+            """
+            Registers the curves saved in the legacy .dat format in the index.
+            Their data stays in the .dat files (n_arrays is NULL).
+            """
+            db = CurveDB._index
+            max_pk = 0
+            for f in os.listdir(cls._dirname):
+                if not f.endswith(cls.file_extension):
+                    continue
+                try:
+                    max_pk = max(max_pk, int(f[:-len(cls.file_extension)]))
+                except ValueError:
+                    continue
+                try:
+                    with open(os.path.join(cls._dirname, f), 'rb') as fp:
+                        pk, params, _ = file_backend.load(fp)
+                except Exception:  # empty placeholders or corrupt files
+                    continue
+                db.execute("INSERT OR REPLACE INTO curves "
+                           "(pk, name, parent, n_arrays, params) "
+                           "VALUES (?, ?, ?, NULL, ?)",
+                           (int(pk), params.get("name"),
+                            params.get("parent"),
+                            file_backend.dumps(params)))
+            # new keys must not collide with reserved but unsaved legacy keys
+            db.execute("DELETE FROM sqlite_sequence WHERE name = 'curves'")
+            db.execute("INSERT INTO sqlite_sequence (name, seq) "
+                       "VALUES ('curves', ?)",
+                       (max([max_pk] + cls.all_pks()),))
+            db.commit()
+
+        @classmethod
+        def _array_filename(cls, pk, index):
+            return os.path.join(cls._dirname, "%d_%d%s" % (
+                pk, index, cls.array_extension))
+
+        @classmethod
+        def _from_row(cls, row):
+            """ creates the curve from a row of the index, without data """
+            pk, n_arrays, params = row
+            curve = CurveDB()
+            curve._pk = pk
+            curve.params = file_backend.loads(params)
+            curve._stored_arrays = n_arrays
+            curve._data = None
+            return curve
+
+        def _load_data(self):
+            if self._stored_arrays is None:  # legacy file
+                with open(os.path.join(self._dirname,
+                                       str(self.pk) + self.file_extension),
+                          'rb') as f:
+                    _, _, data = file_backend.load(f)
+                data = tuple([np.asarray(a) for a in data])
+                if isinstance(data, pd.Series):  # for backwards compatibility
+                    data = (data.index.values, data.values)
+                return data
+            data = []
+            for i in range(self._stored_arrays):
+                filename = self._array_filename(self.pk, i)
+                try:
+                    data.append(np.load(filename, mmap_mode=self._mmap_mode))
+                except ValueError:  # empty or object arrays cannot be mapped
+                    data.append(np.load(filename, allow_pickle=True))
+            return tuple(data)
+
+        @classmethod
+        def _query(cls, where="", args=()):
+            """ returns the curves of the index that match where """
+            with cls._index_lock:
+                rows = cls._db().execute(
+                    "SELECT pk, n_arrays, params FROM curves " + where,
+                    args).fetchall()
+            return [cls._from_row(row) for row in rows]
+
         # Implement the following methods if you want to save curves permanently
         @classmethod
         def get(cls, curve):
             if isinstance(curve, CurveDB):
                 return curve
             elif isinstance(curve, list):
-                return [CurveDB.get(c) for c in curve]
+                curves = cls._get_existing(curve)
+                if len(curves) < len(curve):
+                    found = [c.pk for c in curves]
+                    raise KeyError("No curve with pk %s. " % [
+                        c for c in curve if not isinstance(c, CurveDB)
+                        and int(c) not in found])
+                return curves
             else:
-                with open(os.path.join(CurveDB._dirname, str(curve) + cls.file_extension),
-                          'rb' if file_backend.__name__ == 'pickle' else 'r')\
-                        as f:
-                    # rb is for compatibility with python 3
-                    # see http://stackoverflow.com/questions/5512811/builtins-typeerror-must-be-str-not-bytes
-                    curve = CurveDB()
-                    curve._pk, curve.params, data = file_backend.load(f)
-                    curve.data = tuple([np.asarray(a) for a in data])
-                if isinstance(curve.data, pd.Series):  # for backwards compatibility
-                    x, y = curve.data.index.values, curve.data.values
-                    curve.data = (x, y)
-                return curve
+                curves = cls._query("WHERE pk = ?", (int(curve),))
+                if len(curves) == 0:
+                    raise KeyError("No curve with pk %s. " % curve)
+                return curves[0]
+
+        @classmethod
+        def _get_existing(cls, curves):
+            """ loads the existing curves of a list with a single query """
+            pks = [int(c) for c in curves if not isinstance(c, CurveDB)]
+            loaded = dict()
+            for i in range(0, len(pks), 500):  # sqlite parameter limit
+                chunk = pks[i:i + 500]
+                loaded.update((c.pk, c) for c in cls._query(
+                    "WHERE pk IN (%s)" % ",".join("?" * len(chunk)), chunk))
+            return [c if isinstance(c, CurveDB) else loaded[int(c)]
+                    for c in curves
+                    if isinstance(c, CurveDB) or int(c) in loaded]
 
         def save(self):
-            with open(os.path.join(self._dirname, str(self.pk) + self.file_extension),
-                      'wb' if file_backend.__name__ == 'pickle' else 'w')\
-                    as f:
-                # wb is for compatibility with python 3
-                # see http://stackoverflow.com/questions/5512811/builtins-typeerror-must-be-str-not-bytes
-                data = [a.tolist() for a in self.data]
-                file_backend.dump([self.pk, self.params, data], f, )
+            if self._data is None and self._stored_arrays is not None:
+                # unchanged data that was never loaded
+                n_arrays = self._stored_arrays
+            else:
+                # load mapped arrays into memory before replacing their files
+                data = [np.array(a) for a in self.data]
+                self._data = tuple(data)
+                for i, a in enumerate(data):
+                    filename = self._array_filename(self.pk, i)
+                    np.save(filename + '.tmp', a)
+                    os.replace(filename + '.tmp' + self.array_extension,
+                               filename)
+                n_arrays = len(data)
+            with self._index_lock:
+                db = self._db()
+                db.execute("UPDATE curves SET name = ?, parent = ?, "
+                           "n_arrays = ?, params = ? WHERE pk = ?",
+                           (self.params.get("name"),
+                            self.params.get("parent"), n_arrays,
+                            file_backend.dumps(self.params), self.pk))
+                db.commit()
+            self._stored_arrays = n_arrays
+            # the data is now saved in the new format
+            legacy = os.path.join(self._dirname,
+                                  str(self.pk) + self.file_extension)
+            if os.path.exists(legacy):
+                os.remove(legacy)
 
         def delete(self):
             # remove the file
@@ -151,16 +307,29 @@ except:
                 for child in childs:
                     child.delete()
             self.logger.debug("Deleting curve %d" % delpk)
-            try:
-                filename = os.path.join(self._dirname, str(self.pk) + self.file_extension)
-                os.remove(filename)
-            except OSError:
-                self.logger.warning("Could not find and remove the file %s. ",
-                                    filename)
+            self._data = None  # release the mapped files
+            with self._index_lock:
+                db = self._db()
+                row = db.execute("SELECT n_arrays FROM curves WHERE pk = ?",
+                                 (delpk,)).fetchone()
+                db.execute("DELETE FROM curves WHERE pk = ?", (delpk,))
+                db.commit()
+            if row is None or row[0] is None:
+                filenames = [os.path.join(self._dirname,
+                                          str(delpk) + self.file_extension)]
+            else:
+                filenames = [self._array_filename(delpk, i)
+                             for i in range(row[0])]
+            for filename in filenames:
+                try:
+                    os.remove(filename)
+                except OSError:
+                    self.logger.warning("Could not find and remove the file "
+                                        "%s. ", filename)
             if parent:
-                parentchilds = parent.childs
-                parentchilds.remove(delpk)
-                parent.childs = parentchilds
+                parent.params["childs"] = [pk for pk in
+                                           parent.params["childs"] or []
+                                           if pk != delpk]
                 parent.save()
 
         # Implement the following methods if you want to use a hierarchical
@@ -174,10 +343,7 @@ except:
             if childs is None:
                 return []
             else:
-                try:
-                    return CurveDB.get(childs)
-                except KeyError:
-                    return []
+                return CurveDB._get_existing(childs)
 
         @property
         def parent(self):
@@ -203,17 +369,26 @@ except:
             Returns:
                 list of int: A list of the primary keys of all CurveDB objects on the computer.
             """
-            pks = [int(f.split('.dat')[0])
-                   for f in os.listdir(cls._dirname) if f.endswith('.dat')]
-            return sorted(pks, reverse=True)
+            with cls._index_lock:
+                rows = cls._db().execute(
+                    "SELECT pk FROM curves ORDER BY pk DESC").fetchall()
+            return [row[0] for row in rows]
 
         @classmethod
-        def all(cls):
+        def all(cls, name=None):
             """
+            Only the params of the curves are loaded, their data is loaded
+            when accessed.
+
+            Arguments:
+                name (str): if given, only curves with this name are returned.
+
             Returns:
                 list of CurveDB: A list of all CurveDB objects on the computer.
             """
-            return [cls.get(pk) for pk in cls.all_pks()]
+            if name is None:
+                return cls._query("ORDER BY pk DESC")
+            return cls._query("WHERE name = ? ORDER BY pk DESC", (name,))
 
         @property
         def pk(self):
@@ -223,19 +398,17 @@ except:
             if hasattr(self, "_pk"):
                 return self._pk
             else:
-                pks = self.all_pks()
-                if len(pks) == 0:
-                    self._pk = 1
-                else:
-                    self._pk = max(pks) + 1
-                # create the file to make this pk choice persistent
-                with open(os.path.join(self._dirname,
-                                       str(self._pk) + ".dat"), 'w') as f:
-                    f.close()
+                # the index allocates the key and makes it persistent
+                with self._index_lock:
+                    db = self._db()
+                    cursor = db.execute(
+                        "INSERT INTO curves (name, parent, n_arrays, params) "
+                        "VALUES (?, ?, 0, ?)",
+                        (self.params.get("name"), self.params.get("parent"),
+                         file_backend.dumps(self.params)))
+                    db.commit()
+                self._pk = cursor.lastrowid
                 return self._pk
-            return -1
-            # a proper implementation will assign the database primary key for pk
-            # the primary key is used to load a curve from the storage into memory
 
         def sort(self):
             """numerically sorts the data series so that indexing can be used"""
@@ -261,6 +434,7 @@ except:
             Returns:
                 CurveDB: the child curve
             """
-            for c in self.childs:
-                if c.name == name:
-                    return c
+            childs = self._query("WHERE parent = ? AND name = ? ORDER BY pk",
+                                 (self.pk, name))
+            if childs:
+                return childs[0]
@@ -0,0 +1,104 @@
+"""
+Concurrent access to several RedPitayas.
+
+A DeviceSession fans out requests to several boards at the same time and
+gathers their results, such that the duration of a cycle is bounded by the
+slowest board rather than by the sum over all boards. Every board keeps its
+own connection: the transfers of synchronous clients are executed in the
+worker thread of the board's AcquisitionExecutor (see async_utils), the
+requests of asynchronous clients are in flight at the same time in the event
+loop.
+
+Example::
+
+    session = p.session  # all RedPitayas of a Pyrpl instance
+    # read the first pid integrator of every board in parallel
+    ivals = session.transact([(rp.pid0, [('r', 0x100, 1)])
+                              for rp in session.redpitayas])
+    # acquire one scope trace per board, all on the same trigger
+    times, traces = session.scope_traces()
+"""
+import logging
+import asyncio
+from .async_utils import ensure_future, wait
+
+logger = logging.getLogger(name=__name__)
+
+
+class DeviceSession(object):
+    """
+    Group of RedPitayas whose requests are executed concurrently.
+
+    redpitayas: list of RedPitaya instances. The scope of the first board
+    is considered to trigger the scopes of the other boards (see
+    :meth:`scope_traces_async`).
+    """
+    def __init__(self, redpitayas):
+        self.redpitayas = list(redpitayas)
+
+    @property
+    def scopes(self):
+        return [rp.scope for rp in self.redpitayas]
+
+    @staticmethod
+    async def gather_async(coroutines):
+        """
+        Runs the coroutines concurrently and returns the list of their
+        results, in the same order.
+        """
+        # tasks of LOOP start in the order of the list
+        return list(await asyncio.gather(*[ensure_future(coroutine)
+                                           for coroutine in coroutines]))
+
+    async def transact_async(self, requests):
+        """
+        Executes the client operations of all requests concurrently.
+
+        requests: list of (hardware module, list of operations), with
+        addresses relative to the module (see MonitorClient.transact for
+        the operations). Several requests to the same board are executed
+        one after another.
+
+        Returns the list of the results of each request.
+        """
+        return await self.gather_async([module._transact_async(operations)
+                                        for module, operations in requests])
+
+    def transact(self, requests):
+        """
+        Same as :meth:`transact_async`, but blocks until all results are
+        available.
+        """
+        return wait(ensure_future(self.transact_async(requests)))
+
+    async def scope_traces_async(self, min_delay_s=0, scopes=None):
+        """
+        Acquires one trace with each scope concurrently.
+
+        The scope of the first board is armed last, such that the other
+        scopes, which are triggered by it (e.g. trigger_source
+        'ext_positive_edge'), do not miss the trigger of the same scan and
+        the traces are time-aligned.
+
+        Returns (times, traces), where times are the times of the first
+        scope and traces is the list of (2, data_length) arrays in the
+        order of scopes (by default, the scopes of all boards). Every
+        acquisition returns new trace arrays.
+        """
+        if scopes is None:
+            scopes = self.scopes
+        order = list(range(1, len(scopes))) + [0]
+        traces = await self.gather_async([scopes[i]._trace_async(min_delay_s)
+                                          for i in order])
+        result = [None] * len(scopes)
+        for i, trace in zip(order, traces):
+            result[i] = trace
+        return scopes[0].times, result
+
+    def scope_traces(self, min_delay_s=0, scopes=None):
+        """
+        Same as :meth:`scope_traces_async`, but blocks until all traces are
+        available.
+        """
+        return wait(ensure_future(self.scope_traces_async(min_delay_s,
+                                                          scopes)))
@@ -132,7 +132,10 @@ class AsgOffsetAttribute(FloatProperty):
         super(AsgOffsetAttribute, self).__init__(**kwargs)
 
     def set_value(self, instance, val):
-        instance._offset_masked = val
+        # only write the register, offset itself is saved and signalled
+        register = type(instance)._offset_masked
+        register.set_value(instance,
+                           register.validate_and_normalize(instance, val))
 
     def get_value(self, obj):
         return obj._offset_masked
@@ -350,7 +353,7 @@ def make_asg(channel=0):
             # values that are still negativeare set to maximally negatuve
             data[data < 0] = -2 ** 13
             data = np.array(data, dtype=np.uint32)
-            self._writes(self._DATA_OFFSET, data)
+            self._writes_packed(self._DATA_OFFSET, data)
             # memorize the data on host PC since we have disabled readback from fpga
             self._writtendata = data
 
@@ -6,6 +6,7 @@ from ...attributes import IntRegister, BoolRegister, ComplexProperty, \
     ComplexAttributeListProperty, BoolProperty, SelectProperty
 from ...widgets.module_widgets import IirWidget
 from ...modules import SignalLauncher
+from ...pyrpl_utils import TransferFunctionCache
 
 import numpy as np
 from qtpy import QtCore
@@ -195,6 +196,10 @@ class IIR(FilterModule):
     # the fpga-implemented notation (following Oppenheim and Schaefer: DSP)
     _invert = True
 
+    def __init__(self, parent, name=None, index=0):
+        self._tf_cache = TransferFunctionCache()  # see transfer_function
+        super(IIR, self).__init__(parent, name=name, index=index)
+
     _IIRBITS = ConstantIntRegister(0x200)
 
     _IIRSHIFT = ConstantIntRegister(0x204)
@@ -490,6 +495,7 @@ class IIR(FilterModule):
                 raise Exception("Error: This FPGA bitfile does not support IIR "
                                 "filters! Please use an IIR version!")
             self.on = False
+            self._tf_cache.clear()
             # don't mess with bypass parameter
             #self.bypass = False
             # design the filter
@@ -692,8 +698,36 @@ class IIR(FilterModule):
         # expectation value for the delay (plus internal propagation delay)
         # module_delay = self._delay + self.loops / 2.0
 
-        return self.iirfilter.tf_final(frequencies)
+        frequencies = np.asarray(frequencies, dtype=float)
+        key = (self.iirfilter,
+               self.iirfilter.inputfilter,
+               frequencies.shape,
+               frequencies.tobytes())
+        return self._tf_cache.get(
+            key, lambda: self.iirfilter.tf_final(frequencies))
+
+
+    def _simulated_coefficients(self, biquad="all"):
+        if biquad == 'all':
+            return self.coefficients
+        else:
+            return [self.coefficients[biquad]]
+
+    def simulator(self, biquad="all", integer=False):
+        """
+        returns an iir_theory.BiquadSimulator for the current coefficients.
 
+        Pass consecutive blocks of a long time series to its method
+        process() to simulate the filter without holding the whole input
+        in memory. With integer=True, the fixed-point arithmetics of the
+        FPGA are reproduced, inputs and outputs are then in the internal
+        representation (see simulate_filter_int).
+        """
+        coefs = self._simulated_coefficients(biquad)
+        if integer:
+            return iir_theory.BiquadSimulator(coefs, shift=self._IIRSHIFT,
+                                              bits=self._IIRBITS)
+        return iir_theory.BiquadSimulator(coefs)
 
     def simulate_filter_float(self, xs, biquad="all"):
         """
@@ -702,22 +736,7 @@ class IIR(FilterModule):
         :param freq:
         :return:
         """
-        if biquad=='all':
-            coefs = self.coefficients
-        else:
-            coefs = [self.coefficients[biquad]]
-
-        ys = np.zeros(len(xs))
-        ys_biquad = np.zeros((len(coefs), 2))
-        for index in range(2, len(xs)):
-            for index_biquad, (b0, b1, _, _, a1, a2) in enumerate(coefs):
-                adder = -  a1 * ys_biquad[index_biquad, 0] - a2 * ys_biquad[index_biquad, 1]
-
-                y = b0 * xs[index] + b1 * xs[index - 1] + adder
-                ys[index] += y
-                ys_biquad[index_biquad, 1] = ys_biquad[index_biquad, 0]
-                ys_biquad[index_biquad, 0] = y
-        return ys
+        return self.simulator(biquad).process(xs)
 
     def simulate_filter_int(self, xs, biquad="all"):
         """
@@ -726,17 +745,6 @@ class IIR(FilterModule):
         :param freq:
         :return:
         """
-        print("yo")
-
-        if biquad == 'all':
-            coefs = self.coefficients
-        else:
-            coefs = [self.coefficients[biquad]]
-        coefs = np.array(coefs)
-
-        coefs = np.asarray(coefs*(2**self._IIRSHIFT), dtype=np.int64)
-
-
         if xs.dtype != int:
             raise TypeError("expected an integer input array")
 
@@ -746,26 +754,10 @@ class IIR(FilterModule):
         if any(xs < -2**13):
             raise ValueError("input should not exceed -2**13 = -8192")
 
-
-
         xs = xs*2**3 # pre-filters change the signal from 14 to 17 bits
         xs = xs*2**(-self._IIRBITS + 17 + self._IIRSHIFT + 1)
 
-
-        ys = np.zeros(len(xs), dtype=np.int64)
-        ys_biquad = np.zeros((len(coefs), 2), dtype=np.int64)
-
-        for index in range(2, len(xs)):
-            for index_biquad, (b0, b1, _, _, a1, a2) in enumerate(coefs):
-                p_ay1 = self._product_sat(-a1, ys_biquad[index_biquad, 0])
-                p_ay2 = self._product_sat(-a2, ys_biquad[index_biquad, 1])
-                p_bx0 = self._product_sat(b0, xs[index])
-                p_bx1 = self._product_sat(b1, xs[index - 1])
-                y = self._saturate(p_ay1 + p_ay2 + p_bx0 + p_bx1, bits=self._IIRBITS)
-                ys[index] += y
-                ys_biquad[index_biquad, 1] = ys_biquad[index_biquad, 0]
-                ys_biquad[index_biquad, 0] = y
-
+        ys = self.simulator(biquad, integer=True).process(xs)
         return ys//2**(self._IIRBITS - 14)
 
 
@@ -21,9 +21,17 @@ import scipy.signal as sig
 import numpy as np
 import logging
 from ...errors import ExpectedPyrplError
+from ...pyrpl_utils import TransferFunctionCache
 
 logger = logging.getLogger(name=__name__)
 
+# The results of each stage of the filter design are shared by all IirFilter
+# instances and keyed by the inputs of the stage, such that a new design
+# (e.g. after a single pole has been moved) only recomputes the stages whose
+# inputs have actually changed.
+_design_cache = TransferFunctionCache(maxsize=64)
+_tf_cache = TransferFunctionCache(maxsize=16)
+
 # this is not strictly needed
 try:
     import matplotlib.pyplot as plt
@@ -457,8 +465,18 @@ class IirFilter(object):
         # clean the filter specification so we can work with it and find the
         # right number of loops
         zeros, poles, gain = self.proper_sys
-        # this isnt really necessary as rescaled_sys will call proper_sys
-
+        key = ('coefficients', tuple(zeros), tuple(poles), gain, self.loops,
+               self.dt, self.tol)
+        self._coefficients, self.rp_discrete = _design_cache.get(
+            key, self._design_coefficients)
+        _ = self.coefficients_rounded  # 'tf_implemented'
+        return self._coefficients
+
+    def _design_coefficients(self):
+        """
+        Returns the coefficients and the discrete residues and poles
+        (rd, pd, cd) of the design specified by proper_sys.
+        """
         # get factor in front of ratio of zeros and poles
         # scale to angular frequencies
         z, p, k = self.rescaled_sys  # 'tf_continuous'
@@ -481,16 +499,14 @@ class IirFilter(object):
         pd = np.exp(np.asarray(p, dtype=np.complex128)*self.dt*self.loops)
         rd, cd = residues(zd, pd, k)
 
-        self.rp_discrete = rd, pd, cd  # 'tf_discrete'
+        rp_discrete = rd, pd, cd  # 'tf_discrete'
 
         # convert (r, p) into biquad coefficients
         coefficients = self.rp2coefficients(rd, pd, cd, tol=self.tol)
 
         # rearrange second order sections for minimum delay
         coefficients = self.minimize_delay(coefficients) # 'tf_implemented_perfect'
-        self._coefficients = coefficients
-        _ = self.finiteprecision()  # 'tf_implemented'
-        return coefficients
+        return coefficients, rp_discrete
 
     @property
     def proper_sys(self):
@@ -516,6 +532,19 @@ class IirFilter(object):
         if hasattr(self, '_proper_sys'):
             return self._proper_sys
         zeros, poles, gain = self.sys
+        key = ('proper_sys', tuple(zeros), tuple(poles), gain, self.loops,
+               self.minloops, self.maxloops, self.iirstages, self.tol)
+        zeros, poles, gain, self.loops = _design_cache.get(
+            key, self._design_proper_sys)
+        # copies, such that the cached design cannot be modified
+        self._proper_sys = (list(zeros), list(poles), gain)
+        return self._proper_sys
+
+    def _design_proper_sys(self):
+        """
+        Returns (zeros, poles, gain, loops) for proper_sys.
+        """
+        zeros, poles, gain = self.sys
         loops = self.loops
         minloops, maxloops, iirstages, tol = self.minloops, self.maxloops, \
                                              self.iirstages, self.tol
@@ -594,9 +623,7 @@ class IirFilter(object):
             # if more poles must be added, make sure we have no 2 poles at the
             # same frequency
             extrapole /= 2
-        self.loops = loops
-        self._proper_sys = (zeros, poles, gain)
-        return self._proper_sys
+        return tuple(zeros), tuple(poles), gain, loops
 
     @property
     def rescaled_sys(self):
@@ -816,25 +843,23 @@ class IirFilter(object):
         """
         if coefficients is None:
             coefficients = self.coefficients
-        ranks = list()
-        for c in list(coefficients):
-            # empty sections (numerator is 0) are ranked 0
-            if (c[0:3] == 0).all():
-                ranks.append(0)
-            else:
-
-                z, p, k = sos2zpk([c])
-                # compute something proportional to the frequency of the pole
-                ppp = [np.abs(np.log(pp)) for pp in p if pp != 0]
-                if not ppp:
-                    f = 1e20  # no pole -> superfast
-                else:
-                    f = np.max(ppp)
-                ranks.append(f)
-        newcoefficients = [c for (rank, c) in
-                           sorted(zip(ranks, list(coefficients)),
-                                  key=lambda pair: -pair[0])]
-        return np.array(newcoefficients)
+        coefficients = np.asarray(coefficients, dtype=np.float64)
+        # poles of all sections at once: roots of a0*z**2 + a1*z + a2
+        a0, a1, a2 = coefficients[:, 3], coefficients[:, 4], coefficients[:, 5]
+        sqrt_discriminant = np.sqrt(np.asarray(a1**2 - 4*a0*a2,
+                                               dtype=np.complex128))
+        p = np.stack([(-a1 + sqrt_discriminant) / (2*a0),
+                      (-a1 - sqrt_discriminant) / (2*a0)], axis=-1)
+        # compute something proportional to the frequency of the poles
+        nonzero = p != 0
+        with np.errstate(divide='ignore'):
+            ppp = np.where(nonzero, np.abs(np.log(np.where(nonzero, p, 1))),
+                           -np.inf)
+        ranks = np.max(ppp, axis=-1)
+        ranks[~nonzero.any(axis=-1)] = 1e20  # no pole -> superfast
+        # empty sections (numerator is 0) are ranked 0
+        ranks[(coefficients[:, 0:3] == 0).all(axis=-1)] = 0
+        return coefficients[np.argsort(-ranks, kind='stable')]
 
     def finiteprecision(self, coeff=None, totalbits=None, shiftbits=None):
         if coeff is None:
@@ -843,30 +868,24 @@ class IirFilter(object):
             totalbits = self.totalbits
         if shiftbits is None:
             shiftbits = self.shiftbits
-        res = coeff * 0 + coeff  # weird way to make a copy of coeff
-        for x in np.nditer(res, op_flags=['readwrite']):
-            xr = np.round(x * 2 ** shiftbits)
-            xmax = 2 ** (totalbits - 1)
-            if xr == 0 and xr != 0:
-                logger.warning("One value was rounded off to zero: Increase "
-                               "shiftbits in fpga design if this is a "
-                               "problem!")
-            elif xr > xmax - 1:
-                xr = xmax - 1
-                logger.warning("One value saturates positively: Increase "
-                               "totalbits or decrease gain!")
-            elif xr < -xmax:
-                xr = -xmax
-                logger.warning("One value saturates negatively: Increase "
-                               "totalbits or decrease gain!")
-            x[...] = 2 ** (-shiftbits) * xr
-        return res
+        xr = np.round(np.asarray(coeff, dtype=np.float64) * 2 ** shiftbits)
+        xmax = 2 ** (totalbits - 1)
+        if (xr > xmax - 1).any():
+            logger.warning("One value saturates positively: Increase "
+                           "totalbits or decrease gain!")
+        if (xr < -xmax).any():
+            logger.warning("One value saturates negatively: Increase "
+                           "totalbits or decrease gain!")
+        return 2 ** (-shiftbits) * np.clip(xr, -xmax, xmax - 1)
 
     @property
     def coefficients_rounded(self):
         if hasattr(self, '_fcoefficients'):
             return self._fcoefficients
-        self._fcoefficients = self.finiteprecision()
+        coefficients = self.coefficients
+        key = ('finiteprecision', coefficients.shape, coefficients.tobytes(),
+               self.totalbits, self.shiftbits)
+        self._fcoefficients = _design_cache.get(key, self.finiteprecision)
         return self._fcoefficients
 
     def tf_inputfilter(self, inputfilter=None, frequencies=None):  # input
@@ -1032,22 +1051,30 @@ class IirFilter(object):
             fcoefficients = self.coefficients
         else:
             fcoefficients = coefficients
+        fcoefficients = np.asarray(fcoefficients, dtype=np.float64)
+        key = ('tf_coefficients', frequencies.shape, frequencies.tobytes(),
+               fcoefficients.shape, fcoefficients.tobytes(), delay, self.dt,
+               self.loops)
+        return _tf_cache.get(key, lambda: self._biquads_response(
+            frequencies, fcoefficients, delay))
+
+    def _biquads_response(self, frequencies, coefficients, delay):
+        """
+        Sum of the responses of all biquads (rows of coefficients) at
+        frequencies, evaluated for all biquads at once.
+        """
         # discrete frequency
         w = frequencies * 2 * np.pi * self.dt * self.loops
+        zm1 = np.exp(-1j * w)  # z^-1 on the unit circle
+        zm = np.stack([np.ones_like(zm1), zm1, zm1**2])
+        # (biquads, 3) x (3, frequencies)
+        hh = np.dot(coefficients[:, :3], zm) / np.dot(coefficients[:, 3:], zm)
         # the higher stages have progressively more delay to the output
         if delay:
             delay_per_cycle = np.exp(-1j * self.dt * frequencies * 2 * np.pi)
-        h = np.zeros(len(w), dtype=np.complex128)
-        for i in range(len(fcoefficients)):
-            sos = np.asarray(fcoefficients[i], dtype=np.float64)
-            # later we can use sig.sosfreqz (very recent function, dont want
-            #  to update scipy now)
-            ww, hh = sig.freqz(sos[:3], sos[3:], worN=np.asarray(w,
-                                                           dtype=np.float64))
-            if delay:
-                hh *= delay_per_cycle ** (i + 1)
-            h += hh
-        return h
+            hh *= delay_per_cycle ** np.arange(1, len(coefficients) + 1)[
+                :, np.newaxis]
+        return hh.sum(axis=0)
 
     def tf_rounded(self, frequencies=None, delay=False):
         """
@@ -1125,3 +1152,120 @@ class IirFilter(object):
         return self._frequencies
 
 
+
+
+class BiquadSimulator(object):
+    """
+    Time-domain simulation of the parallel biquads of the iir module.
+
+    Each biquad computes y[n] = b0*x[n] + b1*x[n-1] - a1*y[n-1] - a2*y[n-2]
+    and the output is the sum of all biquad outputs. The first two input
+    samples only initialize the filter state and yield an output of zero.
+
+    The state of the filter is kept between calls of :meth:`process`,
+    such that a long input can be simulated block by block.
+
+    Parameters
+    ----------
+    coefficients: array of shape (n, 6)
+        the iir coefficients (b0, b1, b2, a0, a1, a2) of each biquad
+    shift: int or None
+        None for a floating point simulation. Otherwise, the number of
+        fractional bits of the fixed-point coefficients, and inputs must
+        be integers already scaled to the internal representation.
+    bits: int
+        for fixed-point simulations, an OverflowError is raised if an
+        intermediate result does not fit into bits+1 signed bits.
+    """
+    def __init__(self, coefficients, shift=None, bits=None):
+        coefficients = np.array(coefficients, dtype=float).reshape(-1, 6)
+        self.shift = shift
+        self.bits = bits
+        self._skip = 2
+        if shift is None:
+            self._b = coefficients[:, :2]
+            self._a = np.concatenate([np.ones((len(coefficients), 1)),
+                                      coefficients[:, 4:]], axis=1)
+            self._zi = np.zeros((len(coefficients), 2))
+        else:
+            coefficients = np.asarray(coefficients * 2 ** shift,
+                                      dtype=np.int64)
+            self._b = coefficients[:, :2].T.reshape(2, -1, 1)
+            self._minus_a = -coefficients[:, 4:].T
+            self._x_prev = 0
+            self._y = np.zeros((2, len(coefficients)), dtype=np.int64)
+
+    def process(self, xs):
+        """
+        Returns the filter output for the next block xs of input data.
+        """
+        xs = np.asarray(xs)
+        ys = np.zeros(len(xs), dtype=float if self.shift is None
+                      else np.int64)
+        if self._skip:
+            n = min(self._skip, len(xs))
+            self._skip -= n
+            if n > 0:
+                self._start(xs[n - 1])
+            xs, out = xs[n:], ys[n:]
+        else:
+            out = ys
+        if len(xs) > 0:
+            if self.shift is None:
+                self._process_float(xs, out)
+            else:
+                self._process_int(xs, out)
+        return ys
+
+    def _start(self, x_prev):
+        """ initializes the state with the last skipped input sample """
+        if self.shift is None:
+            for i, (b, a) in enumerate(zip(self._b, self._a)):
+                self._zi[i] = sig.lfiltic(b, a, [0., 0.], [x_prev])
+        else:
+            self._x_prev = x_prev
+
+    def _process_float(self, xs, out):
+        for i, (b, a) in enumerate(zip(self._b, self._a)):
+            y, self._zi[i] = sig.lfilter(b, a, xs, zi=self._zi[i])
+            out += y
+
+    def _check(self, values):
+        if len(values) == 0:
+            return
+        if values.max() > 2 ** self.bits - 1:
+            raise OverflowError("Overflow in biquad simulation with %s > %s"
+                                % (values.max(), 2 ** self.bits - 1))
+        if values.min() < -2 ** self.bits:
+            raise OverflowError("Overflow in biquad simulation with %s < %s"
+                                % (values.min(), -2 ** self.bits))
+
+    def _process_int(self, xs, out):
+        d = 2 ** self.shift
+        xs = np.asarray(xs, dtype=np.int64)
+        # the feed-forward products do not depend on the filter state and
+        # are computed for the whole block and all biquads at once
+        x_prev = np.concatenate([[self._x_prev], xs[:-1]])
+        p_bx0 = (self._b[0] * xs) // d
+        p_bx1 = (self._b[1] * x_prev) // d
+        self._check(p_bx0)
+        self._check(p_bx1)
+        ff = (p_bx0 + p_bx1).T
+        ys = np.empty_like(ff)
+        p_ay1, p_ay2 = np.empty_like(ff), np.empty_like(ff)
+        minus_a1, minus_a2 = self._minus_a
+        y1, y2 = self._y
+        # the feedback is computed sample by sample, for all biquads at once
+        for n in range(len(xs)):
+            p_ay1[n] = (minus_a1 * y1) // d
+            p_ay2[n] = (minus_a2 * y2) // d
+            y = ff[n] + p_ay1[n] + p_ay2[n]
+            ys[n] = y
+            y2 = y1
+            y1 = y
+        self._check(p_ay1)
+        self._check(p_ay2)
+        self._check(ys)
+        self._y = np.array([y1, y2])
+        self._x_prev = xs[-1]
+        out += ys.sum(axis=1)
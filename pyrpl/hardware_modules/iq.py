@@ -421,6 +421,22 @@ class Iq(FilterModule):
             attempt += 1
             if attempt > 10:
                 raise Exception("Trying to recover NA data while averaging is not finished. Some setting is wrong. ")
+        return self._nadata_from_raw(a, b, c, d)
+
+    async def _nadata_total_async(self):
+        """ same as _nadata_total without blocking the event loop """
+        attempt = 0
+        a, b, c, d = await self._reads_async(0x140, 4)
+        while not ((a >> 31 == 0) and (b >> 31 == 0)
+                   and (c >> 31 == 0) and (d >> 31 == 0)):
+            a, b, c, d = await self._reads_async(0x140, 4)
+            self._logger.warning('NA data not ready yet. Try again!')
+            attempt += 1
+            if attempt > 10:
+                raise Exception("Trying to recover NA data while averaging is not finished. Some setting is wrong. ")
+        return self._nadata_from_raw(a, b, c, d)
+
+    def _nadata_from_raw(self, a, b, c, d):
         sum = np.complex128(self._to_pyint(int(a) + (int(b) << 31), bitlength=62)) \
               + np.complex128(self._to_pyint(int(c) + (int(d) << 31), bitlength=62)) * 1j
         return sum
@@ -59,9 +59,7 @@ class segmentedFunction(ArrayRegister):
 		return (s,q,m)
 			
 	def get_value(self, obj):    
-		s = self.edgePoints.get_value(obj)
-		q = self.q.get_value(obj)
-		m = self.m.get_value(obj)
+		s, q, m = super().get_value(obj) # a single read of all segments
 		try:#remove all the "-1"s at the end of the list
 			listEnd = len(s) - next(i for i, x in enumerate(reversed(s)) if x != -1)
 		except:#all the s points are on -1 => only the first one is actually used
@@ -85,9 +83,7 @@ class segmentedFunction(ArrayRegister):
 		q = np.append(q,[0] * (self.nOfSegments - len(m)))
 		m = np.append(m,[0] * (self.nOfSegments - len(m)))
 
-		self.edgePoints.set_value(obj, s)
-		self.q.set_value(obj, q)
-		self.m.set_value(obj, m)    
+		super().set_value(obj, [s, q, m]) # edgePoints and q share the same words: all are written in a single transaction
 		obj._emit_signal_by_name("updateRampCurve")
  
 
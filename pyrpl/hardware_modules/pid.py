@@ -158,7 +158,14 @@ class IValAttribute(FloatProperty):
 	"""
 	_widget_class = ResettableFloatAttributeWidget
 	def get_value(self, obj):
-		return float(obj._to_pyint(obj._read(0x100), bitlength=16))\
+		return self.words_to_python(obj, [obj._read(0x100)])
+
+	def words(self, obj):
+		"""(absolute address, bitmask) of the integrator word"""
+		return [(obj._absolute_address(0x100), 0xFFFF)]
+
+	def words_to_python(self, obj, words):
+		return float(obj._to_pyint(int(words[0]), bitlength=16))\
 			   / 2 ** 13
 		# bitlength used to be 32 until 16/7/2016
 		# still, FPGA has an asymmetric representation for reading and writing
@@ -1,4 +1,4 @@
-from ..attributes import BaseProperty, DynamicInstanceProperty, extractPropertiesFromSubModules, IntRegister, IntProperty, ArrayRegister, FloatRegister, FloatProperty, SelectRegister, IORegister, BoolProperty, BoolRegister, GainRegister, digitalPinRegister, ExpandableProperty, ArrayProperty, dualProperty
+from ..attributes import RegisterLayout, BaseProperty, DynamicInstanceProperty, extractPropertiesFromSubModules, IntRegister, IntProperty, ArrayRegister, FloatRegister, FloatProperty, SelectRegister, IORegister, BoolProperty, BoolRegister, GainRegister, digitalPinRegister, ExpandableProperty, ArrayProperty, dualProperty
 
 from ..widgets.module_widgets.ramp_widget import rampWidget, segmentWidget
 import numpy as np
@@ -37,6 +37,8 @@ class rampFunction(ArrayRegister):
 								doc="duration of the ramp")
 		super().__init__(registers=[self.DVs, self.DTs])
 		self.len = 2
+		# startPoint and all segments, read and written in a single request
+		self.segmentsLayout = RegisterLayout([self.startPoint, self.DVs, self.DTs])
 		
 	def get_value(self, obj):
 		
@@ -47,10 +49,11 @@ class rampFunction(ArrayRegister):
 			firstUnusedIndex = len(nOfSteps)
 		'''
 		firstUnusedIndex = obj.usedRamps
-		dt = self.DTs.get_value(obj)[:firstUnusedIndex]
-		dv = self.DVs.get_value(obj)[:firstUnusedIndex]
+		startPoint, dv, dt = self.segmentsLayout.get_values(obj, self.cacheable(obj))
+		dt = dt[:firstUnusedIndex]
+		dv = dv[:firstUnusedIndex]
 		x = np.concatenate((np.zeros(1), np.cumsum(dt)))
-		y = np.cumsum(np.concatenate(([self.startPoint.get_value(obj)], dv)))
+		y = np.cumsum(np.concatenate(([startPoint], dv)))
 		return [list(x),list(y)]
 	
 	def set_value(self, obj, val):
@@ -61,9 +64,7 @@ class rampFunction(ArrayRegister):
 		times = np.array(x[1:]) - np.array(x[:-1])
 		obj.usedRamps = len(x) - 1
 
-		self.startPoint.set_value(obj, edges[0])
-		self.DVs.set_value(obj, edges[1:] - edges[:-1])
-		self.DTs.set_value(obj, times)
+		self.segmentsLayout.write(obj, [edges[0], edges[1:] - edges[:-1], times])
 		obj._emit_signal_by_name("updateRampCurve")
 
 class voltageAndInitialBitShiftProperty(FloatProperty):
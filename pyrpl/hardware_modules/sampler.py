@@ -15,6 +15,11 @@ class Sampler(HardwareModule):
         """
         computes the mean, standard deviation, min and max of the chosen signal over duration t
 
+        If the scope is idle, the signal is acquired with the shortest scope
+        trace that lasts at least t (transferred in one bulk read), of which
+        the samples during t are used. Otherwise, the signal register is
+        read repeatedly during t.
+
         Parameters
         ----------
         signal: input signal
@@ -32,6 +37,50 @@ class Sampler(HardwareModule):
             signal = signal.name
         except AttributeError:
             pass
+        samples = self._scope_samples(signal, t)
+        if samples is None:
+            return self._register_stats(signal, t)
+        return samples.mean(), samples.std(), samples.max(), samples.min()
+
+    def _scope_samples(self, signal, t):
+        """
+        Returns the samples of signal during t acquired with the scope, or
+        None if the scope is in use or cannot acquire the signal during t.
+        """
+        scope = getattr(self._rp, 'scope', None)
+        if scope is None or scope.owner is not None \
+                or scope.running_state != 'stopped' \
+                or signal not in scope.inputs:
+            return None
+        # the decimation of the shortest trace that lasts at least t. The
+        # duration is not set directly, since it snaps to its options and
+        # may change the number of points of the trace.
+        decimations = [d for d in scope.decimations
+                       if 8e-9 * d * scope.data_length >= t]
+        if not decimations:
+            return None
+        decimation = min(decimations)
+        scope.owner = self.name
+        try:
+            with scope._deferred_writes():  # configured in a single request
+                scope.input1 = signal
+                scope.average = False  # min and max of the actual samples
+                scope.trigger_source = 'immediately'
+                scope.decimation = decimation
+            trace = scope.acquire_raw_trace()
+        except TimeoutError:
+            self._logger.warning("Scope acquisition timed out. Sampling "
+                                 "signal %s with register reads instead.",
+                                 signal)
+            return None
+        finally:
+            scope.free()  # restores the previous scope settings
+        n = max(int(round(t / (8e-9 * decimation))), 1)
+        # same scaling as the signal registers
+        return trace[0][:n] / getattr(Sampler, signal).norm
+
+    def _register_stats(self, signal, t):
+        """ stats from the signal register read repeatedly during t """
         nn = 0
         cum = 0
         cumsq = 0
@@ -121,9 +121,10 @@ large an integrator gain will quickly saturate the outputs.
 """
 
 import time
+from time import sleep
 from .dsp import all_inputs, dsp_addr_base, InputSelectRegister, DspModule
 from ..acquisition_module import AcquisitionModule
-from ..async_utils import wait, ensure_future, sleep_async
+from ..async_utils import wait, ensure_future, sleep_async, run_async
 from ..pyrpl_utils import sorted_dict
 from ..attributes import *
 from ..modules import HardwareModule
@@ -137,6 +138,13 @@ logger = logging.getLogger(name=__name__)
 
 DATA_LENGTH = 2**14
 
+# lookup tables from the 14-bit codes of the data buffers to signed values
+_CODES_INT16 = np.arange(2**14, dtype=np.int16)
+_CODES_INT16[2**13:] -= 2**14
+_CODES_FLOAT = _CODES_INT16 / float(2**13)
+# buffer position of each sample of an unwrapped trace, for any start
+_BUFFER_INDEX = np.arange(2 * DATA_LENGTH) % DATA_LENGTH
+
 
 # ==========================================
 # The following properties are all linked:
@@ -274,6 +282,11 @@ class SamplingTimeProperty(SelectProperty):
 
 class Scope(HardwareModule, AcquisitionModule):
     MIN_DELAY_CONTINUOUS_ROLLING_MS = 20
+    # longest time the server waits for a trigger within one request. The
+    # server serves one request at a time, so other requests (e.g. register
+    # writes from the GUI) may be delayed by as much. Without trigger, the
+    # request returns only the status and is sent again.
+    SERVER_WAIT_TIMEOUT_S = 0.05
     addr_base = 0x40100000
     name = 'scope'
     _widget_class = ScopeWidget
@@ -318,6 +331,8 @@ class Scope(HardwareModule, AcquisitionModule):
     
     lastInputs = [None, None]
     def __init__(self, parent, name=None, index = 0):
+        # reusable output buffers of _decode_trace for raw traces
+        self._decode_buffers = {}
         super(Scope, self).__init__(parent, name=name, index = 0)
 
     def _from_raw_data_to_numbers(self,data : np.ndarray):
@@ -654,43 +669,47 @@ class Scope(HardwareModule, AcquisitionModule):
         if new is not None:
             self.stop()
 
+    @staticmethod
+    def _to_signed(raw):
+        """converts raw 14 bit buffer data into signed integers"""
+        x = np.array(raw, dtype=np.int16)
+        x[x >= 2 ** 13] -= 2 ** 14
+        return x
+
+    def _normalize_trace(self, rawdata, trigger_pointer):
+        """ acquired (normalized) data from the raw data of one channel"""
+        totalAcquisition = np.array(
+            np.roll(rawdata, - (trigger_pointer + 1)), dtype=float) / 2 ** 13
+        totalAcquisition = totalAcquisition[:self.data_length]
+        return totalAcquisition
+
     @property
     def _rawdata_ch1(self):
         """raw data from ch1"""
         # return np.array([self.to_pyint(v) for v in self._reads(0x10000,
         # self.data_length)],dtype=np.int32)
-        x = np.array(self._reads(0x10000, DATA_LENGTH), dtype=np.int16)
-        x[x >= 2 ** 13] -= 2 ** 14
-        return x
+        return self._to_signed(self._reads_packed(0x10000, DATA_LENGTH))
 
     @property
     def _rawdata_ch2(self):
         """raw data from ch2"""
         # return np.array([self.to_pyint(v) for v in self._reads(0x20000,
         # self.data_length)],dtype=np.int32)
-        x = np.array(self._reads(0x20000, DATA_LENGTH), dtype=np.int16)
-        x[x >= 2 ** 13] -= 2 ** 14
-        return x
+        return self._to_signed(self._reads_packed(0x20000, DATA_LENGTH))
 
     @property
     def _data_ch1(self):
         """ acquired (normalized) data from ch1"""
-        totalAcquisition = np.array(
-            np.roll(self._rawdata_ch1, - (self._write_pointer_trigger +
-                                          self._trigger_delay_register + 1)),
-            dtype=float) / 2 ** 13
-        totalAcquisition = totalAcquisition[:self.data_length]
-        return totalAcquisition
+        return self._normalize_trace(self._rawdata_ch1,
+                                     self._write_pointer_trigger +
+                                     self._trigger_delay_register)
 
     @property
     def _data_ch2(self):
         """ acquired (normalized) data from ch2"""
-        totalAcquisition = np.array(
-            np.roll(self._rawdata_ch2, - (self._write_pointer_trigger +
-                                          self._trigger_delay_register + 1)),
-            dtype=float) / 2 ** 13
-        totalAcquisition = totalAcquisition[:self.data_length]
-        return totalAcquisition
+        return self._normalize_trace(self._rawdata_ch2,
+                                     self._write_pointer_trigger +
+                                     self._trigger_delay_register)
 
     @property
     def _data_ch1_current(self):
@@ -739,6 +758,15 @@ class Scope(HardwareModule, AcquisitionModule):
         return (not self._trigger_armed) and \
                (not self._trigger_delay_running) and self._acquisition_started
 
+    async def curve_ready_async(self):
+        """
+        Same as curve_ready, but reads the status register only once and
+        without blocking the event loop.
+        """
+        status = await self._read_async(0x0)
+        # bit 0: _trigger_armed, bit 2: _trigger_delay_running
+        return (status & 0b101) == 0 and self._acquisition_started
+
     def _curve_acquiring(self):
         """
         Returns True if data is in the process of being acquired, i.e.
@@ -763,11 +791,135 @@ class Scope(HardwareModule, AcquisitionModule):
         self.current_avg = 0
 
 
-    def _get_trace(self):
+    def _decode_trace(self, channels, trigger_pointer, raw=False):
         """
-        Simply pack together channel 1 and channel 2 curves in a numpy array
+        Decodes the raw buffers of both channels into a (2, data_length)
+        array: float in units of volts, or the signed int16 values if raw is
+        True. The int16 array is reused by the next call with raw=True,
+        whereas float traces are new arrays, since they are kept as
+        lastData and read from other threads.
         """
-        return np.array((self._get_ch(1), self._get_ch(2)))
+        table = _CODES_INT16 if raw else _CODES_FLOAT
+        n = self.data_length
+        if raw:
+            buffers = self._decode_buffers
+            if 'raw' not in buffers or buffers['raw'].shape[1] != n:
+                buffers['raw'] = np.empty((2, n), dtype=np.int16)
+                buffers['codes'] = np.empty(n, dtype=np.uint16)
+            trace, codes = buffers['raw'], buffers['codes']
+        else:
+            trace = np.empty((2, n), dtype=table.dtype)
+            codes = np.empty(n, dtype=np.uint16)
+        start = (trigger_pointer + 1) % DATA_LENGTH
+        index = _BUFFER_INDEX[start:start + n]
+        for ch, out in zip(channels, trace):
+            np.take(np.asarray(ch, dtype=np.uint16), index, out=codes)
+            np.bitwise_and(codes, 2**14 - 1, out=codes)
+            np.take(table, codes, out=out)
+        return trace
+
+    def _get_trace(self, raw=False):
+        """
+        Transfers pointers and both channel buffers in one request and
+        decodes them (see _decode_trace).
+        """
+        pointers, ch1, ch2 = self._transact(self._trace_operations(0)[1:])
+        trigger_pointer = int(pointers[0]) + int(pointers[3])
+        return self._decode_trace((ch1, ch2), trigger_pointer, raw)
+
+    def raw_trace(self):
+        """
+        Returns the acquired data of both channels as an int16 array of
+        shape (2, data_length), where 2**13 corresponds to 1 V. Avoids
+        the conversion to float, e.g. for averaging or FFTs downstream.
+        The returned array is overwritten by the next call.
+        """
+        return self._get_trace(raw=True)
+
+    def acquire_raw_trace(self, timeout=1.0):
+        """
+        Acquires one trace with the current settings and returns it like
+        raw_trace. Blocks without using the event loop, such that it can
+        be called from synchronous code (e.g. Sampler.stats). The module
+        should be owned by the caller to avoid interference with running
+        acquisitions.
+
+        Raises a TimeoutError if the trace is not ready timeout seconds
+        after the expected end of the acquisition.
+        """
+        self._start_trace_acquisition()
+        sleep(max(self._remaining_time(), 0))
+        deadline = time() + timeout
+        operations = self._trace_operations(self.SERVER_WAIT_TIMEOUT_S)
+        if not getattr(self._client, '_batch_supported', False):
+            # no waiting on the server: poll the status without the buffers
+            while not self.curve_ready():
+                if time() > deadline:
+                    raise TimeoutError("Scope trace was not ready after "
+                                       "%.1f s." % (self.duration + timeout))
+            return self.raw_trace()
+        status, pointers, ch1, ch2 = self._transact(operations)
+        while self._trace_missing(status, pointers):
+            if time() > deadline:
+                raise TimeoutError("Scope trace was not ready after %.1f s."
+                                   % (self.duration + timeout))
+            status, pointers, ch1, ch2 = self._transact(operations)
+        trigger_pointer = int(pointers[0]) + int(pointers[3])
+        return self._decode_trace((ch1, ch2), trigger_pointer, raw=True)
+
+    async def _get_trace_async(self):
+        """
+        Same as _get_trace, with pointers and both (packed) channel buffers
+        transferred in a single request.
+        """
+        # trigger delay (0x10), write pointer at trigger (0x1C) and the
+        # two channel buffers
+        pointers, ch1, ch2 = await self._transact_async(
+            self._trace_operations(0)[1:])
+        trigger_pointer = int(pointers[0]) + int(pointers[3])
+        return await run_async(self._executor, self._decode_trace,
+                               (ch1, ch2), trigger_pointer)
+
+    def _trace_operations(self, wait_timeout):
+        """
+        Client operations that wait for the end of the acquisition on the
+        server side (the first one) and that transfer trigger delay,
+        pointers and both channel buffers (the others). If the wait times
+        out, the server skips the transfer and only returns the status.
+        """
+        return [('q', 0x0, 0b101, wait_timeout),  # armed or delay running
+                ('r', 0x10, 4),
+                ('p', 0x10000, DATA_LENGTH),
+                ('p', 0x20000, DATA_LENGTH)]
+
+    @staticmethod
+    def _trace_missing(status, pointers):
+        """
+        True if the request of _trace_operations has not returned the trace
+        (older servers transfer the buffers anyway).
+        """
+        return pointers is None or int(status[0]) & 0b101
+
+    async def _trace_async(self, min_delay_s):
+        """
+        Launches the acquisition for one trace. If the server supports it,
+        the end of the acquisition is awaited on the server side and the
+        data are transferred in the same request. The request is only sent
+        again if no trigger has occurred within SERVER_WAIT_TIMEOUT_S.
+        """
+        if not getattr(self._client, '_batch_supported', False):
+            return await super(Scope, self)._trace_async(min_delay_s)
+        self._start_trace_acquisition()
+        await sleep_async(max(self._remaining_time(), min_delay_s))
+        operations = self._trace_operations(self.SERVER_WAIT_TIMEOUT_S)
+        status, pointers, ch1, ch2 = await self._transact_async(operations)
+        while self._trace_missing(status, pointers):
+            status, pointers, ch1, ch2 = await self._transact_async(operations)
+        trigger_pointer = int(pointers[0]) + int(pointers[3])
+        AcquisitionModule.lastData = self._from_raw_data_to_numbers(
+            await run_async(self._executor, self._decode_trace,
+                            (ch1, ch2), trigger_pointer))
+        return AcquisitionModule.lastData
 
     def _remaining_time(self):
         """
@@ -782,7 +934,8 @@ class Scope(HardwareModule, AcquisitionModule):
             self._start_acquisition_rolling_mode()
             while(self.running_state=="running_continuous"):
                 await sleep_async(self.MIN_DELAY_CONTINUOUS_ROLLING_MS*0.001)
-                self.data_x, self.data_avg = self._get_rolling_curve()
+                self.data_x, self.data_avg = await run_async(
+                    self._executor, self._get_rolling_curve)
                 self._emit_signal_by_name('display_curve', [self.data_x, self.data_avg])
 
     def _data_ready(self):
@@ -791,6 +944,9 @@ class Scope(HardwareModule, AcquisitionModule):
         """
         return self.curve_ready()
 
+    async def _data_ready_poll_async(self):
+        return await self.curve_ready_async()
+
     def _start_trace_acquisition(self):
         """
         Start acquisition of a curve in rolling_mode=False
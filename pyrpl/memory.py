@@ -17,6 +17,10 @@
 ###############################################################################
 
 import os
+import atexit
+import pickle
+import struct
+import weakref
 from collections import OrderedDict
 from shutil import copyfile
 import numpy as np
@@ -69,7 +73,9 @@ except:
 
     # ordered load and dump for yaml files. From
     # http://stackoverflow.com/questions/5121931/in-python-how-can-you-load-yaml-mappings-as-ordereddicts
-    def load(stream, Loader=yaml.SafeLoader, object_pairs_hook=OrderedDict):
+    # the libyaml-based loader is much faster than the pure python one
+    def load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader),
+             object_pairs_hook=OrderedDict):
         class OrderedLoader(Loader):
             pass
         def construct_mapping(loader, node):
@@ -243,6 +249,7 @@ class MemoryBranch(object):
         logger.warning("You are directly modifying the data of MemoryBranch"
                        " %s to %s.", self._fullbranchname, str(value))
         self._parent._data[self._branch] = value
+        self._root._record('set', self._path, value)
 
     def _keys(self):
         if isinstance(self._data, list):
@@ -254,6 +261,8 @@ class MemoryBranch(object):
         if isinstance(self._data, list):
             raise NotImplementedError
         self._data.update(new_dict)
+        for k in new_dict:
+            self._root._record('set', self._path + [k], self._data[k])
         self._save()
         # keep auto_completion up to date
         for k in new_dict:
@@ -299,6 +308,22 @@ class MemoryBranch(object):
         if the value of this entry is of type dict, it becomes a MemoryBranch
         new values can be added to the branch in the same manner
         """
+        # the journal only needs the final value, not each nested assignment
+        root = self._root
+        root._journal_suppressed += 1
+        try:
+            self._set_value(item, value)
+        finally:
+            root._journal_suppressed -= 1
+        root._record('set', self._path + [item], self._data[item])
+        if self._root._WARNING_ON_SAVE or self._root._ERROR_ON_SAVE:
+            logger.warning("Issuing call to MemoryTree._save after %s.%s=%s",
+                           self._branch, item, value)
+        self._save()
+        # update the __dict__ for autocompletion
+        self.__dict__[item] = None
+
+    def _set_value(self, item, value):
         # if the subbranch is set or replaced, to this in a specific way
         if isbranch(value):
             # naive way: self._data[item] = dict(value)
@@ -320,12 +345,6 @@ class MemoryBranch(object):
         #otherwise just write to the data dictionary
         else:
             self._set_data(item, value)
-        if self._root._WARNING_ON_SAVE or self._root._ERROR_ON_SAVE:
-            logger.warning("Issuing call to MemoryTree._save after %s.%s=%s",
-                           self._branch, item, value)
-        self._save()
-        # update the __dict__ for autocompletion
-        self.__dict__[item] = None
 
     def _set_data(self, item, value):
         """
@@ -343,6 +362,7 @@ class MemoryBranch(object):
         remove an item from the branch
         """
         value = self._data.pop(name)
+        self._root._record('pop', self._path + [name])
         if name in self.__dict__.keys():
             self.__dict__.pop(name)
         self._save()
@@ -366,6 +386,7 @@ class MemoryBranch(object):
             if name == 0 and len(self) == 0:
                 # instantiate a new list - odd way because we must
                 self._parent._data[self._branch] = []
+                self._root._record('set', self._path, [])
             # if index <= len, creation is done automatically if needed
             # otherwise an error is raised
             if name >= len(self):
@@ -399,6 +420,16 @@ class MemoryBranch(object):
             parent = parent._parent
         return parent
 
+    @property
+    def _path(self):
+        """ list of the keys from root to the branch """
+        path = []
+        branch = self
+        while branch != branch._parent:
+            path.insert(0, branch._branch)
+            branch = branch._parent
+        return path
+
     @property
     def _fullbranchname(self):
         parent = self._parent
@@ -429,6 +460,7 @@ class MemoryBranch(object):
         """
         branch = load(yml_content)
         self._parent._data[self._branch] = branch
+        self._root._record('set', self._path, branch)
         self._save()
 
     def __len__(self):
@@ -483,6 +515,17 @@ class MemoryTree(MemoryBranch):
     # is called to reload it.
 
     ##### internal save logic:
+    # in journal mode (_journal=True), each change is appended as a small
+    # record to the file _filename + '.journal' and the full config file is
+    # only rewritten ("compacted") after _JOURNAL_COMPACTION_TIME, when the
+    # journal exceeds _JOURNAL_MAX_SIZE, or at exit. The first record of the
+    # journal identifies the version (size and mtime) of the config file it
+    # applies to, such that a journal that is already contained in the
+    # config file (crash during compaction) or that belongs to an
+    # externally modified file is ignored upon _load. When _reload finds an
+    # externally modified file while the journal holds changes that are not
+    # yet compacted, these changes are replayed on top of the new file
+    # content, which is then compacted.
 
     # this structure will hold the data. Must define it here as immutable
     # to overwrite the property _data of MemoryBranch
@@ -493,7 +536,11 @@ class MemoryTree(MemoryBranch):
     _ERROR_ON_SAVE = False # Set this flag to true to raise
         # Exceptions upon save
 
-    def __init__(self, filename=None, source=None, _loadsavedeadtime=3.0):
+    _JOURNAL_COMPACTION_TIME = 60.0  # max. delay before compaction in s
+    _JOURNAL_MAX_SIZE = 1000000  # journal size in bytes that forces compaction
+
+    def __init__(self, filename=None, source=None, _loadsavedeadtime=3.0,
+                 _journal=False):
         # never reload or save more frequently than _loadsavedeadtime because
         # this is the principal cause of slowing down the code (typ. 30-200 ms)
         # for immediate saving, call _save_now, for immediate loading _load_now
@@ -504,10 +551,24 @@ class MemoryTree(MemoryBranch):
             # to simulate a config file, only store data in memory
             self._filename = filename
             self._data = OrderedDict()
+        self._journal = _journal and self._filename is not None
+        self._journal_file = None
+        self._journal_size = 0
+        self._journal_suppressed = 0
+        self._journal_dirty = False  # changes not yet in the config file
+        # version of the config file that is written but not yet snapshotted
+        self._snapshot_pending = None
         self._lastsave = time()
         # create a timer to postpone to frequent savings
         self._savetimer = QtCore.QTimer()
-        self._savetimer.setInterval(int(self._loadsavedeadtime*1000))
+        if self._journal:
+            self._savetimer.setInterval(int(max(
+                self._loadsavedeadtime, self._JOURNAL_COMPACTION_TIME)*1000))
+            atexit.register(_compact_at_exit, weakref.ref(self))
+        else:
+            self._savetimer.setInterval(int(self._loadsavedeadtime*1000))
+            if self._filename is not None:
+                atexit.register(_snapshot_at_exit, weakref.ref(self))
         self._savetimer.setSingleShot(True)
         self._savetimer.timeout.connect(self._write_to_file)
         self._load()
@@ -524,15 +585,22 @@ class MemoryTree(MemoryBranch):
         """ makes a temporary file to ensure modification of config file is atomic (double-buffering like operation...)"""
         return self._filename + '.tmp'
 
-    def _load(self):
-        """ loads data from file """
+    def _load(self, rebase_journal=False):
+        """
+        loads data from file. With rebase_journal, the journal is replayed
+        even if it was written for another version of the file.
+        """
         if self._filename is None:
             # if no file is used, just ignore this call
             return
         logger.debug("Loading config file %s", self._filename)
-        # read file from disc
-        with open(self._filename) as f:
-            self._data = load(f)
+        # read file from disc, or from the snapshot of the same file version
+        signature = self._file_signature()
+        self._data = self._load_snapshot(signature)
+        if self._data is None:
+            with open(self._filename) as f:
+                self._data = load(f)
+            self._save_snapshot(signature)
         # store the modification time of this file version
         self._mtime = os.path.getmtime(self._filename)
         # make sure that reload timeout starts from this moment
@@ -540,6 +608,8 @@ class MemoryTree(MemoryBranch):
         # empty file gives _data=None
         if self._data is None:
             self._data = OrderedDict()
+        if self._journal:
+            self._replay_journal(rebase_journal)
         # update dict of the MemoryTree object
         to_remove = []
         # remove all obsolete entries
@@ -566,7 +636,8 @@ class MemoryTree(MemoryBranch):
             if self._mtime != os.path.getmtime(self._filename):
                 logger.debug("Loading because mtime %s != filetime %s",
                              self._mtime)
-                self._load()
+                # keep the changes of this session that are only journaled
+                self._load(rebase_journal=self._journal_dirty)
             else:
                 logger.debug("... no reloading required")
 
@@ -608,6 +679,16 @@ class MemoryTree(MemoryBranch):
                 raise
             # save last modification time of the file
             self._mtime = os.path.getmtime(self._filename)
+            if self._journal:
+                # compaction, the snapshot is refreshed along with the file
+                self._save_snapshot(self._file_signature())
+                # the journal is now contained in the file
+                self._new_journal()
+                self._journal_dirty = False
+            else:
+                # pickling the tree on each save would slow it down, the
+                # snapshot is refreshed at exit (see _snapshot_at_exit)
+                self._snapshot_pending = self._file_signature()
 
     def _save(self, deadtime=None):
         """
@@ -623,8 +704,16 @@ class MemoryTree(MemoryBranch):
             logger.warning("Save counter has just been increased to %d.",
                            self._save_counter)
         self._save_counter += 1  # for unittest and debug purposes
+        self._snapshot_pending = None  # the data differs from the file
         if deadtime is None:
             deadtime = self._loadsavedeadtime
+        if self._journal and deadtime > 0:
+            # the change is already safe in the journal, compact later
+            if self._journal_size > self._JOURNAL_MAX_SIZE:
+                self._write_to_file()
+            elif not self._savetimer.isActive():
+                self._savetimer.start()
+            return
         # now write current tree structure and data to file
         if self._lastsave + deadtime < time():
             self._write_to_file()
@@ -633,9 +722,179 @@ class MemoryTree(MemoryBranch):
             if not self._savetimer.isActive():
                 self._savetimer.start()
 
+    @property
+    def _snapshot_filename(self):
+        return self._filename + '.cache'
+
+    def _load_snapshot(self, signature):
+        """
+        returns the data of the binary snapshot of the config file if the
+        snapshot was made from the file version with signature, else None
+        """
+        try:
+            with open(self._snapshot_filename, 'rb') as f:
+                snapshot_signature, data = pickle.load(f)
+        except Exception:  # missing, outdated format or corrupted snapshot
+            return None
+        if snapshot_signature != signature:
+            return None
+        return data
+
+    def _save_snapshot(self, signature):
+        """ writes a binary snapshot of the data for faster loading """
+        try:
+            with open(self._snapshot_filename + '.tmp', 'wb') as f:
+                pickle.dump((signature, self._data), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(self._snapshot_filename + '.tmp',
+                       self._snapshot_filename)
+        except Exception as e:  # the snapshot is only an optimization
+            logger.debug("Could not write snapshot %s: %s",
+                         self._snapshot_filename, e)
+
+    @property
+    def _journal_filename(self):
+        return self._filename + '.journal'
+
+    def _file_signature(self):
+        """ identifies the current version of the config file """
+        stat = os.stat(self._filename)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _read_journal(self, rebase=False):
+        """
+        returns the records of the journal if it applies to the current
+        version of the config file (or to any version if rebase), otherwise
+        an empty list
+        """
+        records = []
+        try:
+            with open(self._journal_filename, 'rb') as f:
+                while True:
+                    header = f.read(4)
+                    if len(header) < 4:
+                        break
+                    length, = struct.unpack('<I', header)
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        break  # incomplete last record, e.g. after a crash
+                    records.append(pickle.loads(payload))
+        except (IOError, pickle.UnpicklingError, EOFError):
+            pass
+        if not records or records[0][0] != 'base':
+            return []
+        if not rebase and records[0] != ('base', self._file_signature()):
+            if len(records) > 1:
+                logger.warning("Ignoring %d changes in journal %s because "
+                               "the config file has changed in the meantime.",
+                               len(records) - 1, self._journal_filename)
+            return []
+        return records[1:]
+
+    def _replay_journal(self, rebase=False):
+        """
+        applies the journal to the freshly loaded data. With rebase, the
+        journal of another file version is applied and the result is
+        written to the file right away.
+        """
+        records = self._read_journal(rebase)
+        for op, path, value in records:
+            try:
+                data = self._data
+                for key in path[:-1]:
+                    data = data[key]
+                if op == 'pop':
+                    data.pop(path[-1])
+                elif isinstance(data, list) and path[-1] == len(data):
+                    data.append(value)
+                else:
+                    data[path[-1]] = value
+            except (KeyError, IndexError, TypeError):
+                logger.warning("Could not replay change %s of %s from the "
+                               "journal %s.", op, path, self._journal_filename)
+        if records and rebase:
+            logger.info("Replayed %d changes from journal %s on top of the "
+                        "modified config file. ", len(records),
+                        self._journal_filename)
+            # the journal cannot describe changes to the new file version
+            self._write_to_file()
+        elif records:
+            logger.debug("Replayed %d changes from journal %s. ",
+                         len(records), self._journal_filename)
+            self._open_journal()
+            # the replayed changes are not yet contained in the config file
+            self._journal_dirty = True
+            if not self._savetimer.isActive():
+                self._savetimer.start()
+        else:
+            self._new_journal()
+
+    def _open_journal(self):
+        self._close_journal()
+        self._journal_file = open(self._journal_filename, 'ab')
+        self._journal_size = self._journal_file.tell()
+
+    def _close_journal(self):
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def _new_journal(self):
+        """ replaces the journal by an empty one for the current file """
+        self._close_journal()
+        payload = pickle.dumps(('base', self._file_signature()))
+        with open(self._journal_filename + '.tmp', 'wb') as f:
+            f.write(struct.pack('<I', len(payload)) + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self._journal_filename + '.tmp', self._journal_filename)
+        self._open_journal()
+
+    def _record(self, op, path, value=None):
+        """ appends a change of the data to the journal """
+        if not self._journal or self._journal_suppressed:
+            return
+        payload = pickle.dumps((op, path, value),
+                               protocol=pickle.HIGHEST_PROTOCOL)
+        self._journal_file.write(struct.pack('<I', len(payload)) + payload)
+        self._journal_file.flush()
+        _fdatasync(self._journal_file.fileno())
+        self._journal_size += len(payload) + 4
+        self._journal_dirty = True
+
     @property
     def _filename_stripped(self):
         try:
             return os.path.split(self._filename)[1].split('.')[0]
         except:
             return 'default'
+
+
+# fdatasync does not update the file metadata and is therefore cheaper
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+def _snapshot_at_exit(tree_ref):
+    """
+    refreshes the snapshot of a still existing MemoryTree if its data is the
+    last version that it wrote to its file
+    """
+    tree = tree_ref()
+    if tree is None or tree._snapshot_pending is None:
+        return
+    try:
+        if tree._file_signature() == tree._snapshot_pending:
+            tree._save_snapshot(tree._snapshot_pending)
+    except OSError:  # the file was removed in the meantime
+        pass
+
+
+def _compact_at_exit(tree_ref):
+    """ writes the journal of a still existing MemoryTree to its file """
+    tree = tree_ref()
+    if tree is not None and tree._journal_dirty:
+        try:
+            tree._write_to_file()
+        except Exception as e:  # the journal is replayed upon next start
+            logger.warning("Could not compact the journal of config file "
+                           "%s at exit: %s", tree._filename, e)
@@ -15,16 +15,18 @@ their attributes in the GUI having their state load and saved in the config
 file.
 """
 
-from .attributes import BaseAttribute, ModuleAttribute
+from .attributes import BaseAttribute, BaseRegister, ModuleAttribute
 from .widgets.module_widgets import ModuleWidget
 from .curvedb import CurveDB
 from .pyrpl_utils import unique_list, DuplicateFilter
 
 from .errors import ExpectedPyrplError
+from .async_utils import run_async
 
 import logging
 import string
 import numpy as np
+from contextlib import nullcontext
 from six import with_metaclass
 from collections import OrderedDict
 from qtpy import QtCore
@@ -158,18 +160,21 @@ class ModuleMetaClass(type):
             def setup(self, **kwds):
                 self._setup_ongoing = True
                 try:
-                    # user can redefine any setup_attribute through kwds
-                    for key in self._setup_attributes:
-                        if key in kwds:
-                            value = kwds.pop(key)
-                            setattr(self, key, value)
-                    if len(kwds) > 0:
-                        self._logger.warning(
-                            "Trying to load attribute %s of module %s that "
-                            "are invalid setup_attributes.",
-                            sorted(kwds.keys())[0], self.name)
-                    if hasattr(self, '_setup'):
-                        self._setup()
+                    # hardware writes are sent in as few transactions as
+                    # possible
+                    with self._deferred_writes():
+                        # user can redefine any setup_attribute through kwds
+                        for key in self._setup_attributes:
+                            if key in kwds:
+                                value = kwds.pop(key)
+                                setattr(self, key, value)
+                        if len(kwds) > 0:
+                            self._logger.warning(
+                                "Trying to load attribute %s of module %s that "
+                                "are invalid setup_attributes.",
+                                sorted(kwds.keys())[0], self.name)
+                        if hasattr(self, '_setup'):
+                            self._setup()
                 finally:
                     self._setup_ongoing = False
             # b. place the new setup function in the module class
@@ -647,6 +652,14 @@ class Module(with_metaclass(ModuleMetaClass, object)):
         """
         pass
 
+    def _deferred_writes(self):
+        """
+        Returns a context manager that delays the hardware writes of the
+        module until the end of the with-block. Only HardwareModules
+        actually delay their writes.
+        """
+        return nullcontext()
+
     # def help(self, register=''):
     #     """returns the docstring of the specified register name
     #        if register is an empty string, all available docstrings are
@@ -768,6 +781,7 @@ class HardwareModule(Module):
         self._addr_base = self.addr_base
         self._index = index
         self._rp = parent
+        self._declare_volatile_registers()
         super(HardwareModule, self).__init__(parent, name=name)
         #self.__doc__ = "Available registers: \r\n\r\n" + self.help()
 
@@ -781,6 +795,14 @@ class HardwareModule(Module):
         """
         pass
 
+    @property
+    def _executor(self):
+        """
+        AcquisitionExecutor of the RedPitaya, or None if blocking transfers
+        are to be executed directly.
+        """
+        return getattr(self._rp, 'acquisition_executor', None)
+
     @property
     def _frequency_correction(self):
         """
@@ -794,23 +816,154 @@ class HardwareModule(Module):
                                  "'frequency_correction'. ", self.name)
             return 1.0
 
+    @property
+    def _shadow(self):
+        """ register values known from previous reads and writes """
+        return self._client.shadow
+
+    def _invalidate_shadow(self):
+        """
+        Forgets all register values known on the host, such that the next
+        read of each register goes to the FPGA again.
+        """
+        with self._client.lock:
+            self._shadow.clear()
+
+    def _declare_volatile_registers(self):
+        """ declares the bits of all registers that may not be cached """
+        for cls in type(self).__mro__:
+            for attr in cls.__dict__.values():
+                if isinstance(attr, BaseRegister) and not attr.cacheable(self):
+                    for addr, mask in attr.words(self):
+                        self._shadow.declare_volatile(addr, mask)
+
+    def _absolute_address(self, addr, addAddressBase = True):
+        if addAddressBase:
+            return self._addr_base + addr
+        return addr
+
     def _reads(self, addr, length, addAddressBase = True):
         if addAddressBase:
             return self._client.reads(self._addr_base + addr, length)
         return self._client.reads(addr, length)
 
     def _writes(self, addr, values, addAddressBase = True):
-        if addAddressBase:
-            self._client.writes(self._addr_base + addr, values)
-        else:
+        addr = self._absolute_address(addr, addAddressBase)
+        with self._client.lock:
             self._client.writes(addr, values)
+            self._shadow.updates(addr, values)
 
     def _read(self, addr, addAddressBase = True):
         return int(self._reads(addr, 1, addAddressBase)[0])
 
+    def _read_cached(self, addr, mask = 0xFFFFFFFF, addAddressBase = True):
+        """
+        Same as _read, but returns the word from the register shadow if all
+        bits in mask are known from previous reads and writes.
+        """
+        abs_addr = self._absolute_address(addr, addAddressBase)
+        # the lock of the client keeps writes of other threads from
+        # happening between the read and the update of the shadow
+        with self._client.lock:
+            value = self._shadow.get(abs_addr, mask)
+            if value is None:
+                value = self._read(addr, addAddressBase)
+                self._shadow.update(abs_addr, value)
+        return value
+
+    def _reads_packed(self, addr, length, addAddressBase = True):
+        """ reads the lower 16 bits of length words as np.uint16 """
+        return self._transact([('p', addr, length)], addAddressBase)[0]
+
+    def _writes_packed(self, addr, values, addAddressBase = True):
+        """ writes values of at most 16 bits, transferring half the data """
+        self._transact([('u', addr, values)], addAddressBase)
+
+    async def _reads_async(self, addr, length, addAddressBase = True):
+        """
+        Same as _reads, but does not block the event loop if the client
+        supports asynchronous requests.
+        """
+        if addAddressBase:
+            addr += self._addr_base
+        try:
+            reads_async = self._client.reads_async
+        except AttributeError:  # synchronous client: read in worker thread
+            return await run_async(self._executor, self._client.reads,
+                                   addr, length)
+        return await reads_async(addr, length)
+
+    async def _read_async(self, addr, addAddressBase = True):
+        return int((await self._reads_async(addr, 1, addAddressBase))[0])
+
     def _write(self, addr, value, addAddressBase = True):
         self._writes(addr, [int(value)], addAddressBase)
 
+    def _write_masked(self, addr, value, mask, addAddressBase = True):
+        """
+        writes only the bits of value that are set in mask
+
+        If the other bits of the word are known from the register shadow,
+        the merged word is written directly, which avoids a read-back on
+        servers without support for masked writes.
+        """
+        addr = self._absolute_address(addr, addAddressBase)
+        with self._client.lock:  # no other write between merge and update
+            word = self._shadow.merge(addr, value, mask)
+            if word is None:
+                self._client.write_masked(addr, int(value), mask)
+                self._shadow.update(addr, value, mask)
+            else:
+                self._client.writes(addr, [word])
+                self._shadow.update(addr, word)
+
+    def _deferred_writes(self):
+        return self._client.deferred()
+
+    def _with_address_base(self, operations):
+        return [(op[0], op[1] + self._addr_base) + tuple(op[2:])
+                for op in operations]
+
+    def _shadow_operations(self, operations, results):
+        """
+        records the writes among client operations in the shadow, except
+        those skipped by the server (with result None)
+        """
+        with self._client.lock:
+            for op, result in zip(operations, results):
+                if result is None:
+                    continue
+                if op[0] in 'wu':
+                    self._shadow.updates(op[1], op[2])
+                elif op[0] == 'm':
+                    self._shadow.updates(op[1], op[2], op[3])
+
+    def _transact(self, operations, addAddressBase = True):
+        """ executes a list of client operations in one request """
+        if addAddressBase:
+            operations = self._with_address_base(operations)
+        with self._client.lock:
+            results = self._client.transact(operations)
+            self._shadow_operations(operations, results)
+        return results
+
+    async def _transact_async(self, operations, addAddressBase = True):
+        """
+        Same as _transact, but does not block the event loop if the client
+        supports asynchronous requests.
+        """
+        if addAddressBase:
+            operations = self._with_address_base(operations)
+        try:
+            transact_async = self._client.transact_async
+        except AttributeError:  # synchronous client: transfer in worker thread
+            # the shadow is updated in the same job, under the client lock
+            return await run_async(self._executor, self._transact,
+                                   operations, False)
+        results = await transact_async(operations)
+        self._shadow_operations(operations, results)
+        return results
+
     def _to_pyint(self, v, bitlength=14):
         v = v & (2 ** bitlength - 1)
         if v >> (bitlength - 1):
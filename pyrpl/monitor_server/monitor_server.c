@@ -44,7 +44,8 @@ The program is launched on the redpitaya with
 We allow for bidirectional data transfer. The client (python program) connects to the server, which in return accepts the connection. 
 The client sends 8 bytes of data:
 Byte 1 is interpreted as a character: 'r' for read and 'w' for write, and 'c' for close. All other messages are ignored. 
-Byte 2 is reserved. 
+Byte 2 is reserved. It is echoed unchanged in the reply header, such that clients can use it as a sequence number 
+to match replies with pipelined requests. 
 Bytes 3+4 are interpreted as unsigned int. This number n is the amount of 4-byte-units to be read or written. Maximum is 2^16. 
 Bytes 5-8 are the start address to be written to. 
 
@@ -53,6 +54,31 @@ If the command is write, the server will wait for 4*n bytes of data from the ser
 If the command is close, or if the connection is broken, the server program will terminate. 
 
 After this, the server will wait for the next command. 
+
+Batch transactions:
+If byte 1 is 'b', bytes 3+4 are the length n of the request body in 4-byte-units and bytes 5-8 are the number 
+of operations m contained in the body. The server receives the 4*n bytes of the body and executes the m operations 
+in order. Each operation starts with two 4-byte-units: 
+- unit 1: byte 1 is the operation ('r' for read, 'w' for write, 'm' for masked write, 'q' for wait, 'p' for 
+  packed read, 'u' for packed write), byte 2 is reserved, bytes 3+4 are the number k of 4-byte-units to be read 
+  or written
+- unit 2: the start address of the operation
+A write operation is followed by the k units to write. A masked write operation is followed by one unit containing 
+the bitmask and by the k units to write. For masked writes, only the bits set in the bitmask are modified, 
+the other bits keep their current value. 
+A wait operation is followed by one unit containing a bitmask and one unit containing a timeout in microseconds. 
+The server polls the register at the address until all bits of the bitmask are cleared or until the timeout 
+expires. The last value read from the register (1 unit) is part of the reply. If the bits are cleared, the server 
+proceeds with the next operation. If the timeout expires, the remaining operations of the batch are skipped. 
+Packed operations transfer only the lower 16 bits of each 4-byte-unit, two of them per transmitted unit (the 
+first one in the lower half). This halves the transfer time of the 14-bit buffers of scope and asg. A packed 
+read contributes (k+1)/2 units to the reply, a packed write is followed by (k+1)/2 units, whose halves are 
+written zero-extended to the k consecutive addresses. 
+The server then sends back the 8-byte header, followed by the concatenated data of all executed read operations. 
+In the header of the reply, bytes 5-8 are the number of executed operations. It is smaller than m only if a wait 
+operation has timed out, in which case the reply ends with the value of the register of that wait operation. 
+A batch with n = 0 and m = 0 is answered with the header only, which allows the client to test whether the server 
+supports batch transactions (older servers silently ignore requests of length 0). 
 */
  
  /* for now the program is utterly unoptimized... */
@@ -73,6 +99,7 @@ After this, the server will wait for the next command.
 #include <stdint.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
+#include <time.h>
 
 void error(const char *msg);
 
@@ -88,11 +115,18 @@ void error(const char *msg);
 #define MAX_LENGTH 65535
 
 #define DEBUG_MONITOR 0
+//time between two register reads of a wait operation
+#define POLL_INTERVAL_US 10
 
 unsigned long read_value(unsigned long a_addr);
 unsigned long* read_values(unsigned long a_addr, unsigned long* a_values_buffer, unsigned long a_len);
 void write_value(unsigned long a_addr, unsigned long a_value);
 void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a_len);
+unsigned long execute_batch(unsigned long a_n_ops, unsigned long* a_body, unsigned long a_body_len, unsigned long* a_reply, unsigned long* a_n_done);
+int wait_for_clear(unsigned long a_addr, unsigned long a_mask, unsigned long a_timeout_us, unsigned long* a_value);
+
+//request body of batch transactions
+unsigned long batch_buffer[MAX_LENGTH];
 
 //FPGA memory handlers
 void* map_base = (void*)(-1);
@@ -158,6 +192,8 @@ int main(int argc, char *argv[])
      int portno;
 	 unsigned int data_length;
 	 unsigned long address;
+	 unsigned long reply_length;
+	 unsigned long n_done;
      socklen_t clilen;
 
      char data_buffer[8+sizeof(unsigned long)*MAX_LENGTH];
@@ -210,6 +246,21 @@ int main(int argc, char *argv[])
 		 data_length = buffer[2]+(buffer[3]<<8); //number of "unsigned long" to be read/written
 		 if (data_length > MAX_LENGTH)
 			 data_length = MAX_LENGTH;
+		 if (buffer[0] == 'b') { //batch of operations, address is the number of operations
+			data_length = ((unsigned char)buffer[2])+(((unsigned char)buffer[3])<<8);
+			if (data_length > 0) {
+				n = recv(newsockfd,(void*)batch_buffer,data_length*sizeof(unsigned long),MSG_WAITALL);
+				if (n < 0) error("ERROR reading from socket");
+				if (n != data_length*sizeof(unsigned long)) error("ERROR read incorrect number of bytes to socket");
+			}
+			reply_length = execute_batch(address, batch_buffer, data_length, rw_buffer, &n_done);
+			//send the header with the number of executed operations, followed by the data of all read operations
+			((unsigned long*)buffer)[1] = n_done;
+			n = send(newsockfd,(void*)data_buffer,reply_length*sizeof(unsigned long)+8,0);
+			if (n < 0) error("ERROR writing to socket");
+			if (n != reply_length*sizeof(unsigned long)+8) error("ERROR wrote incorrect number of bytes to socket");
+			continue;
+		 }
 		 if (data_length == 0)
 			continue;
 		 //test for various cases Read, Write, Close
@@ -285,3 +336,95 @@ void write_values(unsigned long a_addr, unsigned long* a_values, unsigned long a
 		close(fd);
 	}
 }
+
+//executes the operations of a batch transaction and returns the number of "unsigned long" written into a_reply
+//the number of executed operations is written to a_n_done
+unsigned long execute_batch(unsigned long a_n_ops, unsigned long* a_body, unsigned long a_body_len, unsigned long* a_reply, unsigned long* a_n_done) {
+	unsigned long pos = 0;
+	unsigned long reply_len = 0;
+	unsigned long i, k, op_len, op_addr, mask;
+	int cleared;
+	char op;
+	for (i = 0; i < a_n_ops; i++) {
+		if (pos + 2 > a_body_len) error("ERROR batch body too short - server and client out of sync");
+		op = (char)(a_body[pos] & 0xFF);
+		op_len = (a_body[pos] >> 16) & 0xFFFF;
+		op_addr = a_body[pos+1];
+		pos += 2;
+		if (op == 'r') { //read into the reply buffer
+			if (reply_len + op_len > MAX_LENGTH) error("ERROR batch reply too long");
+			if (op_len > 0)
+				read_values(op_addr, &(a_reply[reply_len]), op_len);
+			reply_len += op_len;
+		}
+		else if (op == 'w') { //write from the request body
+			if (pos + op_len > a_body_len) error("ERROR batch body too short - server and client out of sync");
+			if (op_len > 0)
+				write_values(op_addr, &(a_body[pos]), op_len);
+			pos += op_len;
+		}
+		else if (op == 'm') { //masked write, the free space of the reply buffer holds the current values
+			if (pos + 1 + op_len > a_body_len) error("ERROR batch body too short - server and client out of sync");
+			if (reply_len + op_len > MAX_LENGTH) error("ERROR batch reply too long");
+			mask = a_body[pos];
+			pos += 1;
+			if (op_len > 0) {
+				read_values(op_addr, &(a_reply[reply_len]), op_len);
+				for (k = 0; k < op_len; k++)
+					a_body[pos+k] = (a_reply[reply_len+k] & (~mask)) | (a_body[pos+k] & mask);
+				write_values(op_addr, &(a_body[pos]), op_len);
+			}
+			pos += op_len;
+		}
+		else if (op == 'q') { //wait until the masked bits are cleared, skip the remaining operations on timeout
+			if (pos + 2 > a_body_len) error("ERROR batch body too short - server and client out of sync");
+			if (reply_len + 1 > MAX_LENGTH) error("ERROR batch reply too long");
+			cleared = wait_for_clear(op_addr, a_body[pos], a_body[pos+1], &(a_reply[reply_len]));
+			pos += 2;
+			reply_len += 1;
+			if (!cleared) {
+				*a_n_done = i + 1;
+				return reply_len;
+			}
+		}
+		else if (op == 'p') { //packed read, the values are packed in place in the reply buffer
+			if (reply_len + op_len > MAX_LENGTH) error("ERROR batch reply too long");
+			if (op_len > 0) {
+				read_values(op_addr, &(a_reply[reply_len]), op_len);
+				for (k = 0; k < op_len; k += 2)
+					a_reply[reply_len + k/2] = (a_reply[reply_len+k] & 0xFFFF) |
+						((k+1 < op_len) ? ((a_reply[reply_len+k+1] & 0xFFFF) << 16) : 0);
+			}
+			reply_len += (op_len + 1) / 2;
+		}
+		else if (op == 'u') { //packed write, the free space of the reply buffer holds the unpacked values
+			if (pos + (op_len + 1) / 2 > a_body_len) error("ERROR batch body too short - server and client out of sync");
+			if (reply_len + op_len > MAX_LENGTH) error("ERROR batch reply too long");
+			if (op_len > 0) {
+				for (k = 0; k < op_len; k++)
+					a_reply[reply_len+k] = (a_body[pos + k/2] >> (16 * (k % 2))) & 0xFFFF;
+				write_values(op_addr, &(a_reply[reply_len]), op_len);
+			}
+			pos += (op_len + 1) / 2;
+		}
+		else error("ERROR unknown batch operation - server and client out of sync");
+	}
+	*a_n_done = a_n_ops;
+	return reply_len;
+}
+
+//polls the register at a_addr until the bits in a_mask are cleared or a_timeout_us has passed
+//returns 1 if the bits are cleared and 0 on timeout
+int wait_for_clear(unsigned long a_addr, unsigned long a_mask, unsigned long a_timeout_us, unsigned long* a_value) {
+	struct timespec start, now;
+	clock_gettime(CLOCK_MONOTONIC, &start);
+	while (1) {
+		read_values(a_addr, a_value, 1);
+		if ((*a_value & a_mask) == 0)
+			return 1;
+		clock_gettime(CLOCK_MONOTONIC, &now);
+		if ((now.tv_sec - start.tv_sec) * 1000000L + (now.tv_nsec - start.tv_nsec) / 1000L >= (long)a_timeout_us)
+			return 0;
+		usleep(POLL_INTERVAL_US);
+	}
+}
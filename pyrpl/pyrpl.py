@@ -153,6 +153,7 @@ from .widgets.pyrpl_widget import PyrplWidget
 from . import software_modules
 from .memory import MemoryTree
 from .redpitaya import RedPitaya
+from .device_session import DeviceSession
 from . import pyrpl_utils
 from .software_modules import get_module
 from .async_utils import sleep
@@ -281,8 +282,9 @@ class Pyrpl(object):
                 config = raw_input('\nEnter an existing or new config file name: ')
         if config is None or config == "" or config.endswith('/.yml'):
             config = None
-        # configuration is retrieved from config file
-        self.c = MemoryTree(filename=config, source=source)
+        # configuration is retrieved from config file, changes are journaled
+        # and only compacted into the config file from time to time
+        self.c = MemoryTree(filename=config, source=source, _journal=True)
         if self.c._filename is not None:
             self.logger.info("All your PyRPL settings will be saved to the "
                              "config file    %s",
@@ -369,6 +371,14 @@ class Pyrpl(object):
     @property
     def rp(self):
         return list(self.rps.values())[0]
+
+    @property
+    def session(self):
+        """
+        DeviceSession of all RedPitayas, whose requests are executed
+        concurrently.
+        """
+        return DeviceSession(self.rps.values())
         
     def show_gui(self):
         if len(self.widgets) == 0:
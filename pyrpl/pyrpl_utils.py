@@ -3,6 +3,7 @@ from timeit import default_timer
 import logging
 logger = logging.getLogger(__file__)
 from collections import OrderedDict, Counter
+import numpy as np
 
 
 def isnotebook():
@@ -177,3 +178,86 @@ class Bijection(dict):
     def update(self, *args, **kwargs):
         super(Bijection, self).update(*args, **kwargs)
         self.inverse = {v: k for k, v in self.items()}
+
+
+class TransferFunctionCache(object):
+    """ Memoizes transfer functions (or any derived arrays) by a key
+
+    The key must be a hashable object describing all settings the cached
+    value depends on. The least recently used entries are evicted once
+    more than maxsize entries are stored. Modules call clear() whenever
+    their setup attributes change. """
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+
+    def get(self, key, function):
+        """ returns the cached value for key, calling function() to compute
+        it if it is not cached """
+        try:
+            value = self._values.pop(key)
+        except KeyError:
+            value = function()
+        self._values[key] = value  # mark as most recently used
+        while len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._values.clear()
+
+
+class RingBuffer(object):
+    """ Fixed-capacity buffer of the last rows appended to a 2d array
+
+    The storage is allocated once, such that appending costs the same no
+    matter how many rows have been appended before. Rows are numbered by
+    the total count of appended rows, such that readers can ask for the
+    rows appended since their last visit (see since()). """
+
+    def __init__(self, capacity, width, dtype=float):
+        self.capacity = int(capacity)
+        self._data = np.zeros((self.capacity, int(width)), dtype=dtype)
+        self.count = 0  # total number of rows appended
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def width(self):
+        return self._data.shape[1]
+
+    def append(self, row):
+        self._data[self.count % self.capacity] = row
+        self.count += 1
+
+    def extend(self, rows):
+        rows = np.asarray(rows)
+        count = self.count + len(rows)
+        rows = rows[len(rows) - min(len(rows), self.capacity):]
+        start = (count - len(rows)) % self.capacity
+        stop = min(start + len(rows), self.capacity)
+        self._data[start:stop] = rows[:stop - start]
+        self._data[:len(rows) - (stop - start)] = rows[stop - start:]
+        self.count = count
+
+    def since(self, index):
+        """ returns a copy of the rows appended after the first index rows,
+        in chronological order. Rows that have been overwritten since are
+        skipped. """
+        index = max(index, self.count - self.capacity, 0)
+        positions = np.arange(index, self.count) % self.capacity
+        return self._data[positions]
+
+    def last(self, n):
+        """ returns a copy of the last n rows in chronological order """
+        return self.since(self.count - n)
+
+    @property
+    def data(self):
+        """ copy of all rows in the buffer, in chronological order """
+        return self.since(0)
+
+    def clear(self):
+        self.count = 0
@@ -25,6 +25,7 @@ from .errors import ExpectedPyrplError
 from .widgets.startup_widget import HostnameSelectorWidget
 from .software_modules import get_module
 from . import pyrpl_utils
+from .async_utils import AcquisitionExecutor
 
 import logging
 import os
@@ -61,6 +62,7 @@ defaultparameters = dict(
     timeout=1,  # timeout in seconds for ssh communication
     monitor_server_name='monitor_server',  # name of the server program on redpitaya
     silence_env=False,   # suppress all environment variables that may override the configuration?
+    async_client=False,  # use a client whose requests do not block the event loop (not on Windows)?
     gui=True  # show graphical user interface or work on command-line only?
     )
 
@@ -97,6 +99,7 @@ class RedPitaya(object):
             timeout=3,  # timeout in seconds for ssh communication
             monitor_server_name='monitor_server',  # name of the server program on redpitaya
             silence_env=False,   # suppress all environment variables that may override the configuration?
+            async_client=False,  # use a client whose requests do not block the event loop (not on Windows)?
             gui=True  # show graphical user interface or work on command-line only?
 
         if you are experiencing problems, try to increase delay, or try
@@ -182,6 +185,7 @@ class RedPitaya(object):
         # memorize whether server is running - nearly obsolete
         self._serverrunning = False
         self.client = None  # client class
+        self._acquisition_executor = None  # worker thread of acquisitions
         self._slaves = []  # slave interfaces to same redpitaya
         self.modules = OrderedDict()  # all submodules
 
@@ -290,6 +294,9 @@ class RedPitaya(object):
                 source = self.parameters['filename']
             except KeyError:
                 source = None
+        if self.client is not None:
+            # register values are lost when the fpga is reprogrammed
+            self.client.shadow.clear()
         self.end()
         sleep(self.parameters['delay'])
         self.ssh.ask('rw')
@@ -447,9 +454,27 @@ class RedPitaya(object):
         self._serverrunning = False
 
     def endclient(self):
+        if self._acquisition_executor is not None:
+            self._acquisition_executor.shutdown()
+            self._acquisition_executor = None
         del self.client
         self.client = None
 
+    @property
+    def acquisition_executor(self):
+        """
+        AcquisitionExecutor whose worker thread performs the blocking
+        hardware transfers and data reductions of the acquisition modules
+        of this board. None with an asynchronous client, whose requests
+        do not block the event loop anyways (and must remain in its thread).
+        """
+        if self._acquisition_executor is None and self.client is not None \
+                and not isinstance(self.client,
+                                   redpitaya_client.AsyncMonitorClient):
+            self._acquisition_executor = AcquisitionExecutor(
+                name="acquisition " + str(self.parameters['hostname']))
+        return self._acquisition_executor
+
     def start(self):
         if self.parameters['leds_off']:
             self.switch_led(gpiopin=0, state=False)
@@ -490,7 +515,11 @@ class RedPitaya(object):
     "LICENSE" in the source directory for details.\r\n""")
 
     def startclient(self):
-        self.client = redpitaya_client.MonitorClient(
+        if self.parameters['async_client']:
+            client_class = redpitaya_client.AsyncMonitorClient
+        else:
+            client_class = redpitaya_client.MonitorClient
+        self.client = client_class(
             self.parameters['hostname'], self.parameters['port'], restartserver=self.restartserver)
         self.makemodules()
         self.logger.debug("Client started successfully. ")
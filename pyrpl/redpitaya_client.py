@@ -20,6 +20,8 @@
 import numpy as np
 import socket
 import logging
+import threading
+from collections import deque
 try:
     raise  # disable sound output for now
     from pysine import sine  # for debugging read/write calls
@@ -28,11 +30,122 @@ except:
         print("Called sine(frequency=%f, duration=%f)" % (frequency, duration))
 from .hardware_modules.dsp import dsp_addr_base, DSP_INPUTS
 from .pyrpl_utils import time
+from .async_utils import LOOP
 
 # global conter to assign a number to each client
 # only used for debugging purposes
 CLIENT_NUMBER = 0
 
+# maximum number of 32-bit words in the body or the reply of one request
+MAX_LENGTH = 65535
+
+
+class DeferredWrites(object):
+    """
+    A context manager that queues all writes of a client until the end of
+    the with-block, where they are sent to the server in a single batch
+    transaction. Reads issued inside the block are sent in the same
+    transaction as the writes queued before them.
+
+    Usage example::
+
+        with client.deferred():
+            client.writes(0x40100014, [64])
+            client.write_masked(0x40100000, 0x1, 0x1)
+        # both writes were executed in one network round trip
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def __enter__(self):
+        # other threads wait until the queued writes are sent
+        self.client.lock.acquire()
+        self.client._deferred_depth += 1
+        return self.client
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.client._deferred_depth -= 1
+            if self.client._deferred_depth == 0:
+                self.client.flush()
+        finally:
+            self.client.lock.release()
+
+
+class RegisterShadow(object):
+    """
+    Host-side copy of the register words of one RedPitaya.
+
+    For each word address, the shadow stores the last value that was written
+    to or read from the word, together with a bitmask of the bits that are
+    known to still hold this value. Bits that the FPGA may change by itself
+    (e.g. status flags or counters) must be declared volatile and never
+    become known. The shadow belongs to a client, such that a new
+    connection (e.g. after reflashing the FPGA) starts with an empty shadow.
+    Reconnections of the same client (restart) only clear the values.
+    """
+    FULL_MASK = 0xFFFFFFFF
+    # longer writes (e.g. of data buffers) only invalidate the shadow
+    MAX_WRITE_LENGTH = 16
+
+    def __init__(self):
+        self._words = dict()  # address: (value, known bits)
+        self._volatile = dict()  # address: volatile bits
+
+    def clear(self):
+        """ forgets all register values """
+        self._words.clear()
+
+    def declare_volatile(self, addr, mask=FULL_MASK):
+        """ declares that the FPGA may change the bits in mask of addr """
+        self._volatile[addr] = self._volatile.get(addr, 0) | mask
+        if addr in self._words:
+            value, known = self._words[addr]
+            self._words[addr] = value, known & ~mask
+
+    def get(self, addr, mask=FULL_MASK):
+        """ returns the word at addr if all bits in mask are known, else None """
+        try:
+            value, known = self._words[addr]
+        except KeyError:
+            return None
+        if known & mask != mask:
+            return None
+        return value
+
+    def update(self, addr, value, mask=FULL_MASK):
+        """ records that the bits in mask of addr hold those of value """
+        mask &= ~self._volatile.get(addr, 0)
+        value, known = int(value) & mask, mask
+        try:
+            old, oldknown = self._words[addr]
+        except KeyError:
+            pass
+        else:
+            value |= old & ~mask
+            known |= oldknown
+        self._words[addr] = value, known
+
+    def updates(self, addr, values, mask=FULL_MASK):
+        """ records a write of several consecutive words """
+        if len(values) > self.MAX_WRITE_LENGTH:
+            end = addr + 0x4 * len(values)
+            for a in [a for a in self._words if addr <= a < end]:
+                del self._words[a]
+        else:
+            for i, v in enumerate(values):
+                self.update(addr + 0x4 * i, v, mask)
+
+    def merge(self, addr, value, mask):
+        """
+        Returns the full word that results from writing the bits in mask of
+        value to addr, or None if the remaining bits are not all known.
+        """
+        other = self.get(addr, ~mask & self.FULL_MASK)
+        if other is None or self._volatile.get(addr, 0) & ~mask:
+            return None
+        return (other & ~mask) | (int(value) & mask)
+
 
 class MonitorClient(object):
     def __init__(self, hostname="192.168.1.0", port=2222, restartserver=None):
@@ -54,6 +167,22 @@ class MonitorClient(object):
         self._port = port
         self._read_counter = 0 # For debugging and unittests
         self._write_counter = 0 # For debugging and unittests
+        self._transaction_counter = 0 # For debugging and unittests
+        # register values known from previous reads and writes. restart()
+        # forgets the values, but keeps the volatile bits declared by the
+        # modules.
+        if not hasattr(self, 'shadow'):
+            self.shadow = RegisterShadow()
+        else:
+            self.shadow.clear()
+        # queue of writes that are delayed within a 'with self.deferred()'
+        if not hasattr(self, '_deferred_ops'):
+            self._deferred_ops = []
+            self._deferred_depth = 0
+        # serializes the requests of different threads (e.g. the GUI and an
+        # AcquisitionExecutor), preserved by restart()
+        if not hasattr(self, 'lock'):
+            self.lock = threading.RLock()
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # try to connect at least 5 times
         for i in range(5):
@@ -78,6 +207,28 @@ class MonitorClient(object):
             else:
                 break
         self.socket.settimeout(1.0)  # 1 second timeout for socket operations
+        self._batch_supported = self._probe_batch()
+
+    def _probe_batch(self):
+        """
+        Returns True if the server supports batch transactions.
+
+        An empty batch request is answered by an up-to-date server, whereas
+        older servers silently ignore requests of length 0.
+        """
+        header = b'b' + bytes(bytearray([0, 0, 0, 0, 0, 0, 0]))
+        timeout = self.socket.gettimeout()
+        self.socket.settimeout(0.2)
+        try:
+            self.socket.send(header)
+            return self.socket.recv(8) == header
+        except socket.error:
+            self.logger.info("Server of client %s does not support batch "
+                             "transactions. Please recompile monitor_server "
+                             "for faster communication. ", self.client_number)
+            return False
+        finally:
+            self.socket.settimeout(timeout)
 
     def close(self):
         try:
@@ -95,15 +246,335 @@ class MonitorClient(object):
         self._read_counter+=1
         if hasattr(self, '_sound_debug') and self._sound_debug:
             sine(440, 0.05)
-        return self.try_n_times(self._reads, addr, length)
+        with self.lock:
+            if self._deferred_ops:
+                # send the queued writes along with the read
+                return self.transact([('r', addr, length)])[-1]
+            return self.try_n_times(self._reads, addr, length)
 
     def writes(self, addr, values):
         self._write_counter += 1
         if hasattr(self, '_sound_debug') and self._sound_debug:
             sine(880, 0.05)
-        return self.try_n_times(self._writes, addr, values)
-    
+        with self.lock:
+            if self._deferred_depth > 0:
+                self._deferred_ops.append(('w', addr, values))
+                return True
+            return self.try_n_times(self._writes, addr, values)
+
+    def write_masked(self, addr, value, mask):
+        """
+        Writes the bits of value selected by mask to the word at addr and
+        leaves all other bits unchanged. With an up-to-date server, this
+        costs a single round trip instead of a read and a write.
+        """
+        with self.lock:
+            if self._deferred_depth > 0 or self._batch_supported:
+                self._write_counter += 1
+                self._deferred_ops.append(('m', addr, [value], mask))
+                if self._deferred_depth == 0:
+                    self.flush()
+                return True
+            act = int(self.reads(addr, 1)[0])
+            return self.writes(addr, [(act & ~mask) | (int(value) & mask)])
+
+    def deferred(self):
+        """
+        Returns a context manager within which all writes are queued and
+        sent in a single transaction (see :class:`DeferredWrites`).
+        """
+        return DeferredWrites(self)
+
+    def flush(self):
+        """
+        Sends all queued writes to the server.
+        """
+        if self._deferred_ops:
+            self.transact([])
+
+    def transact(self, operations):
+        """
+        Executes a list of operations in as few network round trips as
+        possible and returns the list of their results.
+
+        Each operation is a tuple:
+
+        - ('r', addr, length): read length words starting at addr. The
+          result is an array of np.uint32.
+        - ('w', addr, values): write values starting at addr. The result
+          is True.
+        - ('m', addr, values, mask): for each word starting at addr, write
+          only the bits set in mask. The result is True.
+        - ('q', addr, mask, timeout): the server waits until the bits set in
+          mask are cleared in the word at addr, or until timeout (in
+          seconds) expires, before executing the next operations. The
+          result is an array with the last value of the word. On timeout,
+          the server skips the following operations of the batch, whose
+          results are None. Without batch support, the word is read only
+          once and no operation is skipped.
+        - ('p', addr, length): packed read of the lower 16 bits of length
+          words starting at addr, which halves the transferred data. The
+          result is an array of np.uint16.
+        - ('u', addr, values): packed write of values (16 bit at most)
+          starting at addr. The result is True.
+
+        Writes that are queued by :meth:`deferred` are executed first and
+        their results are not returned.
+        """
+        with self.lock:
+            deferred = self._coalesce(self._deferred_ops)
+            n_deferred = len(deferred)
+            operations = deferred + list(operations)
+            self._deferred_ops = []
+            self._transaction_counter += 1
+            if not self._batch_supported:
+                results = [self._execute_operation(op) for op in operations]
+            else:
+                results = []
+                for chunk in self._split_operations(operations):
+                    if len(chunk) == 1 and \
+                            max(self._operation_length(chunk[0])) > MAX_LENGTH:
+                        # too long for a batch, fall back to simple requests
+                        results.append(self._execute_operation(chunk[0]))
+                    else:
+                        results += self._try_transact(chunk)
+        return results[n_deferred:]
+
+    @staticmethod
+    def _coalesce(operations):
+        """
+        Merges consecutive single-word writes to the same address (e.g. the
+        fields of a word set one after another in a deferred block) into
+        one write with the combined mask.
+        """
+        merged = []
+        for op in operations:
+            previous = merged[-1] if merged else None
+            if previous is None or op[0] not in 'wm' or \
+                    previous[0] not in 'wm' or previous[1] != op[1] or \
+                    len(op[2]) != 1 or len(previous[2]) != 1:
+                merged.append(op)
+                continue
+            mask = op[3] if op[0] == 'm' else 0xFFFFFFFF
+            value = (int(previous[2][0]) & ~mask) | (int(op[2][0]) & mask)
+            if previous[0] == 'w' or mask == 0xFFFFFFFF:
+                merged[-1] = ('w', op[1], [value & 0xFFFFFFFF])
+            else:
+                merged[-1] = ('m', op[1], [value & 0xFFFFFFFF],
+                              previous[3] | mask)
+        return merged
+
+    @staticmethod
+    def _operation_length(operation):
+        """
+        Returns the number of words (request body, reply) of an operation.
+        """
+        code = operation[0]
+        if code == 'r':
+            return 2, operation[2]
+        elif code == 'w':
+            return 2 + len(operation[2]), 0
+        elif code == 'm':
+            return 3 + len(operation[2]), 0
+        elif code == 'q':
+            return 4, 1
+        # the server unpacks into the free space of the reply buffer
+        elif code == 'p':
+            return 2, operation[2]
+        elif code == 'u':
+            return 2 + (len(operation[2]) + 1) // 2, len(operation[2])
+        else:
+            raise ValueError("Unknown operation %s. Valid operations are "
+                             "'r', 'w', 'm', 'q', 'p' and 'u'. " % code)
+
+    @staticmethod
+    def _wait_time(operations):
+        """ the longest time the server may wait during operations """
+        return sum(op[3] for op in operations if op[0] == 'q')
+
+    def _split_operations(self, operations):
+        """
+        Splits operations into chunks whose request body and reply each
+        fit into one batch transaction.
+        """
+        chunk, body_length, reply_length = [], 0, 0
+        for op in operations:
+            body, reply = self._operation_length(op)
+            if chunk and (body_length + body > MAX_LENGTH or
+                          reply_length + reply > MAX_LENGTH):
+                yield chunk
+                chunk, body_length, reply_length = [], 0, 0
+            chunk.append(op)
+            body_length += body
+            reply_length += reply
+        if chunk:
+            yield chunk
+
+    def _execute_operation(self, operation):
+        """
+        Executes one operation without batch transaction.
+        """
+        code, addr = operation[0], operation[1]
+        if code == 'r':
+            return self.try_n_times(self._reads, addr, operation[2])
+        elif code == 'q':
+            return self.try_n_times(self._reads, addr, 1)
+        elif code == 'p':
+            return np.asarray(self.try_n_times(self._reads, addr, operation[2]),
+                              dtype=np.uint32).astype(np.uint16)
+        elif code == 'u':
+            return self.try_n_times(
+                self._writes, addr,
+                np.asarray(operation[2], dtype=np.uint32) & 0xFFFF)
+        elif code == 'w':
+            return self.try_n_times(self._writes, addr, operation[2])
+        elif code == 'm':
+            mask = operation[3]
+            act = self.try_n_times(self._reads, addr, len(operation[2]))
+            values = (np.asarray(act, dtype=np.uint32) & np.uint32(~mask & 0xFFFFFFFF)) \
+                     | (np.asarray(operation[2], dtype=np.uint32) & np.uint32(mask))
+            return self.try_n_times(self._writes, addr, values)
+
+    def _try_transact(self, operations, n=5):
+        for i in range(n):
+            try:
+                results = self._transact(operations)
+            except (socket.timeout, socket.error):
+                self.logger.error("Error occured in batch transaction attempt "
+                                  "%s with %s operations by client %s",
+                                  i, len(operations), self.client_number)
+                if self._restartserver is not None:
+                    self.restart()
+            else:
+                if results is not None:
+                    return results
+        raise ConnectionError("Batch transaction with %s operations by "
+                              "client %s failed %s times. Please check the "
+                              "connection to %s. "
+                              % (len(operations), self.client_number, n,
+                                 self._hostname))
+
+    @staticmethod
+    def _make_header(code, length, addr, sequence=0):
+        """ returns the 8-byte header of a request """
+        return code + bytes(bytearray([sequence & 0xFF,
+                                       length & 0xFF,
+                                       (length >> 8) & 0xFF,
+                                       addr & 0xFF,
+                                       (addr >> 8) & 0xFF,
+                                       (addr >> 16) & 0xFF,
+                                       (addr >> 24) & 0xFF]))
+
+    @staticmethod
+    def _encode_batch(operations):
+        """
+        Returns the request body of a batch transaction, the length of its
+        reply in words, and the position of each result in the reply.
+        """
+        body = []
+        results = []
+        reply_length = 0
+        for op in operations:
+            code, addr = op[0], op[1]
+            if code == 'r':
+                length = op[2]
+                results.append((reply_length, length))
+                reply_length += length
+                data = []
+            elif code == 'q':
+                length = 1
+                results.append((reply_length, length))
+                reply_length += length
+                data = [op[2] & 0xFFFFFFFF, int(op[3] * 1e6)]
+            elif code == 'p':
+                length = op[2]
+                results.append((reply_length, (length + 1) // 2, length))
+                reply_length += (length + 1) // 2
+                data = []
+            elif code == 'u':
+                data = np.asarray(op[2], dtype=np.uint32).ravel() & 0xFFFF
+                length = len(data)
+                results.append(None)
+                data = MonitorClient._pack(data)
+            else:
+                data = np.asarray(op[2], dtype=np.uint32).ravel()
+                length = len(data)
+                results.append(None)
+                if code == 'm':
+                    data = np.concatenate([[op[3] & 0xFFFFFFFF], data])
+            body.append(np.array([ord(code) | (length << 16),
+                                  addr & 0xFFFFFFFF], dtype='<u4'))
+            body.append(np.asarray(data, dtype='<u4'))
+        body = np.concatenate(body).tobytes() if body else b''
+        return body, reply_length, results
+
+    @staticmethod
+    def _pack(values):
+        """ packs 16-bit values pairwise into little-endian words """
+        packed = np.zeros(2 * ((len(values) + 1) // 2), dtype='<u2')
+        packed[:len(values)] = values
+        return packed.view('<u4')
+
+    @staticmethod
+    def _executed(header, n_operations):
+        """
+        Returns the number of operations executed by the server, which is
+        given by bytes 5-8 of the header of a batch reply. It is smaller
+        than n_operations only if a wait operation has timed out.
+        """
+        return min(int(np.frombuffer(header[4:8], dtype='<u4')[0]),
+                   n_operations)
+
+    @staticmethod
+    def _reply_length(results, n_executed):
+        """ the reply length in words of the first n_executed operations """
+        ends = [r[0] + r[1] for r in results[:n_executed] if r is not None]
+        return ends[-1] if ends else 0
+
+    @staticmethod
+    def _decode_batch(data, results):
+        """
+        Splits the reply of a batch transaction (with header) into the
+        results. The results of the operations skipped by the server are
+        None.
+        """
+        n_executed = MonitorClient._executed(data[:8], len(results))
+        reply = np.frombuffer(data[8:], dtype='<u4')
+        decoded = []
+        for r in results[:n_executed]:
+            if r is None:
+                decoded.append(True)
+            elif len(r) == 3:  # packed read
+                decoded.append(reply[r[0]:r[0] + r[1]].view('<u2')[:r[2]])
+            else:
+                decoded.append(reply[r[0]:r[0] + r[1]])
+        return decoded + [None] * (len(results) - n_executed)
+
     # the actual code
+    def _transact(self, operations):
+        body, reply_length, results = self._encode_batch(operations)
+        header = self._make_header(b'b', len(body) // 4, len(operations))
+        timeout = self.socket.gettimeout()
+        self.socket.settimeout(timeout + self._wait_time(operations))
+        try:
+            self.socket.sendall(header + body)
+            data = self.socket.recv(8)
+            while (len(data) < 8):
+                data += self.socket.recv(8 - len(data))
+            # bytes 5-8 of the reply are the number of executed operations
+            if data[:4] != header[:4]:  # check for in-sync transmission
+                self.logger.error("Wrong control sequence from server: %s",
+                                  data[:8])
+                self.emptybuffer()
+                return None
+            reply_length = self._reply_length(
+                results, self._executed(data, len(operations)))
+            while (len(data) < reply_length * 4 + 8):
+                data += self.socket.recv(reply_length * 4 - len(data) + 8)
+        finally:
+            self.socket.settimeout(timeout)
+        return self._decode_batch(data, results)
+
     def _reads(self, addr, length):
         if length > 65535:
             length = 65535
@@ -171,12 +642,282 @@ class MonitorClient(object):
     def restart(self):
         self.close()
         port = self._restartserver()
+        # queued writes are preserved by __init__
         self.__init__(
             hostname=self._hostname,
             port=port,
             restartserver=self._restartserver)
 
 
+class AsyncMonitorClient(MonitorClient):
+    """
+    A MonitorClient whose requests can be awaited in coroutines without
+    blocking the event loop async_utils.LOOP.
+
+    Each request is tagged with a sequence number in the reserved header
+    byte, which the server echoes in its reply. Several requests can be in
+    flight on the same socket at the same time. Their replies are received
+    by a reader callback of the event loop and resolve the corresponding
+    futures in the order of the requests. Synchronous calls such as reads()
+    remain available and are queued behind the pending asynchronous
+    requests.
+
+    Example::
+
+        async def get_both_channels(client):
+            ch1 = ensure_future(client.reads_async(0x40110000, 2**14))
+            ch2 = ensure_future(client.reads_async(0x40120000, 2**14))
+            # both requests are in flight at the same time
+            return await ch1, await ch2
+    """
+    # seconds after which a pending asynchronous request fails
+    timeout = 1.0
+
+    def __init__(self, hostname="192.168.1.0", port=2222, restartserver=None):
+        self._inflight = deque()  # (header, reply length, future)
+        self._rxbuffer = bytearray()
+        self._sequence = 0
+        super(AsyncMonitorClient, self).__init__(hostname=hostname,
+                                                 port=port,
+                                                 restartserver=restartserver)
+        self._fileno = self.socket.fileno()
+        LOOP.add_reader(self._fileno, self._on_readable)
+
+    def close(self):
+        if getattr(self, '_fileno', None) is not None:
+            LOOP.remove_reader(self._fileno)
+            self._fileno = None
+        self._fail_inflight(ConnectionError("Client %s was closed. "
+                                            % self.client_number))
+        super(AsyncMonitorClient, self).close()
+
+    # the public coroutines
+    async def reads_async(self, addr, length):
+        self._read_counter += 1
+        if self._deferred_ops:
+            return (await self.transact_async([('r', addr, length)]))[-1]
+        return await self._try_n_times_async(self._reads_async, addr, length)
+
+    async def writes_async(self, addr, values):
+        self._write_counter += 1
+        if self._deferred_depth > 0:
+            self._deferred_ops.append(('w', addr, values))
+            return True
+        return await self._try_n_times_async(self._writes_async, addr, values)
+
+    async def transact_async(self, operations):
+        """
+        Same as :meth:`MonitorClient.transact`, but awaitable.
+        """
+        deferred = self._coalesce(self._deferred_ops)
+        n_deferred = len(deferred)
+        operations = deferred + list(operations)
+        self._deferred_ops = []
+        self._transaction_counter += 1
+        results = []
+        if not self._batch_supported:
+            for op in operations:
+                if op[0] == 'r':
+                    results.append(await self._try_n_times_async(
+                        self._reads_async, op[1], op[2]))
+                else:  # writes are not worth a coroutine
+                    results.append(self._execute_operation(op))
+        else:
+            for chunk in self._split_operations(operations):
+                if len(chunk) == 1 and \
+                        max(self._operation_length(chunk[0])) > MAX_LENGTH:
+                    results.append(self._execute_operation(chunk[0]))
+                else:
+                    results += await self._try_n_times_async(
+                        self._transact_async, chunk, None)
+        return results[n_deferred:]
+
+    async def _try_n_times_async(self, function, addr, value, n=5):
+        for i in range(n):
+            try:
+                result = await function(addr, value)
+            except (socket.timeout, socket.error):
+                self.logger.error("Error occured in asynchronous attempt %s "
+                                  "of %s by client %s",
+                                  i, function.__name__, self.client_number)
+                if self._restartserver is not None:
+                    self.restart()
+            else:
+                if result is not None:
+                    return result
+        raise ConnectionError("Asynchronous request %s by client %s failed "
+                              "%s times. Please check the connection to %s. "
+                              % (function.__name__, self.client_number, n,
+                                 self._hostname))
+
+    # the actual code
+    async def _reads_async(self, addr, length):
+        length = min(length, MAX_LENGTH)
+        data = await self._await_reply(
+            self._request(b'r', length, addr, b'', length * 4))
+        return np.frombuffer(data[8:], dtype=np.uint32)
+
+    async def _writes_async(self, addr, values):
+        values = np.array(values[:MAX_LENGTH - 2], dtype=np.uint32)
+        await self._await_reply(
+            self._request(b'w', len(values), addr, values.tobytes(), 0))
+        return True
+
+    async def _transact_async(self, operations, unused=None):
+        future, results = self._request_batch(operations)
+        data = await self._await_reply(future, self._wait_time(operations))
+        return self._decode_batch(data, results)
+
+    # the synchronous requests use the same queue as the asynchronous ones
+    def _reads(self, addr, length):
+        length = min(length, MAX_LENGTH)
+        data = self._wait_reply(self._request(b'r', length, addr, b'',
+                                              length * 4))
+        return np.frombuffer(data[8:], dtype=np.uint32)
+
+    def _writes(self, addr, values):
+        values = np.array(values[:MAX_LENGTH - 2], dtype=np.uint32)
+        self._wait_reply(self._request(b'w', len(values), addr,
+                                       values.tobytes(), 0))
+        return True
+
+    def _transact(self, operations):
+        future, results = self._request_batch(operations)
+        data = self._wait_reply(future, self._wait_time(operations))
+        return self._decode_batch(data, results)
+
+    def _request_batch(self, operations):
+        """
+        Sends a batch transaction and returns a future for the reply and
+        the position of each result in the reply.
+        """
+        body, _, results = self._encode_batch(operations)
+
+        def reply_length(header):
+            # shorter if the server has skipped operations
+            return 4 * self._reply_length(
+                results, self._executed(header, len(operations)))
+        return self._request(b'b', len(body) // 4, len(operations), body,
+                             reply_length), results
+
+    def _request(self, code, length, addr, payload, reply_length):
+        """
+        Sends a request and returns a future for the reply (with header).
+        reply_length is the length of the reply data in bytes, or, for a
+        batch transaction, a function that returns it from the header of
+        the reply.
+        """
+        self._sequence = (self._sequence + 1) % 256
+        header = self._make_header(code, length, addr, self._sequence)
+        future = LOOP.create_future()
+        self._inflight.append((header, reply_length, future))
+        try:
+            self.socket.sendall(header + payload)
+        except socket.error as e:
+            self._fail_inflight(e)
+            raise
+        return future
+
+    async def _await_reply(self, future, extra_timeout=0):
+        """
+        Awaits future and fails all pending requests if no reply arrives
+        within the timeout.
+        """
+        timer = LOOP.call_later(self.timeout + extra_timeout, self._expire,
+                                future)
+        try:
+            return await future
+        finally:
+            timer.cancel()
+
+    def _wait_reply(self, future, extra_timeout=0):
+        """
+        Blocks until future is resolved and returns its result.
+        """
+        timeout = self.socket.gettimeout()
+        self.socket.settimeout(timeout + extra_timeout)
+        try:
+            while not future.done():
+                try:
+                    data = self.socket.recv(65536)
+                    if not data:
+                        raise socket.error("Connection closed by server. ")
+                except socket.error as e:
+                    self._fail_inflight(e)
+                    raise
+                self._receive(data)
+        finally:
+            self.socket.settimeout(timeout)
+        return future.result()
+
+    def _on_readable(self):
+        """ reader callback of the event loop """
+        timeout = self.socket.gettimeout()
+        self.socket.settimeout(0)
+        try:
+            data = self.socket.recv(65536)
+        except BlockingIOError:  # data was consumed by a synchronous call
+            return
+        except socket.error as e:
+            self._fail_inflight(e)
+            return
+        finally:
+            self.socket.settimeout(timeout)
+        if not data:
+            self._fail_inflight(socket.error("Connection closed by server. "))
+        else:
+            self._receive(data)
+
+    def _receive(self, data):
+        """ dispatches the received data to the pending futures """
+        self._rxbuffer += data
+        while self._inflight:
+            header, reply_length, future = self._inflight[0]
+            if len(self._rxbuffer) < 8:
+                return
+            # bytes 5-8 of a batch reply are the number of executed operations
+            n_checked = 4 if callable(reply_length) else 8
+            if bytes(self._rxbuffer[:n_checked]) != header[:n_checked]:
+                # check for in-sync transmission
+                self.logger.error("Wrong control sequence from server: %s",
+                                  bytes(self._rxbuffer[:8]))
+                self._inflight.popleft()
+                self._fail_inflight(socket.error("Client %s out of sync. "
+                                                 % self.client_number),
+                                    future)
+                return
+            if callable(reply_length):
+                reply_length = reply_length(bytes(self._rxbuffer[:8]))
+            if len(self._rxbuffer) < reply_length + 8:
+                return
+            self._inflight.popleft()
+            reply = bytes(self._rxbuffer[:reply_length + 8])
+            del self._rxbuffer[:reply_length + 8]
+            if not future.done():
+                future.set_result(reply)
+        if self._rxbuffer:
+            self.logger.error("Received %d unexpected bytes from server. ",
+                              len(self._rxbuffer))
+            self._rxbuffer = bytearray()
+
+    def _expire(self, future):
+        if not future.done():
+            self._fail_inflight(socket.timeout("Timeout of client %s. "
+                                               % self.client_number))
+
+    def _fail_inflight(self, exception, *futures):
+        """
+        Sets exception on futures and on all pending requests, whose
+        replies can no longer be assigned.
+        """
+        futures = list(futures) + [f for h, l, f in self._inflight]
+        self._inflight.clear()
+        self._rxbuffer = bytearray()
+        for future in futures:
+            if not future.done():
+                future.set_exception(exception)
+
+
 class DummyClient(object):  # pragma: no cover
     """Class for unitary tests without RedPitaya hardware available"""
     class fpgadict(dict):
@@ -184,6 +925,10 @@ class DummyClient(object):  # pragma: no cover
             return 1 # 0 (1 is needed to avoid division_by_zero errors for some registers)
     fpgamemory = fpgadict({str(0x40100014): 1})  # scope decimation initial value
 
+    def __init__(self):
+        self.shadow = RegisterShadow()
+        self.lock = threading.RLock()
+
     def read_fpgamemory(self, addr):
         # here we implement a fraction of the memory map to simulate the actual redpitaya
         # scope
@@ -263,6 +1008,40 @@ class DummyClient(object):  # pragma: no cover
     def writes(self, addr, values): # pragma: no-cover
         for i, v in enumerate(values):
             self.fpgamemory[str(addr+0x4*i)]=v
+
+    def write_masked(self, addr, value, mask):
+        act = int(self.reads(addr, 1)[0])
+        self.writes(addr, [(act & ~mask) | (int(value) & mask)])
+
+    def deferred(self):
+        return DeferredWrites(self)
+
+    _deferred_depth = 0
+
+    def flush(self):
+        pass
+
+    def transact(self, operations):
+        results = []
+        for op in operations:
+            if op[0] == 'r':
+                results.append(self.reads(op[1], op[2]))
+            elif op[0] == 'w':
+                self.writes(op[1], op[2])
+                results.append(True)
+            elif op[0] == 'q':
+                results.append(self.reads(op[1], 1))
+            elif op[0] == 'p':
+                results.append(np.asarray(self.reads(op[1], op[2]),
+                                          dtype=np.uint32).astype(np.uint16))
+            elif op[0] == 'u':
+                self.writes(op[1], op[2])
+                results.append(True)
+            else:
+                for i, v in enumerate(op[2]):
+                    self.write_masked(op[1] + 0x4 * i, v, op[3])
+                results.append(True)
+        return results
     
     def restart(self):
         pass
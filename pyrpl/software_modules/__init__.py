@@ -8,6 +8,7 @@ from .lockbox import *
 from .scanningCavity import *
 from .loop import *
 from .software_pid import *
+from .recorder import Recorder, load_recording
 from .module_managers import *
 from ..pyrpl_utils import all_subclasses
 
@@ -1,24 +1,131 @@
 """
 Defines a number of Loop modules to be used to perform periodically a task
 """
+import logging
+import threading
+from collections import OrderedDict
 import numpy as np
 import pyqtgraph as pg
 from ..modules import Module
+from .. import async_utils
 from ..async_utils import sleep_async, wait, ensure_future #MainThreadTimer
-from ..pyrpl_utils import time
+from ..pyrpl_utils import time, RingBuffer
+from ..widgets.strip_chart import StripChartCurves
 from qtpy import QtCore
 
+logger = logging.getLogger(name=__name__)
+
+
+class LoopExecutor(object):
+    """ Calls a function periodically from a worker thread.
+
+    The iterations are scheduled at fixed times start + n * interval of the
+    monotonic clock, independently of the duration of the previous
+    iterations and of the load of the GUI thread. When an iteration takes
+    longer than the interval, the iterations whose time has already passed
+    are skipped (and counted as missed) instead of being executed back to
+    back.
+
+    For the last STATISTICS_LENGTH iterations, the jitter (delay of the
+    start of the iteration with respect to its scheduled time) and the
+    latency (duration of the function call) are recorded, see statistics.
+    """
+    STATISTICS_LENGTH = 1000
+
+    def __init__(self, function, interval, name='loop'):
+        self.function = function
+        self.interval = interval  # can be changed while running
+        self.name = name
+        self.iterations = 0
+        self.missed = 0
+        self._timings = RingBuffer(self.STATISTICS_LENGTH, 3)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def in_worker_thread(self):
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._work, name=self.name,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ stops after the current iteration, which is awaited unless
+        stop is called by the function itself """
+        self._stop_event.set()
+        if self._thread is not None and not self.in_worker_thread():
+            self._thread.join()
+
+    def _work(self):
+        scheduled = time()
+        while not self._stop_event.is_set():
+            start = time()
+            try:
+                self.function()
+            except BaseException as e:
+                logger.error("Error in loop %s: %s", self.name, e)
+            stop = time()
+            self.iterations += 1
+            self._timings.append([start, start - scheduled, stop - start])
+            scheduled += self.interval
+            delay = scheduled - time()
+            if delay < 0:  # skip the iterations that are already late
+                skipped = int(-delay // self.interval) if self.interval > 0 \
+                    else 0
+                self.missed += skipped
+                scheduled += skipped * self.interval
+            else:
+                self._stop_event.wait(delay)
+
+    @property
+    def statistics(self):
+        """ dict with the timing statistics of the last iterations (in
+        seconds): mean rate, mean and maximum latency, rms and maximum
+        jitter, and the total numbers of iterations and missed iterations """
+        starts, jitter, latency = self._timings.data.T
+        statistics = dict(rate=np.nan, latency_mean=np.nan,
+                          latency_max=np.nan, jitter_rms=np.nan,
+                          jitter_max=np.nan, iterations=self.iterations,
+                          missed=self.missed)
+        if len(starts) > 0:
+            statistics.update(latency_mean=latency.mean(),
+                              latency_max=latency.max(),
+                              jitter_rms=np.sqrt((jitter**2).mean()),
+                              jitter_max=jitter.max())
+        if len(starts) > 1:
+            statistics['rate'] = (len(starts) - 1) / (starts[-1] - starts[0])
+        return statistics
+
 
 class Loop(Module):
+    """ calls loop() every interval seconds.
+
+    By default, the loop is driven by a QTimer in the GUI thread. With
+    threaded=True, it is executed by a LoopExecutor in a worker thread,
+    which keeps a steady rate while the GUI is busy and records timing
+    statistics. The functions of a threaded loop must then not access the
+    GUI directly (plotappend of PlotLoop takes care of this). """
     timer = QtCore.QTimer()
     def __init__(self, parent, name='loop', interval=1.0,
                  autostart=True,
                  loop_function=None, setup_function=None,
-                 teardown_function=None, **kwargs):
+                 teardown_function=None, threaded=False, **kwargs):
         # parent is parent pyrpl module
         # name is important for the right config file section name
         # optionally, init_function, loop_function, and clear_function can be passed
         # as arguments
+        self._executor = LoopExecutor(self._iterate, interval, name=name) \
+            if threaded else None
+        self._posted = OrderedDict()  # functions waiting for the GUI thread
+        self._post_lock = threading.Lock()
         super(Loop, self).__init__(parent, name=name)
         self.kwargs = kwargs  # allows using kwargs in setup_loop
         if setup_function is not None:
@@ -32,7 +139,8 @@ class Loop(Module):
         # interval in seconds
         self.interval = interval
 
-        self.timer.timeout.connect(self.main_loop)
+        if self._executor is None:
+            self.timer.timeout.connect(self.main_loop)
         self.n = 0  # counter for the number of loops
         self.time  # initialize start time in internal time format
         # call custom initialization (excluded above)
@@ -55,15 +163,51 @@ class Loop(Module):
 
     @property
     def interval(self):
+        if self._executor is not None:
+            return self._executor.interval
         return float(self.timer.interval())/1000.0
 
     @interval.setter
     def interval(self, val):
-        self.timer.setInterval(val*1000.0)
+        if self._executor is not None:
+            self._executor.interval = val
+        else:
+            self.timer.setInterval(int(round(val*1000.0)))
+
+    @property
+    def threaded(self):
+        return self._executor is not None
+
+    @property
+    def statistics(self):
+        """ timing statistics of a threaded loop (see LoopExecutor) """
+        if self._executor is None:
+            return None
+        return self._executor.statistics
+
+    def _post_latest(self, key, function):
+        """ calls function from the GUI thread. Of the functions posted
+        with the same key before the GUI thread gets to them, only the
+        latest one is called, such that a busy GUI does not accumulate
+        callbacks of a fast threaded loop. """
+        with self._post_lock:
+            schedule = not self._posted
+            self._posted[key] = function
+        if schedule:
+            async_utils.LOOP.call_soon_threadsafe(self._call_posted)
+
+    def _call_posted(self):
+        with self._post_lock:
+            posted, self._posted = self._posted, OrderedDict()
+        for function in posted.values():
+            function()
 
     def _clear(self):
         self._ended = True
-        self.timer.stop()
+        if self._executor is not None:
+            self._executor.stop()
+        else:
+            self.timer.stop()
         try:
             self.teardown_loop()
         except TypeError:
@@ -72,6 +216,15 @@ class Loop(Module):
         super(Loop, self)._clear()
 
     def main_loop(self):
+        if self._executor is not None:
+            if not self._ended:
+                self._executor.start()
+            return
+        self._iterate()
+        if not self._ended:
+            self.timer.start()
+
+    def _iterate(self):
         try:
             try:
                 self.loop()
@@ -87,8 +240,6 @@ class Loop(Module):
             self._logger.error("Error in main_loop of %s: %s", self.name, e)
         # increment counter
         self.n += 1
-        if not self._ended:
-            self.timer.start()
 
     def setup_loop(self):
         """ put your initialization routine here"""
@@ -96,6 +247,8 @@ class Loop(Module):
 
     def pause_loop(self):
         self._ended = True
+        if self._executor is not None:
+            self._executor.stop()
 
     def start_loop(self):
         self._ended = False
@@ -132,11 +285,16 @@ class PlotWindow(object):
     append(color=value) adds new data to the plot for
     color in (red, green).
 
+    At most max_points points are kept per curve. Beyond, the older points
+    are thinned out if decimate is True, or dropped otherwise (see
+    StripChart). The plot is redrawn at most once per display frame.
+
     close() closes the plot"""
-    def __init__(self, title="plotwindow"):
+    def __init__(self, title="plotwindow", max_points=2**16, decimate=True):
         self.win = pg.GraphicsLayoutWidget(title=title)
         self.pw = self.win.addPlot()
-        self.curves = {}
+        self.strip_charts = StripChartCurves(self.pw, max_points, decimate)
+        self.curves = self.strip_charts.curves
         self.win.show()
         self.plot_start_time = time()
 
@@ -149,7 +307,7 @@ class PlotWindow(object):
         # former, now almost deprecated version:
             append(0.5, 0.6)
         """
-        for k in kwargs.keys():
+        for k in list(kwargs.keys()):
             v = kwargs.pop(k)
             kwargs[k[0]] = v
         i=0
@@ -158,19 +316,10 @@ class PlotWindow(object):
                 i += 1
             kwargs[self._defaultcolors[i]] = value
         t = time()-self.plot_start_time
-        for color, value in kwargs.items():
-            if value is not None:
-                if not color in self.curves:
-                    self.curves[color] = self.pw.plot(pen=color)
-                curve = self.curves[color]
-                x, y = curve.getData()
-                if x is None or y is None:
-                    x, y = np.array([t]), np.array([value])
-                else:
-                    x, y = np.append(x, t), np.append(y, value)
-                curve.setData(x, y)
+        self.strip_charts.append(t, **kwargs)
 
     def close(self):
+        self.strip_charts.stop()
         self.win.close()
 
 
@@ -186,9 +335,16 @@ class PlotLoop(Loop):
             self.plotter = None
         if self.plot and self.plotter is None:
             self.plot = PlotWindow(title=self.name)
+        self._pending_points = []  # points appended in the worker thread
         super(PlotLoop, self).__init__(*args, **kwargs)
 
     def plotappend(self, *args, **kwargs):
+        if self.threaded and self._executor.in_worker_thread():
+            # plots must only be changed from the GUI thread
+            with self._post_lock:
+                self._pending_points.append((args, kwargs))
+            self._post_latest('plot', self._plot_pending_points)
+            return
         if self.plot:
             if self.plotter is not None:
                 setattr(self.parent, self.plotter, (args, kwargs))
@@ -199,6 +355,12 @@ class PlotLoop(Loop):
                     self._logger.error("Error occured during plotting in Loop %s: %s",
                                        self.name, e)
 
+    def _plot_pending_points(self):
+        with self._post_lock:
+            points, self._pending_points = self._pending_points, []
+        for args, kwargs in points:
+            self.plotappend(*args, **kwargs)
+
     def _clear(self):
         super(PlotLoop, self)._clear()
         if hasattr(self, 'plot') and hasattr(self.plot, 'close'):
@@ -15,6 +15,8 @@ from ..modules import SignalModule
 from ..acquisition_module import AcquisitionModule
 from ..widgets.module_widgets import NaWidget
 from ..hardware_modules.iq import Iq
+from .module_managers import InsufficientResourceError
+from ..pyrpl_utils import TransferFunctionCache
 
 # timeit.default_timer() is THE precise timer to use (microsecond precise vs
 # milliseconds for time.time()). see
@@ -94,8 +96,28 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
           na.setup(start=100, stop=1000, ...)
           for freq, response, amplitude in na.values():
               print response
+
+    With parallel_iqs > 1, the sweep is split into contiguous blocks of
+    frequencies, and free iq modules measure one point of each block
+    simultaneously. The tones must be separated by at least
+    PARALLEL_MIN_SEPARATION times rbw, and their summed amplitude must
+    not exceed 1 V, which limits the number of modules actually used.
+    During the first trace, the points that are not yet measured are NaN.
+
+    With adaptive = True, the first trace starts from a coarse grid of
+    ADAPTIVE_COARSE_POINTS frequencies and then measures the midpoints of
+    all intervals where the response deviates from the interpolation of
+    the neighbouring points by more than adaptive_tolerance (relative to
+    the response, which covers magnitude and phase), until points
+    frequencies are measured. Further traces average on the same
+    non-uniform grid.
     """
     AUTO_AMP_AVG = 20
+    PARALLEL_MIN_SEPARATION = 20
+    ADAPTIVE_COARSE_POINTS = 31
+    # deviations are computed relative to at least this fraction of the
+    # largest measured response, such that noise does not attract points
+    ADAPTIVE_NOISE_FLOOR = 1e-3
     _widget_class = NaWidget
     _gui_attributes = ["input",
                        "output_direct",
@@ -104,9 +126,12 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                        "stop_freq",
                        "rbw",
                        "average_per_point",
+                       "parallel_iqs",
                        "points",
                        "amplitude",
                        "logscale",
+                       "adaptive",
+                       "adaptive_tolerance",
                        "auto_bandwidth",
                        "q_factor_min",
                        "auto_amplitude",
@@ -156,7 +181,20 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                                     max=1,
                                     call_setup=True)
     points = IntProperty(min=1, max=1e8, default=1001, call_setup=True)
+    parallel_iqs = IntProperty(min=1, max=3, default=1, call_setup=True,
+                               doc="maximum number of iq modules that "
+                                   "measure points simultaneously")
     logscale = LogScaleProperty(default=True, call_setup=True)
+    adaptive = BoolProperty(default=False, call_setup=True,
+                            doc="refine the frequency grid where the "
+                                "response varies, using at most 'points' "
+                                "points")
+    adaptive_tolerance = FloatProperty(default=0.05, min=1e-6, max=1.,
+                                       call_setup=True,
+                                       doc="relative deviation from the "
+                                           "interpolation of neighbouring "
+                                           "points above which an adaptive "
+                                           "sweep is refined")
     acbandwidth = NaAcBandwidth(
         default=50.0,
         doc="Bandwidth of the input high-pass filter of the na.",
@@ -168,6 +206,8 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         self._current_bandwidth = -1
         self.measured_time_per_point = np.nan
         self.amplitude_list = None
+        self._sweep_iqs = None  # iq modules of a parallel sweep
+        self._tf_cache = TransferFunctionCache()
         #self._data_x = None
         super(NetworkAnalyzer, self).__init__(parent, name=name)
 
@@ -263,6 +303,17 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         # add delay from phase (incorrect formula or missing effect...)
         return tf
 
+    def _transfer_function_values(self):
+        """
+        transfer_function(self.frequencies), cached as long as the
+        frequencies and the iq input filter do not change.
+        """
+        key = (self.iq.inputfilter,
+               self.iq._frequency_correction,
+               self.frequencies.tobytes())
+        return self._tf_cache.get(
+            key, lambda: self.transfer_function(self.frequencies))
+
     def threshold_hook(self, current_val):  # goes in the module...
         """
         A convenience function to stop the run upon some condition
@@ -380,7 +431,14 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         # get the actual point's (discretized)
         # frequency
         # only one read operation per point
-        y = self.iq._nadata_total / self._cached_na_averages
+        return self._normalize_point(index, self.iq._nadata_total)
+
+    async def _get_point_async(self, index):
+        return self._normalize_point(index,
+                                     await self.iq._nadata_total_async())
+
+    def _normalize_point(self, index, nadata_total):
+        y = nadata_total / self._cached_na_averages
 
         tf = self._tf_values[index]
 
@@ -467,7 +525,7 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
             self.amplitude_list = self.iq.amplitude
         self._time_last_point = timeit.default_timer()
         # pre-calculate transfer_function values for speed
-        self._tf_values = self.transfer_function(self.frequencies)
+        self._tf_values = self._transfer_function_values()
         self.iq.on = True
         # Warn the user if time_per_point is too small:
         # < 1 ms measurement time will make acquisition inefficient.
@@ -484,6 +542,220 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         """
         self.iq.amplitude = 0
 
+    def _is_parallel_sweep(self):
+        """
+        Whether several iq modules may be used. Zero span, the automatic
+        bandwidth and amplitude adjustments and adaptive sweeps, whose
+        frequency grid changes during the first trace, require a sequential
+        sweep.
+        """
+        return self.parallel_iqs > 1 and not (self.is_zero_span() or
+                                              self.auto_bandwidth or
+                                              self.auto_amplitude or
+                                              self._is_adaptive_sweep())
+
+    def _n_parallel_iqs(self):
+        """
+        Largest number of simultaneous points, at most parallel_iqs, whose
+        tones are well separated and whose summed amplitude does not
+        saturate the output.
+        """
+        n = self.parallel_iqs
+        if self.amplitude > 0:
+            n = min(n, int(1.0 / self.amplitude))
+        frequencies = self.frequencies
+        points = len(frequencies)
+        while n > 1:
+            block = int(np.ceil(float(points) / n))
+            if block >= points:
+                break
+            separation = np.min(np.abs(frequencies[block:] -
+                                       frequencies[:-block]))
+            if separation >= self.PARALLEL_MIN_SEPARATION * self.rbw:
+                break
+            n -= 1
+        return max(n, 1)
+
+    def _start_parallel_trace_acquisition(self):
+        """
+        Sets up self.iq like for a sequential sweep, and as many additional
+        free iq modules as useful with the same settings.
+        """
+        self._start_trace_acquisition()
+        if self._sweep_iqs is None:
+            self._sweep_iqs = [self.iq]
+        n = self._n_parallel_iqs()
+        while len(self._sweep_iqs) < n:
+            try:
+                iq = self.pyrpl.iqs.pop(owner=self.name)
+            except InsufficientResourceError:
+                break
+            self._sweep_iqs.append(iq)
+        for iq in self._sweep_iqs[n:]:
+            self._release_iq(iq)
+        del self._sweep_iqs[max(n, 1):]
+        self._block_size = int(np.ceil(float(len(self.frequencies)) /
+                                       len(self._sweep_iqs)))
+        # each module is normalized with its own settings
+        self._iq_calibrations = []
+        for iq in self._sweep_iqs:
+            if iq is not self.iq:
+                iq.setup(frequency=self.frequencies[0],
+                         bandwidth=self.iq.bandwidth,
+                         gain=0,
+                         phase=0,
+                         acbandwidth=self.acbandwidth,
+                         input=self.input,
+                         output_direct=self.output_direct,
+                         output_signal='output_direct',
+                         amplitude=self.amplitude)
+                iq._na_averages = self.iq._na_averages
+                iq._na_sleepcycles = self.iq._na_sleepcycles
+                iq.on = True
+            amp = iq.amplitude
+            self._iq_calibrations.append(
+                self._rescale / iq._na_averages / (amp if amp != 0 else 1.0))
+        self._time_last_point = timeit.default_timer()
+
+    def _release_iq(self, iq):
+        iq.amplitude = 0
+        if iq is not self.iq:
+            self.pyrpl.iqs.free(iq)
+
+    def _is_adaptive_sweep(self):
+        """
+        Whether the frequency grid is refined during the first trace. The
+        automatic bandwidth and amplitude adjustments assume a monotonic
+        sweep and cannot be combined with it.
+        """
+        return self.adaptive and not (self.is_zero_span() or
+                                      self.auto_bandwidth or
+                                      self.auto_amplitude)
+
+    def _refinement_frequencies(self):
+        """
+        Midpoints of the intervals of the current grid where the response
+        deviates from the interpolation of the neighbouring points by more
+        than adaptive_tolerance, sorted by decreasing deviation. Intervals
+        that cannot be split at the iq frequency resolution are skipped.
+        """
+        f, y = self._frequencies, self.data_avg
+        if len(f) < 3:
+            return []
+        x = np.log(f) if self.logscale else f
+        weight = (x[1:-1] - x[:-2]) / (x[2:] - x[:-2])
+        interpolation = y[:-2] + weight * (y[2:] - y[:-2])
+        scale = np.maximum(np.abs(y[1:-1]),
+                           self.ADAPTIVE_NOISE_FLOOR * np.max(np.abs(y)))
+        deviation = np.abs(y[1:-1] - interpolation) / scale
+        # each interval inherits the deviation of its worst end point
+        interval_deviation = np.zeros(len(f) - 1)
+        interval_deviation[:-1] = deviation
+        interval_deviation[1:] = np.maximum(interval_deviation[1:], deviation)
+        frequency_property = self.iq.__class__.frequency
+        new_frequencies = []
+        for i in np.argsort(-interval_deviation):
+            if not interval_deviation[i] > self.adaptive_tolerance:
+                break
+            if self.logscale:
+                midpoint = np.sqrt(f[i] * f[i + 1])
+            else:
+                midpoint = 0.5 * (f[i] + f[i + 1])
+            midpoint = frequency_property.validate_and_normalize(self,
+                                                                 midpoint)
+            if midpoint != f[i] and midpoint != f[i + 1]:
+                new_frequencies.append(midpoint)
+        return new_frequencies
+
+    async def _refine_trace_async(self, min_delay_ms):
+        """
+        Inserts and measures new points into the grid of the first trace
+        until the tolerance or the number of points is reached.
+        """
+        new_frequencies = self._refinement_frequencies()
+        while new_frequencies and len(self._frequencies) < self.points:
+            for frequency in new_frequencies:
+                if len(self._frequencies) >= self.points:
+                    break
+                if self.running_state in ["paused_continuous",
+                                          "paused_single"]:
+                    await self._resume_event.wait()
+                    self.iq.amplitude = self.amplitude
+                # keep the grid sorted in the sweep direction
+                direction = 1 if self._frequencies[-1] >= \
+                                 self._frequencies[0] else -1
+                index = int(np.searchsorted(direction * self._frequencies,
+                                            direction * frequency))
+                self._frequencies = np.insert(self._frequencies, index,
+                                              frequency)
+                self.data_x = self._frequencies
+                self._tf_values = np.insert(
+                    self._tf_values, index,
+                    self.transfer_function([frequency])[0])
+                y, amp = await self._point_async(index, min_delay_ms)
+                self.data_avg = np.insert(self.data_avg, index, y)
+                self.current_point += 1
+                self._emit_signal_by_name("update_point", index)
+            new_frequencies = self._refinement_frequencies()
+
+    async def _parallel_trace_async(self, min_delay_ms):
+        """
+        Sweeps with several iq modules. At step j, module k measures point
+        k * block_size + j, such that current_point counts the steps.
+        """
+        if self.current_point == 0:
+            self._start_parallel_trace_acquisition()
+            if self.current_avg == 0:  # points of the blocks not yet measured
+                self.data_avg[:] = np.nan
+        else:
+            for iq in self._sweep_iqs:  # go from pause to resume
+                iq.amplitude = self.amplitude
+        iqs, block = self._sweep_iqs, self._block_size
+        operations = [('r', iq._addr_base + 0x140, 4) for iq in iqs]
+        while self.current_point < block:
+            if self._last_time_benchmark is not None:
+                new_time = timeit.default_timer()
+                self.measured_time_per_point = \
+                    (new_time - self._last_time_benchmark) / len(iqs)
+            self._last_time_benchmark = timeit.default_timer()
+            if self.running_state in ["paused_continuous", "paused_single"]:
+                await self._resume_event.wait()
+                for iq in iqs:
+                    iq.amplitude = self.amplitude
+            indices = [k * block + self.current_point
+                       for k in range(len(iqs))]
+            with self.iq._deferred_writes():
+                for iq, index in zip(iqs, indices):
+                    if index < len(self.frequencies):
+                        iq.frequency = self.frequencies[index]
+            self._time_last_point = timeit.default_timer()
+            await self._data_ready_async(min_delay_ms)
+            # all modules are read in a single request
+            results = await self.iq._transact_async(operations,
+                                                    addAddressBase=False)
+            for iq, index, raw, calibration in zip(iqs, indices, results,
+                                                   self._iq_calibrations):
+                if index >= len(self.frequencies):
+                    continue
+                if any(int(v) >> 31 for v in raw):
+                    total = await iq._nadata_total_async()
+                else:
+                    total = iq._nadata_from_raw(*raw)
+                y = total * calibration / self._tf_values[index]
+                if self.current_avg == 0:
+                    self.data_avg[index] = y
+                else:
+                    self.data_avg[index] = (self.data_avg[index] *
+                                            self.current_avg + y) / \
+                                           (self.current_avg + 1)
+            self.current_point += 1
+            self._emit_signal_by_name("update_point",
+                                      self.last_measured_point)
+        self.current_avg = min(self.current_avg + 1, self.trace_average)
+        self._emit_signal_by_name("scan_finished")
+        self.current_point = 0
+        return self.data_avg
+
     def _data_ready(self):
         return self._remaining_time()<=0
 
@@ -492,14 +764,16 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
             await self._resume_event.wait()
         await self._start_point_acquisition(index)
         await self._data_ready_async(min_delay_ms)
-        return self._get_point(index)
+        return await self._get_point_async(index)
 
     async def _trace_async(self, min_delay_ms):
+        if self._is_parallel_sweep():
+            return await self._parallel_trace_async(min_delay_ms)
         if self.current_point==0:
             self._start_trace_acquisition()
         else:
             self.iq.amplitude = self.amplitude # go from pause to resume
-        while (self.current_point<self.points):
+        while (self.current_point<len(self.frequencies)):
             if self._last_time_benchmark is not None:
                 new_time = timeit.default_timer()
                 self.measured_time_per_point = \
@@ -520,6 +794,8 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
             self.data_avg[self.current_point] = (self.data_avg[self.current_point]*(self.current_avg) \
                                  + y)/(self.current_avg + 1)
             self.current_point+=1
+        if self.current_avg == 0 and self._is_adaptive_sweep():
+            await self._refine_trace_async(min_delay_ms)
         self.current_avg = min(self.current_avg + 1, self.trace_average)
         self._emit_signal_by_name("scan_finished")
         self.current_point = 0
@@ -565,16 +841,19 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
                                                 self.start_freq)*np.ones(
                                                                 self.points)
 
+        points = self.points
+        if self._is_adaptive_sweep():  # coarse grid, refined during the sweep
+            points = min(points, self.ADAPTIVE_COARSE_POINTS)
         if self.logscale:
             raw_values = np.logspace(
                 np.log10(self.start_freq),
                 np.log10(self.stop_freq),
-                         self.points,
+                         points,
                          endpoint=True)
         else:
             raw_values = np.linspace(self.start_freq,
                                self.stop_freq,
-                               self.points,
+                               points,
                                endpoint=True)
         values = np.zeros(len(raw_values))
         for index, val in enumerate(raw_values):
@@ -596,30 +875,56 @@ class NetworkAnalyzer(AcquisitionModule, SignalModule):
         super(NetworkAnalyzer, self)._prepare_averaging()
         self._last_time_benchmark = None
         self.current_point = 0
+        if self._is_adaptive_sweep():
+            self._frequencies = None  # start again from the coarse grid
         self.data_x = self.frequencies if not self.is_zero_span() else \
             np.nan*np.ones(self.points) # Will be filled during acquisition
-        self.data_avg = np.zeros(self.points,      # np.empty can create nan
+        self.data_avg = np.zeros(len(self.data_x), # np.empty can create nan
                                  dtype=np.complex) #and nan*current_avg = nan
                                                    # even if current_avg = 0
 
     @property
     def last_valid_point(self):
         if self.current_avg>=1:
-            return self.points - 1
+            return len(self.data_avg) - 1
         else:
             return self.current_point
 
     def _setup(self):
         #self._update_data_x()  # precalculate frequency values
         self._frequencies = None # forget precalculated frequencies
+        self._tf_cache.clear()
         super(NetworkAnalyzer, self)._setup()
 
     # overwrite default behavior to return only valid points
 
     def _free_up_resources(self):
         self.iq.amplitude = 0
+        if self._sweep_iqs is not None:
+            for iq in self._sweep_iqs:
+                iq.amplitude = 0
+            if self.running_state not in ["paused_continuous",
+                                          "paused_single"]:
+                for iq in self._sweep_iqs:
+                    self._release_iq(iq)
+                self._sweep_iqs = None
 
     @property
     def last_valid_point(self):
-        return self.current_point if \
-            self.current_avg<=1 else self.points
+        if self.current_avg > 1:
+            return len(self.data_avg)
+        return self.last_measured_point + 1
+
+    @property
+    def last_measured_point(self):
+        """
+        Index of the point measured last in the current trace (-1 before
+        the first point). In a parallel sweep, this is the point of the
+        last block.
+        """
+        if self.current_point == 0:
+            return -1
+        if self._is_parallel_sweep() and self._sweep_iqs is not None:
+            return min((len(self._sweep_iqs) - 1) * self._block_size +
+                       self.current_point, len(self.data_avg)) - 1
+        return self.current_point - 1
@@ -0,0 +1,238 @@
+"""
+Telemetry of the peak detectors of a ScanningCavity.
+
+The scope of every RedPitaya finds the peaks of each scan in the FPGA. A
+:class:`PeakTelemetry` reads the position, height and valid flag of all
+peaks, together with the integrator values of the pids that lock them, once
+per scan period. The reads of each board are grouped in a single client
+transaction and the boards are read concurrently (see DeviceSession), such
+that the sample rate is limited by the scan frequency rather than by the
+number of registers or boards.
+
+Samples are kept in a ring buffer and, optionally, streamed to a binary file
+in chunks of CHUNK_LENGTH samples. The file starts with a one-line json
+header, followed by the samples as little-endian float64 rows::
+
+    telemetry = p.scanningCavity.telemetry
+    telemetry.start('drift.bin')
+    ...
+    telemetry.stop()
+    columns, data = load_telemetry('drift.bin')
+    mainL_position = data[:, columns.index('mainL_position')]
+"""
+import json
+import logging
+import numpy as np
+from ..async_utils import ensure_future, wait, sleep_async
+from ..pyrpl_utils import time, RingBuffer
+from ..device_session import DeviceSession
+
+logger = logging.getLogger(name=__name__)
+
+# register map of the peak detector results, see red_pitaya_scope.v
+PEAKS_ADDRESS = 0xA4  # first word of the results
+PEAKS_LENGTH = 25  # words up to the index of the last normalizable peak
+NORMALIZE_WORD = 5  # word 0xB8: normalizeIndex flags of the extra peaks
+TRIGGER_TIMESTAMP_ADDRESS = 0x164
+CLOCK_PERIOD = 8e-9
+FILE_DTYPE = '<f8'
+
+
+def decode_peaks(words, sampling_time):
+    """
+    Decodes the words read at PEAKS_ADDRESS of a scope into the arrays
+    (positions, heights, valid) of its peaks, in the order of peak.index.
+
+    Positions are given in seconds after the trigger. The index of a
+    normalized peak, which the FPGA expresses as a fraction of the distance
+    between the main peaks of the same board, is converted to seconds as
+    well.
+    """
+    words = np.asarray(words, dtype=np.int64)
+    # the main peaks share one word, the extra peaks use 5 words each
+    values = np.concatenate(([words[0] & 0x7FFF, (words[0] >> 16) & 0x7FFF],
+                             words[8::5] & 0x7FFF))
+    indexes = np.concatenate((words[1:3], words[9::5])) & 0x3FFF
+    heights = values & 0x3FFF
+    heights = (heights - ((heights >> 13) << 14)) / 2.**13
+    valid = (values >> 14) & 1
+    positions = indexes * sampling_time
+    normalized = (words[NORMALIZE_WORD] >> np.arange(len(indexes) - 2)) & 1
+    normalized = np.concatenate(([False, False], normalized.astype(bool)))
+    positions[normalized] = positions[0] + indexes[normalized] / 2.**14 \
+                            * (positions[1] - positions[0])
+    return positions, heights, valid
+
+
+class PeakTelemetry(object):
+    """
+    Records the peak detector results of all pitayas of a ScanningCavity.
+
+    Each sample is a row of columns: 'time', the FPGA timestamp of the
+    trigger of the main pitaya in seconds, followed by '<peak>_position',
+    '<peak>_height', '<peak>_valid' and '<peak>_ival' for each used peak.
+    The peaks and their pitayas are those of the cavity when start() is
+    called.
+    """
+    BUFFER_LENGTH = 2**16  # samples kept in memory
+    CHUNK_LENGTH = 2**10  # samples written to the file at once
+
+    def __init__(self, scanning_cavity):
+        self.scanning_cavity = scanning_cavity
+        self.buffer = None
+        self.filename = None
+        self._file = None
+        self._written = 0  # samples of the buffer written to the file
+        self._boards = []
+        self._columns = []
+        self._last_timestamp = None
+        self._task = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    @property
+    def columns(self):
+        """ names of the columns of the samples """
+        return list(self._columns)
+
+    @property
+    def data(self):
+        """ samples in the ring buffer, in chronological order """
+        if self.buffer is None:
+            return np.zeros((0, len(self._columns)))
+        return self.buffer.data
+
+    @property
+    def scan_period(self):
+        """ period of the ramp that triggers the peak detection [s] """
+        frequency = self.scanning_cavity.piezoAsg.frequency
+        if frequency > 0:
+            return 1. / frequency
+        return self.scanning_cavity.mainPitaya.scope.duration
+
+    def _prepare(self):
+        """ gathers the registers to read on each board """
+        cavity = self.scanning_cavity
+        self._boards, self._columns = [], ['time']
+        for pitaya in cavity.usedPitayas:
+            scope = pitaya.scope
+            peaks = [p for p in cavity.usedPeaks if p.redpitaya == pitaya]
+            operations = [
+                ('r', scope._absolute_address(PEAKS_ADDRESS), PEAKS_LENGTH),
+                ('r', scope._absolute_address(TRIGGER_TIMESTAMP_ADDRESS), 2)]
+            operations += [('r', type(p.pid).ival.words(p.pid)[0][0], 1)
+                           for p in peaks]
+            self._boards.append((scope, operations,
+                                 [(p.index, p.pid) for p in peaks],
+                                 scope.sampling_time))
+            for p in peaks:
+                self._columns += [p.name + '_position', p.name + '_height',
+                                  p.name + '_valid', p.name + '_ival']
+        self._last_timestamp = None
+
+    async def read_sample_async(self):
+        """
+        Reads the peaks of all boards concurrently and returns the sample,
+        or None if the main pitaya has not been triggered since the last
+        sample.
+        """
+        if not self._boards:
+            self._prepare()
+        results = await DeviceSession.gather_async(
+            [scope._transact_async(operations, addAddressBase=False)
+             for scope, operations, _, _ in self._boards])
+        timestamp = int(results[0][1][0]) + (int(results[0][1][1]) << 32)
+        if timestamp == self._last_timestamp:
+            return None
+        self._last_timestamp = timestamp
+        sample = [timestamp * CLOCK_PERIOD]
+        for (_, _, peaks, sampling_time), result in zip(self._boards,
+                                                        results):
+            positions, heights, valid = decode_peaks(result[0],
+                                                     sampling_time)
+            for (index, pid), words in zip(peaks, result[2:]):
+                ival = type(pid).ival.words_to_python(pid, words)
+                sample += [positions[index], heights[index], valid[index],
+                           ival]
+        return np.array(sample)
+
+    def read_sample(self):
+        """ blocking version of read_sample_async """
+        return wait(ensure_future(self.read_sample_async()))
+
+    def start(self, filename=None):
+        """
+        Starts recording one sample per scan. If filename is given, the
+        samples are also streamed to this file, which is overwritten.
+        """
+        self.stop()
+        self._prepare()
+        self.buffer = RingBuffer(self.BUFFER_LENGTH, len(self._columns))
+        self._written = 0
+        self.filename = filename
+        if filename is not None:
+            self._file = open(filename, 'wb')
+            header = dict(columns=self._columns, dtype=FILE_DTYPE)
+            self._file.write((json.dumps(header) + '\n').encode('utf-8'))
+        self._running = True
+        self._task = ensure_future(self._run_async())
+
+    def stop(self):
+        """ stops the recording and writes the remaining samples """
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._close_file()
+
+    async def _run_async(self):
+        next_tick = time()
+        while self._running:
+            try:
+                sample = await self.read_sample_async()
+            except Exception as e:
+                logger.error("Peak telemetry stopped: %s", e)
+                self._running = False
+                self._task = None
+                self._close_file()
+                break
+            if sample is not None:
+                self.buffer.append(sample)
+                if self.buffer.count - self._written >= self.CHUNK_LENGTH:
+                    self._flush()
+            # fixed rate on the monotonic clock, without trying to catch
+            # up with ticks that were missed because the reads took too long
+            next_tick = max(next_tick + self.scan_period, time())
+            await sleep_async(next_tick - time())
+
+    def _close_file(self):
+        """ writes the remaining samples and closes the file """
+        self._flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _flush(self):
+        """ appends the samples that were not yet written to the file """
+        if self._file is None or self.buffer is None:
+            return
+        if self.buffer.count - self._written > self.buffer.capacity:
+            logger.warning("Peak telemetry: %d samples were overwritten "
+                           "before being saved.", self.buffer.count
+                           - self._written - self.buffer.capacity)
+        samples = self.buffer.since(self._written)
+        self._file.write(samples.astype(FILE_DTYPE).tobytes())
+        self._file.flush()
+        self._written = self.buffer.count
+
+
+def load_telemetry(filename):
+    """ returns (columns, data) of a file written by PeakTelemetry """
+    with open(filename, 'rb') as f:
+        header = json.loads(f.readline().decode('utf-8'))
+        data = np.frombuffer(f.read(), dtype=header['dtype'])
+    columns = header['columns']
+    return columns, data.reshape(-1, len(columns))
@@ -0,0 +1,285 @@
+"""
+Records register values and DSP signals to disk at a fixed rate.
+
+A Recorder reads a list of signals once per tick. All reads of one board are
+executed in a single client transaction, together with the FPGA counter
+current_timestamp of the board, such that each tick carries the time at
+which the values were read in the FPGA rather than the time of the host.
+The ticks are scheduled on the monotonic clock by a LoopExecutor (see
+loop.py), such that a busy GUI does not affect the rate and the recorder
+does not block the GUI.
+
+The most recent ticks are kept in a ring buffer (see data). When a filename
+is given, every CHUNK_LENGTH ticks are handed to a background writer thread,
+which appends them as a compressed array to a zip archive in the npz format.
+Memory use therefore does not depend on the duration of the recording::
+
+    recorder = Recorder(p.rp, signals=['in1', 'pid0', 'pid0.ival',
+                                       (p.rp.pid1, 'setpoint')],
+                        rate=1000., filename='drift.npz')
+    recorder.start()
+    ...
+    recorder.stop()
+    columns, data = load_recording('drift.npz')
+
+Signals can be given as DSP signal names ('in1', 'pid0', ...), which are
+read from the sampler, as the path of an attribute ('pid0.ival'), as a
+(module, attribute name) tuple, or as a module, whose output signal is
+recorded. Only attributes whose value is decoded from the words they occupy
+(e.g. plain registers, the integrator of a pid) can be recorded.
+"""
+import logging
+import queue
+import threading
+import zipfile
+import numpy as np
+from ..modules import Module
+from ..attributes import BaseRegister, LongRegister
+from ..hardware_modules.pid import IValAttribute
+from ..hardware_modules.dsp import DSP_INPUTS
+from ..pyrpl_utils import recursive_getattr, RingBuffer
+from .loop import LoopExecutor
+
+logger = logging.getLogger(name=__name__)
+
+# getters that return words_to_python of the words of the attribute
+_RECORDABLE_GETTERS = (BaseRegister.get_value, LongRegister.get_value,
+                       IValAttribute.get_value)
+
+
+class ChunkWriter(object):
+    """
+    Appends arrays as compressed chunks to an npz file, in a background
+    thread.
+
+    The file can be read with load_recording(), or with np.load(), which
+    returns the arrays 'columns' and 'chunk00000000', 'chunk00000001', ...
+    Every chunk is a complete zip member, such that the chunks written
+    before a crash remain readable.
+    """
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.n_chunks = 0
+        with zipfile.ZipFile(filename, 'w') as archive:
+            self._write_array(archive, 'columns', np.array(columns))
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work,
+                                        name='ChunkWriter', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _write_array(archive, name, array):
+        with archive.open(name + '.npy', 'w') as f:
+            np.lib.format.write_array(f, np.asanyarray(array),
+                                      allow_pickle=False)
+
+    def write(self, chunk):
+        """ queues chunk (an array) to be appended to the file """
+        self._queue.put(chunk)
+
+    def close(self):
+        """ writes the queued chunks and stops the thread """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _work(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            try:
+                with zipfile.ZipFile(self.filename, 'a',
+                                     compression=zipfile.ZIP_DEFLATED) \
+                        as archive:
+                    self._write_array(archive, 'chunk%08d' % self.n_chunks,
+                                      chunk)
+                self.n_chunks += 1
+            except Exception as e:
+                logger.error("Could not write to %s: %s", self.filename, e)
+
+
+def load_recording(filename):
+    """ returns (columns, data) of a file written by a Recorder """
+    with np.load(filename, allow_pickle=False) as f:
+        columns = [str(column) for column in f['columns']]
+        chunks = [f[name] for name in sorted(f.files)
+                  if name.startswith('chunk')]
+    if not chunks:
+        return columns, np.zeros((0, len(columns)))
+    return columns, np.concatenate(chunks)
+
+
+class Recorder(Module):
+    """
+    Records signals at a fixed rate (see the module docstring).
+
+    parent: RedPitaya (or Pyrpl instance) on which signal names are looked
+    up. Signals given as modules or (module, attribute name) may belong to
+    other boards; their reads are grouped per board. The boards must use a
+    synchronous client, which the thread of the recorder can block on.
+
+    The columns of the samples are 'time', the current_timestamp of the
+    first board in seconds, followed by one column per signal.
+    """
+    CHUNK_LENGTH = 1000  # ticks per chunk of the file
+    BUFFER_LENGTH = 10000  # ticks kept in memory, at least CHUNK_LENGTH
+
+    def __init__(self, parent, name='recorder', signals=(), rate=100.,
+                 filename=None, autostart=False):
+        super(Recorder, self).__init__(parent, name=name)
+        self.signals = list(signals)
+        self.rate = rate  # ticks per second
+        self.filename = filename
+        self.buffer = None
+        self._boards = []
+        self._columns = []
+        self._writer = None
+        self._written = 0
+        self._executor = None
+        if autostart:
+            self.start()
+
+    @property
+    def running(self):
+        return self._executor is not None and self._executor.running
+
+    @property
+    def missed_ticks(self):
+        """ ticks skipped because the reads took too long """
+        return 0 if self._executor is None else self._executor.missed
+
+    @property
+    def statistics(self):
+        """ timing statistics of the recording (see LoopExecutor) """
+        return None if self._executor is None else self._executor.statistics
+
+    @property
+    def columns(self):
+        """ names of the columns of the samples """
+        return list(self._columns)
+
+    @property
+    def data(self):
+        """ most recent samples, in chronological order """
+        if self.buffer is None:
+            return np.zeros((0, len(self._columns)))
+        return self.buffer.data
+
+    def _default_redpitaya(self):
+        rp = getattr(self.parent, 'rp', None)  # parent is a Pyrpl instance
+        if rp is None:
+            rp = self.redpitaya
+        return rp
+
+    def _resolve(self, signal):
+        """ returns (module, column name, attribute) of a signal """
+        if isinstance(signal, tuple):
+            module, name = signal
+        elif isinstance(signal, Module):  # the output signal of a module
+            module, name = signal._rp.sampler, signal.name
+        elif '.' in signal:
+            path, name = signal.rsplit('.', 1)
+            module = recursive_getattr(self._default_redpitaya(), path)
+        elif signal in DSP_INPUTS:
+            module, name = self._default_redpitaya().sampler, signal
+        else:
+            raise ValueError("Unknown signal %s. Use a DSP signal name or "
+                             "the path of a register, e.g. 'pid0.ival'."
+                             % signal)
+        attribute = getattr(type(module), name, None)
+        if attribute is None or not hasattr(attribute, 'words_to_python') \
+                or type(attribute).get_value not in _RECORDABLE_GETTERS:
+            raise ValueError("Attribute %s of module %s cannot be recorded "
+                             "in a transaction." % (name, module.name))
+        column = name if module.name == 'sampler' \
+            else module.name + '.' + name
+        return module, column, attribute
+
+    def _prepare(self):
+        """ groups the reads of all signals by board """
+        boards = {}  # redpitaya: (module, operations, decoders, columns)
+        for signal in self.signals:
+            module, column, attribute = self._resolve(signal)
+            rp = module._rp
+            if hasattr(rp.scope._client, 'transact_async'):
+                # the thread of the recorder would have to wait for the
+                # event loop, which may be busy or not running at all
+                raise ValueError("Signal %s of %s cannot be recorded with an "
+                                 "asynchronous client. Use a RedPitaya with "
+                                 "async_client=False." % (signal, rp.name))
+            if rp not in boards:
+                timestamp = type(rp.scope).current_timestamp
+                boards[rp] = (rp.scope, [('r', timestamp.words(rp.scope)[0][0],
+                                          timestamp.size)], [], [])
+            _, operations, decoders, columns = boards[rp]
+            words = attribute.words(module)
+            operations.append(('r', words[0][0], len(words)))
+            decoders.append((attribute, module))
+            columns.append(column)
+        self._boards = list(boards.values())
+        self._columns = ['time']
+        for rp, (_, _, _, columns) in zip(boards, self._boards):
+            if len(self._boards) > 1:
+                columns = [rp.name + '.' + column for column in columns]
+            self._columns += columns
+
+    def read_sample(self):
+        """ reads all signals once and returns the sample """
+        if not self._boards:
+            self._prepare()
+        sample = []
+        for module, operations, decoders, _ in self._boards:
+            results = module._transact(operations, addAddressBase=False)
+            if not sample:
+                timestamp = int(results[0][0]) + (int(results[0][1]) << 32)
+                sample.append(8e-9 * timestamp)
+            for (attribute, obj), words in zip(decoders, results[1:]):
+                sample.append(attribute.words_to_python(obj, words))
+        return np.array(sample, dtype=float)
+
+    def start(self):
+        """
+        Starts recording. If self.filename is not None, the file is
+        overwritten.
+        """
+        self.stop()
+        self._prepare()
+        self.buffer = RingBuffer(max(self.BUFFER_LENGTH, self.CHUNK_LENGTH),
+                                 len(self._columns))
+        self._written = 0
+        if self.filename is not None:
+            self._writer = ChunkWriter(self.filename, self._columns)
+        self._executor = LoopExecutor(self._tick, 1. / self.rate,
+                                      name=self.name)
+        self._executor.start()
+
+    def stop(self):
+        """ stops recording and writes the remaining samples """
+        if self._executor is not None:
+            self._executor.stop()
+        if self._writer is not None:
+            self._write_chunk()
+            self._writer.close()
+            self._writer = None
+
+    def _tick(self):
+        try:
+            sample = self.read_sample()
+        except Exception as e:
+            self._logger.error("Recorder %s stopped: %s", self.name, e)
+            self._executor.stop()
+            return
+        self.buffer.append(sample)
+        if self._writer is not None and \
+                self.buffer.count - self._written >= self.CHUNK_LENGTH:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        chunk = self.buffer.since(self._written)
+        self._written = self.buffer.count
+        if len(chunk):
+            self._writer.write(chunk)
+
+    def _clear(self):
+        self.stop()
+        super(Recorder, self)._clear()
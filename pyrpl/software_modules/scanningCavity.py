@@ -26,6 +26,8 @@ from ..hardware_modules.asg import Asg0
 from ..hardware_modules.pid import Pid
 from ..hardware_modules.hk import HK
 from ..hardware_modules.dsp import DSP_TRIGGERS
+from ..device_session import DeviceSession
+from .peak_telemetry import PeakTelemetry
 from ..widgets.module_widgets.scanCavity_widget import ScanCavity_widget, peak_widget, secondaryPitaya_widget
 
 
@@ -661,6 +663,8 @@ class ScanningCavity(AcquisitionModule):
 		self.secondaryPeaks = []
 		self.usedPitayas = []
 		self.secondaryPitayas = []
+		self.traces = OrderedDict()  # last averaged scope trace of each used pitaya
+		self.telemetry = PeakTelemetry(self)  # records the peak detectors once per scan
 		pitayas = list(parent.rps.values())
 		self.setMainPitaya(pitayas[0])
 		for i in range(1, len(pitayas)):
@@ -806,14 +810,37 @@ class ScanningCavity(AcquisitionModule):
 	def _is_rolling_mode_active(self):
 		return False
 
-	'''overwrite of asynchronous functions. They are almost identical to their original versions (defined inside AcquisitionModule), but the actual acquisition is done by the scope module'''
+	'''overwrite of asynchronous functions. They are almost identical to their original versions (defined inside AcquisitionModule), but the actual acquisition is done by the scopes of all used pitayas, concurrently'''
+	@property
+	def session(self):
+		'''DeviceSession of the used pitayas, the main pitaya first'''
+		return DeviceSession(self.usedPitayas)
+
+	def _prepare_all_scopes(self):
+		for scope in self.scopes:
+			scope._prepare_averaging()  # initializes the table scope.data_avg
+		self.traces = OrderedDict()
+
+	async def _average_traces_async(self, min_delay_s):
+		'''
+		acquires one trace per used pitaya in parallel (the secondary scopes being armed before the main scope, 
+		which triggers them), and averages each of them into the data_avg of its scope. 
+		The averaged traces are also available in self.traces, by pitaya name
+		'''
+		s : Scope = self.mainPitaya.scope
+		_, traces = await self.session.scope_traces_async(min_delay_s)
+		for pitaya, scope, trace in zip(self.usedPitayas, self.scopes, traces):
+			scope.current_avg = s.current_avg
+			scope.data_avg = (scope.data_avg * (s.current_avg - 1) + trace) / s.current_avg
+			self.traces[pitaya.name] = scope.data_avg
+		return s.data_avg
+
 	async def _continuous_async(self):
 		"""
 		Coroutine to launch a continuous acquisition.
 		"""
-		s : Scope = self.mainPitaya.scope
 		self._running_state = 'running_continuous'
-		s._prepare_averaging()  # initializes the table self.data_avg,
+		self._prepare_all_scopes()
 		await self._do_average_continuous_async()
 
 	async def _do_average_continuous_async(self):
@@ -829,10 +856,7 @@ class ScanningCavity(AcquisitionModule):
 			if self.running_state == 'paused_continuous':
 				await s._resume_event.wait()
 			s.current_avg = min(s.current_avg + 1, s.trace_average)
-			s.data_avg = (s.data_avg * (s.current_avg - 1) + \
-							 await s._trace_async(
-								 s.MIN_DELAY_CONTINUOUS_MS * 0.001)) / \
-							s.current_avg
+			await self._average_traces_async(s.MIN_DELAY_CONTINUOUS_MS * 0.001)
 			self._emit_signal_by_name('display_curve', [s.data_x,
 														s.data_avg])
 
@@ -840,9 +864,8 @@ class ScanningCavity(AcquisitionModule):
 		"""
 		Coroutine to launch the acquisition of a trace_average traces.
 		"""
-		s : Scope = self.mainPitaya.scope
 		self._running_state = 'running_single'
-		s._prepare_averaging()  # initializes the table self.data_avg,
+		self._prepare_all_scopes()
 		return await self._do_average_single_async()
 	
 	async def _do_average_single_async(self):
@@ -858,12 +881,12 @@ class ScanningCavity(AcquisitionModule):
 			s.current_avg+=1
 			if s.running_state=='paused_single':
 				await s._resume_event.wait()
-			s.data_avg = (s.data_avg * (s.current_avg-1) + \
-							 await s._trace_async(0)) / s.current_avg
+			await self._average_traces_async(0)
 			self._emit_signal_by_name('display_curve', [s.data_x,
 														s.data_avg])
 		self._running_state = 'stopped'
-		s._free_up_resources()
+		for scope in self.scopes:
+			scope._free_up_resources()
 		return s.data_avg
 	
 	def save_curve(self, *args):
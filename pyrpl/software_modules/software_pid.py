@@ -1,9 +1,21 @@
 from .loop import PlotLoop
 from ..attributes import *
 from ..modules import Module
+from ..redpitaya_client import AsyncMonitorClient
 import numpy as np
 
 class SoftwarePidLoop(PlotLoop):
+    """
+    The output computed in an iteration is written at the start of the
+    next iteration, in the same transaction as the read of the input. Each
+    iteration therefore takes a single network round trip, at the expense of
+    a delay of one interval between the input and the output.
+
+    The loop runs in a worker thread. There, the output and the integrator
+    are only written to the register or the property that holds them (see
+    _set); saving them to the config, updating the gui and calling setup()
+    is left to the GUI thread.
+    """
     @property
     def input(self):
         return recursive_getattr(self.parent, self.parent.input)
@@ -14,29 +26,58 @@ class SoftwarePidLoop(PlotLoop):
 
     @output.setter
     def output(self, value):
-        return recursive_setattr(self.parent, self.parent.output, value)
+        self._set(self.parent.output, value)
+
+    def _set(self, path, value):
+        """ sets the attribute at path (relative to the pid) to value """
+        if '.' in path:
+            path, name = path.rsplit('.', 1)
+            obj = recursive_getattr(self.parent, path)
+        else:
+            obj, name = self.parent, path
+        if not (self.threaded and self._executor.in_worker_thread()):
+            setattr(obj, name, value)
+            return
+        attribute = getattr(type(obj), name)
+        value = attribute.validate_and_normalize(obj, value)
+        attribute.set_value(obj, value)
+        self._post_latest((obj, name),
+                          lambda: attribute.value_updated(obj, value))
+
+    def _deferred_writes(self):
+        """ delays the writes to the module of the output """
+        path = self.parent.output.rsplit('.', 1)[0]
+        return recursive_getattr(self.parent, path)._deferred_writes()
 
     def setup_loop(self):
         """ put your initialization routine here"""
         if self.parent.reset_ival_on_restart:
-            self.parent._ival = 0
+            self._set('_ival', 0)
         self.lasttime = self.time
         self.lasterror = 0
+        self.next_output = None  # written at the start of the next iteration
+
+    def _write_output(self):
+        if self.next_output is not None:
+            self.output, self.next_output = self.next_output, None
 
     def loop(self):
-        input = self.input
+        with self._deferred_writes():
+            # the write is queued and sent together with the read
+            self._write_output()
+            input = self.input
         if input is None or np.isnan(input):
             self._logger.error("Could not retrieve the input signal for %s.%s.", self.parent, self.name)
             return
         error = input - self.parent.setpoint
         dt, self.lasttime = self.time - self.lasttime, self.time
-        self.parent._ival += self.parent.i * dt * 2.0 * np.pi * error
-        self.parent._ival = self.saturate_output(self.parent._ival)
-        out = self.parent._ival + self.parent.p * error + self.parent.d * 2.0 * np.pi / dt * (error-self.lasterror)
+        ival = self.saturate_output(self.parent._ival + self.parent.i * dt * 2.0 * np.pi * error)
+        self._set('_ival', ival)
+        out = ival + self.parent.p * error + self.parent.d * 2.0 * np.pi / dt * (error-self.lasterror)
         out = self.saturate_output(out)
-        self.output = out
+        self.next_output = out
         if self.parent.plot:
-            self.plotappend(r=error, g=self.output)
+            self.plotappend(r=error, g=out)
         self.lasterror = error
         self.interval = self.parent.interval
         self.parent._loop_hook()
@@ -48,8 +89,13 @@ class SoftwarePidLoop(PlotLoop):
             v = self.parent.output_min
         return v
 
+    def pause_loop(self):
+        super(SoftwarePidLoop, self).pause_loop()
+        self._write_output()
+
     def teardown_loop(self):
         """ put your destruction routine here"""
+        self._write_output()
         self.parent.__class__.running.value_updated(self.parent, False)
 
 
@@ -65,11 +111,15 @@ class RunningProperty(LedProperty):
         starts a new loop
         """
         self.stop(obj)
+        # the worker thread must not share an asynchronous client with the
+        # event loop
+        threaded = not isinstance(obj.redpitaya.client, AsyncMonitorClient)
         obj.loop = SoftwarePidLoop(parent=obj,
                                    name="loop",
                                    interval=obj.interval,
                                    plot=True, #obj.plot, # obj.plot is handled in loop() above
-                                   plotter="plotter")
+                                   plotter="plotter",
+                                   threaded=threaded)
 
     def stop(self, obj):
         """
@@ -110,6 +160,12 @@ class SoftwarePidController(Module):
     def stop(self):
         self.running = False
 
+    @property
+    def statistics(self):
+        """ timing statistics of the running loop (see LoopExecutor) """
+        loop = getattr(self, 'loop', None)
+        return None if loop is None else loop.statistics
+
     def _loop_hook(self):
         """
         this function is called at the end of each loop.
@@ -108,6 +108,8 @@ from ..module_attributes import *
 from ..hardware_modules import Scope
 from ..hardware_modules.dsp import all_inputs, InputSelectProperty
 from ..acquisition_module import AcquisitionModule
+from ..async_utils import run_async
+from ..pyrpl_utils import TransferFunctionCache
 from ..widgets.module_widgets import SpecAnWidget
 
 import sys
@@ -211,11 +213,29 @@ class WindowProperty(SelectProperty):
         obj.__class__.rbw.refresh_options(obj)
 
 
+class WelchSegmentsProperty(IntProperty):
+    """
+    Shorter segments have a wider bandwidth, hence the rbw needs to be
+    recalculated
+    """
+    def set_value(self, obj, value):
+        super(WelchSegmentsProperty, self).set_value(obj, value)
+        obj.__class__.rbw.refresh_options(obj)
+
+
 
 class SpectrumAnalyzer(AcquisitionModule):
     """
     A spectrum analyzer is composed of an IQ demodulator, followed by a scope.
     The spectrum analyzer connections are made upon calling the function setup.
+
+    With welch_segments > 1, each scope trace is split into welch_segments
+    windowed segments overlapping by WELCH_OVERLAP, whose power spectra are
+    averaged (Welch's method). This trades resolution bandwidth for a lower
+    variance per transferred trace. Each segment is zero-padded to
+    PADDING_FACTOR times its length, such that the cost of the FFTs does not
+    grow with the number of segments, and the frequency axis has
+    correspondingly fewer points.
     """
     _widget_class = SpecAnWidget
     _gui_attributes = ["input",
@@ -225,6 +245,7 @@ class SpectrumAnalyzer(AcquisitionModule):
                        "rbw",
                        #"points",
                        "window",
+                       "welch_segments",
                        "acbandwidth",
                        "display_unit",
                        "display_input1_baseband",
@@ -243,6 +264,7 @@ class SpectrumAnalyzer(AcquisitionModule):
                        #"rbw",
                        #"points",
                        "window",
+                       "welch_segments",
                        "acbandwidth",
                        "display_unit",
                        "curve_unit",
@@ -253,6 +275,10 @@ class SpectrumAnalyzer(AcquisitionModule):
                        "display_cross_amplitude",]
                        #"display_cross_phase"]
     PADDING_FACTOR = 16
+    WELCH_OVERLAP = 0.5
+    # number of segments transformed at once, limits the memory footprint of
+    # the padded FFTs
+    WELCH_BATCH = 8
     # numerical values
     nyquist_margin = 1.0
     if_filter_bandwidth_per_span = 1.0
@@ -307,6 +333,11 @@ class SpectrumAnalyzer(AcquisitionModule):
     center = CenterAttribute(call_setup=True)
     # points = IntProperty(default=16384, call_setup=True)
     window = WindowProperty(options=windows, call_setup=True)
+    welch_segments = WelchSegmentsProperty(default=1, min=1, max=63,
+                                           call_setup=True,
+                                           doc="number of overlapping "
+                                               "segments averaged per scope "
+                                               "trace")
     input = InputSelectProperty(options=all_inputs,
                                 default='in1',
                                 call_setup=True,
@@ -348,7 +379,7 @@ class SpectrumAnalyzer(AcquisitionModule):
 
     def __init__(self, parent, name=None):
         super(SpectrumAnalyzer, self).__init__(parent, name=name)
-        self._transfer_function_square_cached = None
+        self._tf_cache = TransferFunctionCache()
 
     @property
     def iq(self):
@@ -371,6 +402,22 @@ class SpectrumAnalyzer(AcquisitionModule):
         return self.scope.data_length
         #return int(self.points)  # *self.nyquist_margin)
 
+    @property
+    def segment_length(self):
+        """
+        Number of samples in each of the welch_segments segments.
+        """
+        overlap_fraction = 1. - self.WELCH_OVERLAP
+        return int(self.data_length /
+                   (1. + (self.welch_segments - 1) * overlap_fraction))
+
+    @property
+    def fft_length(self):
+        """
+        Number of points of the zero-padded FFT of each segment.
+        """
+        return self.segment_length * self.PADDING_FACTOR
+
     @property
     def sampling_time(self):
         return 1. / self.nyquist_margin / self.span
@@ -395,10 +442,11 @@ class SpectrumAnalyzer(AcquisitionModule):
         """
         if self.window=='gaussian':
             #  a tuple with the std is needed for Gaussian window
-            window_name = ('gaussian', self.data_length/10)
+            window_name = ('gaussian', self.segment_length/10)
         else:
             window_name = self.window
-        window = sig.get_window(window_name, self.data_length, fftbins=False)
+        window = sig.get_window(window_name, self.segment_length,
+                                fftbins=False)
         # empirical value for scaling flattop to sqrt(W)/V
         window/=(np.sum(window)/2)
         return window
@@ -418,10 +466,29 @@ class SpectrumAnalyzer(AcquisitionModule):
 
     def _get_filtered_iq_data(self):
         """
-        :return: the product between the complex iq data and the filter_window
+        :return: the product between the complex iq data and the
+        filter_window, as an array of shape (welch_segments, segment_length)
+        """
+        iq_data = self._get_iq_data()
+        length = self.segment_length
+        if self.welch_segments > 1:
+            step = (len(iq_data) - length) // (self.welch_segments - 1)
+        else:
+            step = 0
+        starts = np.arange(self.welch_segments) * step
+        segments = iq_data[starts[:, np.newaxis] + np.arange(length)]
+        return segments * np.asarray(self.filter_window(), dtype=np.complex)
+
+    def _welch_average(self, spectra, segments):
         """
-        return self._get_iq_data() * np.asarray(self.filter_window(),
-                                            dtype=np.complex)
+        :return: the average over all segments of spectra(segment_batch),
+        evaluated for batches of at most WELCH_BATCH segments
+        """
+        res = 0
+        for start in range(0, len(segments), self.WELCH_BATCH):
+            batch = segments[start:start + self.WELCH_BATCH]
+            res = res + np.sum(spectra(batch), axis=-2)
+        return res / len(segments)
 
     def useful_index_obsolete(self):
         """
@@ -444,7 +511,7 @@ class SpectrumAnalyzer(AcquisitionModule):
         In baseband, only half of the points are returned
         :return: the real number of points that will eventually be returned
         """
-        points = int(self.data_length * self.PADDING_FACTOR)
+        points = self.fft_length
         return points//2 + 1 if self.baseband else points
 
     @property
@@ -453,11 +520,10 @@ class SpectrumAnalyzer(AcquisitionModule):
         :return: frequency array
         """
         if self.baseband:
-            return np.fft.rfftfreq(self.data_length*self.PADDING_FACTOR,
-                                   self.sampling_time)
+            return np.fft.rfftfreq(self.fft_length, self.sampling_time)
         else:
             return self.center + fft.fftshift( fft.fftfreq(
-                                  self.data_length*self.PADDING_FACTOR,
+                                  self.fft_length,
                                   self.sampling_time)) #[self.useful_index()]
 
     def data_to_dBm(self, data): # will become obsolete
@@ -550,6 +616,20 @@ class SpectrumAnalyzer(AcquisitionModule):
         return self.transfer_function_iq(frequencies) * \
                self.transfer_function_scope(frequencies)
 
+    def _transfer_function_square(self):
+        """
+        abs(self.transfer_function(self.frequencies))**2, cached as long as
+        the settings that determine it do not change.
+        """
+        key = (self.baseband,
+               self.center,
+               self.decimation,
+               self.fft_length,
+               tuple(self._iq_bandwidth()),
+               self.acbandwidth)
+        return self._tf_cache.get(
+            key, lambda: abs(self.transfer_function(self.frequencies))**2)
+
 
     # Concrete implementation of AcquisitionModule methods
     # ----------------------------------------------------
@@ -562,6 +642,10 @@ class SpectrumAnalyzer(AcquisitionModule):
     def _free_up_resources(self):
         self.scope.free()
 
+    def _setup(self):
+        self._tf_cache.clear()
+        super(SpectrumAnalyzer, self)._setup()
+
     def _prepare_averaging(self):
         super(SpectrumAnalyzer, self)._prepare_averaging()
         self.current_avg = 0
@@ -577,8 +661,31 @@ class SpectrumAnalyzer(AcquisitionModule):
         :return:
         """
         iq_data = self._get_filtered_iq_data() # get iq data (from scope)
+        self._free_scope_if_stopped()
+        return self._spectrum(iq_data)
+
+    async def _get_trace_async(self):
+        """
+        Same as _get_trace, with the data transfer and the FFTs executed in
+        the worker thread of the scope's RedPitaya.
+        """
+        iq_data = await run_async(self._executor, self._get_filtered_iq_data)
+        self._free_scope_if_stopped()
+        return await run_async(self._executor, self._spectrum, iq_data)
+
+    @property
+    def _executor(self):
+        return self.scope._executor
+
+    def _free_scope_if_stopped(self):
         if not self.running_state in ["running_single", "running_continuous"]:
             self.pyrpl.scopes.free(self.scope) # free scope if not continuous
+
+    def _spectrum(self, iq_data):
+        """
+        :return: the averaged spectrum of the filtered iq data, corrected
+        for the transfer function
+        """
         if self.baseband:
             # In baseband, where the 2 real inputs are stored in the real and
             # imaginary part of iq_data, we need to make 2 different FFTs. Of
@@ -596,27 +703,25 @@ class SpectrumAnalyzer(AcquisitionModule):
             # --> In fact, we will use numpy.rfft insead of
             # scipy.fft.rfft because the output
             # format is directly a complex array, and thus, easier to handle.
-            fft1 = np.fft.rfft(np.real(iq_data),
-                                       self.data_length*self.PADDING_FACTOR)
-            fft2 = np.fft.rfft(np.imag(iq_data),
-                                       self.data_length*self.PADDING_FACTOR)
-            cross_spectrum = np.conjugate(fft1)*fft2
-
-            res = np.array([abs(fft1)**2,
-                            abs(fft2)**2,
-                            np.real(cross_spectrum),
-                            np.imag(cross_spectrum)])
-            # at some point, we need to cache the tf for performance
+            # All segments are transformed at once along the last axis.
+            def spectra(segments):
+                fft1 = np.fft.rfft(np.real(segments), self.fft_length)
+                fft2 = np.fft.rfft(np.imag(segments), self.fft_length)
+                cross_spectrum = np.conjugate(fft1)*fft2
+                return np.array([abs(fft1)**2,
+                                 abs(fft2)**2,
+                                 np.real(cross_spectrum),
+                                 np.imag(cross_spectrum)])
+            res = self._welch_average(spectra, iq_data)
             self._last_curve_raw = res # for debugging purpose
-            return res/abs(self.transfer_function(self.frequencies))**2
+            return res/self._transfer_function_square()
         else:
             # Realize the complex fft of iq data
-            res = fft.fftshift(fft.fft(iq_data,
-                                        self.data_length*self.PADDING_FACTOR))
-            # at some point we need to cache the tf for performance
-            self._last_curve_raw = np.abs(res)**2 # for debugging purpose
-            return self._last_curve_raw/abs(self.transfer_function(
-                self.frequencies))**2
+            def spectra(segments):
+                return np.abs(fft.fftshift(fft.fft(
+                    segments, self.fft_length), axes=-1))**2
+            self._last_curve_raw = self._welch_average(spectra, iq_data) # for debugging purpose
+            return self._last_curve_raw/self._transfer_function_square()
             #/ abs(self.transfer_function(
                 #self.frequencies))**2
             # [self.useful_index()]
@@ -723,9 +828,10 @@ class SpectrumAnalyzer(AcquisitionModule):
         get the residual bandwidth, this number has to be multiplied by the
         sample rate."""
 
-        if not self.window in self._enb_cached:
+        key = (self.window, self.segment_length)
+        if not key in self._enb_cached:
             filter_window = self.filter_window()
-            self._enb_cached[self.window] = (sum(filter_window ** 2)) / \
-                                            (sum(filter_window) ** 2)
+            self._enb_cached[key] = (sum(filter_window ** 2)) / \
+                                    (sum(filter_window) ** 2)
 
-        return self._enb_cached[self.window]
+        return self._enb_cached[key]
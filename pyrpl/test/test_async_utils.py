@@ -0,0 +1,82 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import threading
+import time
+from ..async_utils import AcquisitionExecutor, LOOP, run_async
+
+
+class TestAcquisitionExecutor(object):
+    def test_submit(self):
+        executor = AcquisitionExecutor()
+        threads = []
+
+        def job(x):
+            threads.append(threading.current_thread())
+            return 2 * x
+
+        futures = [executor.submit(job, i) for i in range(3)]
+        results = [LOOP.run_until_complete(f) for f in futures]
+        assert results == [0, 2, 4]
+        assert threads == [executor._thread] * 3
+        executor.shutdown()
+        assert not threads[0].is_alive()
+        try:
+            executor.submit(job, 0)
+        except RuntimeError:
+            pass
+        else:
+            assert False, "a shut down executor must not accept jobs"
+
+    def test_exception(self):
+        executor = AcquisitionExecutor()
+
+        def job():
+            raise ValueError("failed job")
+
+        try:
+            LOOP.run_until_complete(executor.submit(job))
+        except ValueError:
+            pass
+        else:
+            assert False, "the exception of a job must reach the caller"
+        # the worker survives the exception
+        assert LOOP.run_until_complete(executor.run(lambda: 1)) == 1
+        executor.shutdown()
+
+    def test_bounded_results(self):
+        executor = AcquisitionExecutor()
+        done = []
+        n = executor.RESULT_QUEUE_SIZE + 3
+        futures = [executor.submit(done.append, i) for i in range(n)]
+        time.sleep(0.2)
+        # results are not collected while the event loop does not run: the
+        # worker stalls once the result queue is full
+        assert len(done) == executor.RESULT_QUEUE_SIZE + 1
+        for future in futures:
+            LOOP.run_until_complete(future)
+        assert done == list(range(n))
+        executor.shutdown()
+
+    def test_run_async(self):
+        executor = AcquisitionExecutor()
+        main_thread = threading.current_thread()
+
+        def current_thread():
+            return threading.current_thread()
+
+        # without executor, the function is called in the event loop
+        assert LOOP.run_until_complete(
+            run_async(None, current_thread)) is main_thread
+        assert LOOP.run_until_complete(
+            run_async(executor, current_thread)) is executor._thread
+
+        # within a job of the executor, the function is called directly
+        def nested():
+            coroutine = run_async(executor, current_thread)
+            try:
+                coroutine.send(None)
+            except StopIteration as e:
+                return e.value
+        assert LOOP.run_until_complete(
+            run_async(executor, nested)) is executor._thread
+        executor.shutdown()
@@ -0,0 +1,69 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import numpy as np
+from ..curvedb import CurveDB
+
+
+class TestCurveDB(object):
+    def test_create_get_delete(self):
+        x, y = np.linspace(0, 1, 101), np.exp(1j * np.linspace(0, 1, 101))
+        c = CurveDB.create(x, y, name='test_curvedb', some_param=3)
+        assert c.pk in CurveDB.all_pks()
+        c2 = CurveDB.get(c.pk)
+        assert c2.name == 'test_curvedb'
+        assert c2.params['some_param'] == 3
+        assert (c2.data[0] == x).all()
+        assert (c2.data[1] == y).all()
+        assert c2.data[1].dtype == y.dtype
+        # keys are allocated in increasing order
+        c3 = CurveDB.create(x, y, name='test_curvedb_2')
+        assert c3.pk > c.pk
+        c3.delete()
+        c.delete()
+        assert c.pk not in CurveDB.all_pks()
+
+    def test_childs(self):
+        parent = CurveDB.create([1, 2], [3, 4], name='test_curvedb_parent')
+        child1 = CurveDB.create([1, 2], [5, 6], name='test_curvedb_child1')
+        child2 = CurveDB.create([1, 2], [7, 8], name='test_curvedb_child2')
+        parent.add_child(child1)
+        parent.add_child(child2)
+        parent = CurveDB.get(parent.pk)
+        assert [c.pk for c in parent.childs] == [child1.pk, child2.pk]
+        assert parent.get_child('test_curvedb_child2').pk == child2.pk
+        assert CurveDB.get(child1.pk).parent.pk == parent.pk
+        CurveDB.get(child1.pk).delete()
+        assert [c.pk for c in CurveDB.get(parent.pk).childs] == [child2.pk]
+        parent.delete()
+        assert child2.pk not in CurveDB.all_pks()
+
+    def test_lazy_data(self):
+        c = CurveDB.create(np.arange(10.), np.arange(10.) ** 2,
+                           name='test_curvedb_lazy')
+        c2 = CurveDB.get(c.pk)
+        assert c2._data is None  # only params are loaded
+        assert c2.pk in [c3.pk for c3 in CurveDB.all(name='test_curvedb_lazy')]
+        # saving params only does not touch the data
+        c2.params['some_param'] = 1
+        c2.save()
+        c3 = CurveDB.get(c.pk)
+        assert c3.params['some_param'] == 1
+        assert (c3.data[1] == np.arange(10.) ** 2).all()
+        # data is mapped copy-on-write and can be modified and saved
+        c3.data[1][0] = -1
+        c3.save()
+        assert CurveDB.get(c.pk).data[1][0] == -1
+        c.delete()
+
+    def test_replace_loaded_data(self):
+        c = CurveDB.create(np.arange(10.), np.arange(10.),
+                           name='test_curvedb_replace')
+        loaded = CurveDB.get(c.pk)
+        assert loaded.data[1][3] == 3
+        # the files of loaded data can be replaced and deleted
+        c.data = (np.arange(5.), -np.arange(5.))
+        c.save()
+        assert (CurveDB.get(c.pk).data[1] == -np.arange(5.)).all()
+        assert loaded.data[1][3] == 3
+        c.delete()
+        assert c.pk not in CurveDB.all_pks()
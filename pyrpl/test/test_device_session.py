@@ -0,0 +1,40 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import asyncio
+import numpy as np
+from ..device_session import DeviceSession
+from ..async_utils import LOOP
+
+
+class DummyScope(object):
+    """ records the order in which its traces are requested and returned """
+    def __init__(self, index, requests):
+        self.index = index
+        self.requests = requests
+        self.times = np.arange(4) * (index + 1.)
+
+    async def _trace_async(self, min_delay_s):
+        self.requests.append(('arm', self.index))
+        # the scopes with a higher index return their traces first
+        for i in range(3 - self.index):
+            await asyncio.sleep(0)
+        self.requests.append(('trace', self.index))
+        return np.full((2, 4), self.index)
+
+
+class TestDeviceSession(object):
+    def test_scope_traces(self):
+        requests = []
+        scopes = [DummyScope(i, requests) for i in range(3)]
+        session = DeviceSession([])
+        times, traces = LOOP.run_until_complete(
+            session.scope_traces_async(scopes=scopes))
+        # the secondary scopes are armed before the main scope
+        arms = [index for request, index in requests if request == 'arm']
+        assert arms == [1, 2, 0]
+        # the traces are returned in the order of the scopes, regardless of
+        # the order in which they were completed
+        assert [index for request, index in requests
+                if request == 'trace'][0] == 2
+        assert [trace[0, 0] for trace in traces] == [0, 1, 2]
+        assert (times == scopes[0].times).all()
@@ -1,5 +1,6 @@
 import logging
 logger = logging.getLogger(name=__name__)
+import numpy as np
 from pyrpl.test.test_base import TestPyrpl
 
 
@@ -32,3 +33,19 @@ class TestInput(TestPyrpl):
             # needs a small margin to work properly because of rounding off towards negative values in asg
             assert min + 2.0**(-14) >= asg.offset - asg.amplitude, \
                 (mean, std, max, min, min + 2.0**(-14), asg.offset - asg.amplitude)
+
+    def test_scope_stats(self):
+        """ stats from the scope cover t, scaled like the signal registers """
+        with self.pyrpl.asgs.pop('test_sampler') as asg:
+            asg.setup(amplitude=0,
+                      offset=0.9,
+                      waveform='dc',
+                      output_direct='off',
+                      trigger_source='immediately')
+            t = 0.3  # between two possible scope durations
+            samples = self.sampler._scope_samples(asg.name, t)
+            assert samples is not None
+            decimation = t / len(samples) / 8e-9
+            assert abs(decimation - 2**np.round(np.log2(decimation))) \
+                < 1e-3 * decimation, decimation
+            assert (samples == getattr(self.sampler, asg.name)).all()
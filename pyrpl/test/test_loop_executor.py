@@ -0,0 +1,27 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import time
+from ..software_modules.loop import LoopExecutor
+
+
+class TestLoopExecutor(object):
+    def test_rate(self):
+        calls = []
+        executor = LoopExecutor(lambda: calls.append(time.time()), 0.005)
+        executor.start()
+        time.sleep(0.5)
+        executor.stop()
+        statistics = executor.statistics
+        assert statistics['iterations'] == len(calls)
+        assert 50 < len(calls) <= 101
+        assert 150 < statistics['rate'] < 250
+
+    def test_slow_iterations_are_skipped(self):
+        executor = LoopExecutor(lambda: time.sleep(0.025), 0.01)
+        executor.start()
+        time.sleep(0.3)
+        executor.stop()
+        statistics = executor.statistics
+        # iterations are not executed back to back to catch up
+        assert statistics['missed'] >= statistics['iterations']
+        assert statistics['latency_mean'] >= 0.02
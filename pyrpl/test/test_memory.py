@@ -166,3 +166,78 @@ class TestMemory(object):
         m1._write_to_file()
         m2._write_to_file()
         os.remove(m1._filename)
+
+    def test_journal(self):
+        """ changes in journal mode survive without compaction """
+        filename = 'test_journal'
+        m1 = MemoryTree(filename, _journal=True)
+        m1.a = 1
+        m1.b = dict(c=[1, 2], d=dict(e='f'))
+        m1.b.c[2] = 3
+        m1.b.d._pop('e')
+        m1.x = 5
+        m1._pop('x')
+        m1._save(0)  # immediate compaction
+        m1.a = 2
+        m1.b.c[0] = 0
+        assert m1._write_to_file_counter == 1
+        # simulate a crash: the config file does not contain the last changes
+        m2 = MemoryTree(filename, _journal=True)
+        assert m2.a == 2
+        assert m2.b.c._data == [0, 2, 3]
+        assert 'e' not in m2.b.d
+        assert 'x' not in m2
+        # an outdated journal is ignored
+        m2._write_to_file()
+        m1._close_journal()
+        m2._close_journal()
+        m3 = MemoryTree(filename, _journal=True)
+        assert m3.a == 2
+        m3._close_journal()
+        os.remove(m3._filename)
+        os.remove(m3._journal_filename)
+
+    def test_journal_external_change(self):
+        """ journaled changes survive an external edit of the file """
+        filename = 'test_journal_external'
+        m = MemoryTree(filename, _journal=True)
+        m.a = 1
+        m.b = 2
+        m._save(0)  # immediate compaction
+        m.a = 3  # only in the journal
+        with open(m._filename, 'w') as f:
+            f.write('a: 1\nb: 5\nc: 4\n')
+        os.utime(m._filename, (0, 0))  # make sure the file looks modified
+        m._lastreload -= 2 * m._loadsavedeadtime
+        m._reload()
+        assert (m.a, m.b, m.c) == (3, 5, 4)
+        # the merged tree has been written to the file
+        assert not m._journal_dirty
+        m._close_journal()
+        m2 = MemoryTree(filename)
+        assert (m2.a, m2.b, m2.c) == (3, 5, 4)
+        os.remove(m._filename)
+        os.remove(m._journal_filename)
+
+    def test_snapshot(self):
+        """ the snapshot is only used for the file version it was made of """
+        from ..memory import _snapshot_at_exit
+        import weakref
+        m = MemoryTree('test_snapshot')
+        m.a = 1
+        m._write_to_file()
+        # saving does not refresh the snapshot, exiting does
+        assert m._load_snapshot(m._file_signature()) is None
+        _snapshot_at_exit(weakref.ref(m))
+        assert m._load_snapshot(m._file_signature()) == {'a': 1}
+        assert MemoryTree('test_snapshot').a == 1
+        # a snapshot of another version of the file is ignored
+        with open(m._filename, 'w') as f:
+            f.write('a: 22\n')
+        assert MemoryTree('test_snapshot').a == 22
+        # a corrupt snapshot is ignored
+        with open(m._snapshot_filename, 'wb') as f:
+            f.write(b'corrupt')
+        assert MemoryTree('test_snapshot').a == 22
+        os.remove(m._filename)
+        os.remove(m._snapshot_filename)
@@ -189,6 +189,56 @@ class TestNA(TestPyrpl):
             # account, that should be much closer to 1...
             # Also, there is this magic value of 0.988 instead of 1 ??!!!
 
+    def test_adaptive_parallel(self):
+        """ adaptive sweeps are sequential, whatever parallel_iqs """
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e5,
+                          stop_freq=2e5,
+                          rbw=100000,
+                          points=100,
+                          parallel_iqs=3,
+                          adaptive=True,
+                          output_direct="out1",
+                          input="out1",
+                          running_state='stopped',
+                          trace_average=1,
+                          amplitude=0.01)
+            assert not self.na._is_parallel_sweep()
+            y = self.na.single()
+            assert len(y) == len(self.na.frequencies) <= 100
+            self.na.adaptive = False
+            assert self.na._is_parallel_sweep()
+
+    def test_parallel_sweep(self):
+        """ a parallel sweep measures the same points as a serial one """
+        with self.pyrpl.networkanalyzer as self.na:
+            self.na.setup(start_freq=1e5,
+                          stop_freq=2e5,
+                          rbw=1000,
+                          points=90,
+                          parallel_iqs=1,
+                          output_direct="out1",
+                          input="out1",
+                          running_state='stopped',
+                          trace_average=1,
+                          amplitude=0.1)
+            serial = np.array(self.na.single())
+            self.na.parallel_iqs = 3
+            assert self.na._is_parallel_sweep()
+            updated = []
+            self.na._signal_launcher.update_point.connect(updated.append)
+            try:
+                parallel = np.array(self.na.single())
+            finally:
+                self.na._signal_launcher.update_point.disconnect(
+                    updated.append)
+            assert len(self.na._sweep_iqs or []) <= 3
+            assert len(parallel) == len(serial) == len(self.na.frequencies)
+            assert not np.isnan(parallel).any()
+            assert np.allclose(parallel, serial, rtol=0.05, atol=1e-3)
+            # the updates point to the last block, which reaches the end
+            assert updated[-1] == len(parallel) - 1
+
     def test_iq_stopped_when_paused(self):
         with self.pyrpl.networkanalyzer as self.na:
             self.na.setup(start_freq=1e5,
@@ -0,0 +1,69 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import os
+import tempfile
+import numpy as np
+from ..software_modules.peak_telemetry import decode_peaks, PEAKS_LENGTH, \
+    PeakTelemetry, load_telemetry
+from ..async_utils import LOOP
+from ..pyrpl_utils import RingBuffer
+
+
+class FailingTelemetry(PeakTelemetry):
+    """ returns 3 samples, then fails like a lost connection """
+    scan_period = 0.
+
+    def _prepare(self):
+        self._columns = ['time', 'value']
+        self._samples = 0
+
+    async def read_sample_async(self):
+        self._samples += 1
+        if self._samples > 3:
+            raise ConnectionError("lost connection")
+        return np.array([self._samples, 2. * self._samples])
+
+
+class TestPeakTelemetry(object):
+    def test_decode_peaks(self):
+        words = np.zeros(PEAKS_LENGTH, dtype=np.uint32)
+        # main peaks: 0.5 V at index 100 (valid), -0.25 V at index 300
+        words[0] = (4096 | 1 << 14) | ((2**14 - 2048) << 16)
+        words[1:3] = [100, 300]
+        # first extra peak normalized, halfway between the main peaks
+        words[5] = 0b1
+        words[8:10] = [1 << 14 | 1 << 15, 2**13]
+        # last extra peak not normalized
+        words[23:25] = [200 | 1 << 14, 50]
+        positions, heights, valid = decode_peaks(words, 1e-6)
+        assert np.allclose(positions, [100e-6, 300e-6, 200e-6, 0, 0, 50e-6])
+        assert np.allclose(heights[:2], [0.5, -0.25])
+        assert list(valid) == [1, 0, 1, 0, 0, 1]
+
+    def test_ring_buffer(self):
+        buffer = RingBuffer(5, 2)
+        for i in range(3):
+            buffer.append([i, i])
+        buffer.extend(np.arange(100, 114).reshape(7, 2))
+        assert buffer.count == 10 and len(buffer) == 5
+        assert list(buffer.data[:, 0]) == [104, 106, 108, 110, 112]
+        assert list(buffer.since(8)[:, 0]) == [110, 112]
+        # rows that were overwritten are skipped
+        assert list(buffer.since(2)[:, 0]) == list(buffer.data[:, 0])
+
+    def test_read_error(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'telemetry.bin')
+        telemetry = FailingTelemetry(None)
+        telemetry.start(filename)
+        task = telemetry._task
+        LOOP.run_until_complete(task)
+        # the recording stops and keeps the samples read before the error
+        assert not telemetry.running
+        assert telemetry._file is None
+        columns, data = load_telemetry(filename)
+        assert columns == ['time', 'value']
+        assert list(data[:, 1]) == [2., 4., 6.]
+        # a new recording can be started
+        telemetry.start(filename)
+        LOOP.run_until_complete(telemetry._task)
+        assert len(load_telemetry(filename)[1]) == 3
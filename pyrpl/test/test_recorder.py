@@ -0,0 +1,96 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import os
+import tempfile
+import time
+import numpy as np
+from ..software_modules.recorder import ChunkWriter, load_recording, \
+    Recorder
+from ..redpitaya import RedPitaya
+
+
+class FakeTransact(object):
+    """ replaces Module._transact, serves reads from a dictionary of words """
+    def __init__(self, memory):
+        self.memory = memory
+        self.operations = []
+
+    def __call__(self, operations, addAddressBase=True):
+        assert not addAddressBase
+        self.operations.append(operations)
+        return [np.array([self.memory.get(addr + 4 * i, 0)
+                          for i in range(length)], dtype=np.uint32)
+                for code, addr, length in operations]
+
+
+class TestRecorder(object):
+    def test_chunk_writer(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'recording.npz')
+        writer = ChunkWriter(filename, ['time', 'in1'])
+        chunks = [np.random.normal(size=(n, 2)) for n in (100, 100, 37)]
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+        columns, data = load_recording(filename)
+        assert columns == ['time', 'in1']
+        assert (data == np.concatenate(chunks)).all()
+        # the file is a regular npz archive
+        with np.load(filename) as f:
+            assert len(f.files) == 1 + len(chunks)
+
+    def test_read_sample(self):
+        rp = RedPitaya(config=None, hostname='_FAKE_REDPITAYA_')
+        recorder = Recorder(rp, signals=['pid0.ival', (rp.pid1, 'setpoint'),
+                                         'in1'])
+        def address(module, name):
+            return getattr(type(module), name).words(module)[0][0]
+        transact = FakeTransact({
+            address(rp.scope, 'current_timestamp'): 125000000,  # 1 s
+            address(rp.pid0, 'ival'): 2**16 - 2**12,  # -0.5 V
+            address(rp.pid1, 'setpoint'): 2**11,  # 0.25 V
+            address(rp.sampler, 'in1'): 2**14 - 2**11})  # -0.25 V
+        rp.scope._transact = transact
+        sample = recorder.read_sample()
+        assert recorder.columns == ['time', 'pid0.ival', 'pid1.setpoint',
+                                    'in1']
+        assert np.allclose(sample, [1., -0.5, 0.25, -0.25], atol=1e-3)
+        # all signals of the board are read in one transaction
+        assert len(transact.operations) == 1
+        assert len(transact.operations[0]) == 4
+        rp.end()
+
+    def test_start_stop(self):
+        rp = RedPitaya(config=None, hostname='_FAKE_REDPITAYA_')
+        filename = os.path.join(tempfile.mkdtemp(), 'recording.npz')
+        recorder = Recorder(rp, signals=['pid0.ival'], rate=200.,
+                            filename=filename)
+        recorder.CHUNK_LENGTH = 10
+        rp.scope._transact = FakeTransact({})
+        recorder.start()
+        time.sleep(0.3)
+        recorder.stop()
+        assert not recorder.running
+        n_samples = recorder.statistics['iterations']
+        assert 30 < n_samples <= 61
+        columns, data = load_recording(filename)
+        assert columns == ['time', 'pid0.ival']
+        assert len(data) == n_samples == len(recorder.data)
+        rp.end()
+
+    def test_asynchronous_client(self):
+        rp = RedPitaya(config=None, hostname='_FAKE_REDPITAYA_')
+        recorder = Recorder(rp, signals=['pid0.ival'])
+
+        class AsyncClient(object):
+            async def transact_async(self, operations):
+                pass
+        rp.scope._client = AsyncClient()
+        try:
+            recorder.start()
+        except ValueError:
+            pass
+        else:
+            recorder.stop()
+            assert False, "asynchronous clients must be rejected"
+        assert not recorder.running
+        rp.end()
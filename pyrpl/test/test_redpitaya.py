@@ -24,3 +24,26 @@ class TestRedpitaya(object):
 
     def test_connect(self):
         assert self.r.hk.led == 0
+
+    def test_transact(self):
+        # scope trigger debounce register, 20 bits wide
+        addr = self.r.scope.addr_base + 0x90
+        old = int(self.r.client.reads(addr, 1)[0])
+        results = self.r.client.transact([('w', addr, [0x123]),
+                                          ('r', addr, 1),
+                                          ('m', addr, [0x400], 0xF00),
+                                          ('r', addr, 1)])
+        self.r.client.writes(addr, [old])
+        assert results[1][0] == 0x123, hex(results[1][0])
+        assert results[3][0] == 0x423, hex(results[3][0])
+
+    def test_deferred_writes(self):
+        addr = self.r.scope.addr_base + 0x90
+        old = int(self.r.client.reads(addr, 1)[0])
+        with self.r.client.deferred():
+            self.r.client.writes(addr, [0x321])
+            # reads inside the block see the queued writes
+            assert self.r.client.reads(addr, 1)[0] == 0x321
+            self.r.client.write_masked(addr, 0x1000, 0xF000)
+        assert self.r.client.reads(addr, 1)[0] == 0x1321
+        self.r.client.writes(addr, [old])
@@ -0,0 +1,261 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import asyncio
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from ..redpitaya_client import MonitorClient, AsyncMonitorClient
+from ..redpitaya import RedPitaya
+from ..async_utils import LOOP, ensure_future
+
+
+class MemoryServer(threading.Thread):
+    """
+    A minimal monitor_server with batch support that serves a dictionary of
+    words, for tests of the client without hardware.
+    """
+    def __init__(self):
+        super(MemoryServer, self).__init__(daemon=True)
+        self.memory = {}
+        self.n_requests = 0
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.start()
+
+    def read(self, addr, length):
+        return [self.memory.get(addr + 4 * i, 0) for i in range(length)]
+
+    def write(self, addr, values):
+        for i, value in enumerate(values):
+            self.memory[addr + 4 * i] = int(value) & 0xFFFFFFFF
+
+    def run(self):
+        while True:
+            connection, _ = self.server.accept()
+            threading.Thread(target=self.serve, args=(connection,),
+                             daemon=True).start()
+
+    @staticmethod
+    def receive(connection, length):
+        data = b''
+        while len(data) < length:
+            chunk = connection.recv(length - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def serve(self, connection):
+        try:
+            while True:
+                header = self.receive(connection, 8)
+                code = header[:1]
+                length = header[2] | (header[3] << 8)
+                addr = struct.unpack('<I', header[4:])[0]
+                self.n_requests += 1
+                if code == b'c':
+                    return
+                elif code == b'r':
+                    reply = self.read(addr, length)
+                elif code == b'w':
+                    self.write(addr, np.frombuffer(
+                        self.receive(connection, 4 * length), '<u4'))
+                    reply = []
+                elif code == b'b':
+                    body = np.frombuffer(self.receive(connection, 4 * length),
+                                         '<u4')
+                    reply, executed = self.batch(body, addr)
+                    header = header[:4] + struct.pack('<I', executed)
+                connection.sendall(header + np.array(reply, '<u4').tobytes())
+        except (EOFError, socket.error):
+            pass
+        finally:
+            connection.close()
+
+    def batch(self, body, n_operations):
+        reply, position = [], 0
+        for i in range(n_operations):
+            code = chr(body[position] & 0xFF)
+            length = int(body[position] >> 16)
+            addr = int(body[position + 1])
+            position += 2
+            if code == 'r':
+                reply += self.read(addr, length)
+            elif code == 'w':
+                self.write(addr, body[position:position + length])
+                position += length
+            elif code == 'm':
+                mask = int(body[position])
+                values = body[position + 1:position + 1 + length]
+                self.write(addr, [(old & ~mask) | (int(value) & mask)
+                                  for old, value
+                                  in zip(self.read(addr, length), values)])
+                position += 1 + length
+            elif code == 'p':
+                values = self.read(addr, length) + [0]
+                reply += [(values[k] & 0xFFFF) | (values[k + 1] & 0xFFFF) << 16
+                          for k in range(0, length, 2)]
+            elif code == 'q':
+                mask, timeout = int(body[position]), body[position + 1] * 1e-6
+                position += 2
+                deadline = time.time() + timeout
+                while self.read(addr, 1)[0] & mask and time.time() < deadline:
+                    time.sleep(1e-3)
+                reply += self.read(addr, 1)
+                if reply[-1] & mask:
+                    return reply, i + 1  # timeout, skip the others
+        return reply, n_operations
+
+
+class TestMonitorClient(object):
+    @classmethod
+    def setup_class(cls):
+        cls.server = MemoryServer()
+
+    def test_transact(self):
+        client = MonitorClient('127.0.0.1', self.server.port)
+        assert client._batch_supported
+        results = client.transact([('w', 0x100, [1, 2]),
+                                   ('m', 0x104, [0xF0], 0xF0),
+                                   ('r', 0x100, 2)])
+        assert list(results[2]) == [1, 0xF2]
+        client.close()
+
+    def test_wait_timeout(self):
+        client = MonitorClient('127.0.0.1', self.server.port)
+        self.server.write(0x200, [1])
+        operations = [('q', 0x200, 0x1, 0.), ('r', 0x100, 2),
+                      ('w', 0x204, [3])]
+        status, read, write = client.transact(operations)
+        # the server skips the operations after the timed out wait
+        assert status[0] == 1 and read is None and write is None
+        assert self.server.read(0x204, 1) == [0]
+        self.server.write(0x200, [0])
+        status, read, write = client.transact(operations)
+        assert status[0] == 0 and len(read) == 2 and write is True
+        assert self.server.read(0x204, 1) == [3]
+        client.close()
+
+    def test_scope_trace_wait(self):
+        rp = RedPitaya(config=None, hostname='_FAKE_REDPITAYA_')
+        client = MonitorClient('127.0.0.1', self.server.port)
+        scope = rp.scope
+        scope._client = client
+        scope.duration = 1e-4
+        try:  # the trigger stays armed in the memory
+            scope.acquire_raw_trace(timeout=0.2)
+        except TimeoutError:
+            pass
+        else:
+            assert False, "a missing trigger must raise TimeoutError"
+        # a trigger during the wait of the server: the trace comes with the
+        # same request
+        n_requests = self.server.n_requests
+        trigger = threading.Timer(0.5 * scope.SERVER_WAIT_TIMEOUT_S,
+                                  self.server.write, (scope.addr_base, [0]))
+        trigger.start()
+        assert scope.acquire_raw_trace(timeout=1.).shape == (2, 2**14)
+        n_setup = 5  # requests of the acquisition setup
+        assert self.server.n_requests - n_requests == n_setup + 1
+        client.close()
+
+    def test_failed_transaction(self):
+        client = MonitorClient('127.0.0.1', self.server.port)
+        client._transact = lambda operations: None  # out of sync every time
+        try:
+            client.transact([('r', 0x100, 1)])
+        except ConnectionError:
+            pass
+        else:
+            assert False, "a failed transaction must raise ConnectionError"
+        client.close()
+
+    def test_restart(self):
+        client = MonitorClient('127.0.0.1', self.server.port,
+                               restartserver=lambda: self.server.port)
+        shadow = client.shadow
+        shadow.declare_volatile(0x0, 0x1)
+        client.writes(0x4, [5])
+        shadow.update(0x4, 5)
+        client.restart()
+        # known values are forgotten, volatile bits are not
+        assert client.shadow is shadow
+        assert shadow.get(0x4) is None
+        shadow.update(0x0, 0x3)
+        assert shadow.get(0x0, 0x1) is None
+        assert shadow.merge(0x0, 0x0, 0x2) is None
+        assert client.reads(0x4, 1)[0] == 5
+        client.close()
+
+
+class TestAsyncMonitorClient(object):
+    @classmethod
+    def setup_class(cls):
+        cls.server = MemoryServer()
+        cls.server.write(0x1000, np.arange(100))
+
+    def test_concurrent_requests(self):
+        client = AsyncMonitorClient('127.0.0.1', self.server.port)
+
+        async def read_both():
+            first = ensure_future(client.reads_async(0x1000, 50))
+            second = ensure_future(client.reads_async(0x1000 + 4 * 50, 50))
+            # both requests are in flight at the same time
+            await asyncio.sleep(0)
+            assert len(client._inflight) == 2
+            return await first, await second
+
+        first, second = LOOP.run_until_complete(read_both())
+        assert (np.concatenate([first, second]) == np.arange(100)).all()
+        # synchronous requests are served by the same client
+        client.writes(0x2000, [7])
+        assert client.reads(0x2000, 1)[0] == 7
+        client.close()
+
+    def test_transact_async(self):
+        client = AsyncMonitorClient('127.0.0.1', self.server.port)
+
+        async def write_and_read():
+            with client.deferred():
+                await client.writes_async(0x3000, [1, 2, 3])
+                return await client.transact_async([('r', 0x3000, 3)])
+
+        n_requests = self.server.n_requests
+        results = LOOP.run_until_complete(write_and_read())
+        assert list(results[0]) == [1, 2, 3]
+        assert self.server.n_requests == n_requests + 1
+        client.close()
+
+    def test_wait_timeout_async(self):
+        client = AsyncMonitorClient('127.0.0.1', self.server.port)
+        self.server.write(0x4000, [1])
+
+        async def wait_and_read():
+            first = ensure_future(client.transact_async(
+                [('q', 0x4000, 0x1, 0.), ('r', 0x1000, 10)]))
+            # the short reply must not affect the next request
+            second = ensure_future(client.reads_async(0x1000, 10))
+            return await first, await second
+
+        (status, read), second = LOOP.run_until_complete(wait_and_read())
+        assert status[0] == 1 and read is None
+        assert (second == np.arange(10)).all()
+        client.close()
+
+    def test_failed_request(self):
+        client = AsyncMonitorClient('127.0.0.1', self.server.port)
+
+        async def out_of_sync(operations, unused=None):
+            return None
+        client._transact_async = out_of_sync
+        try:
+            LOOP.run_until_complete(client.transact_async([('r', 0x0, 1)]))
+        except ConnectionError:
+            pass
+        else:
+            assert False, "a failed request must raise ConnectionError"
+        client.close()
@@ -0,0 +1,39 @@
+import logging
+logger = logging.getLogger(name=__name__)
+from ..attributes import ArrayRegister, FloatRegister, RegisterLayout
+from ..redpitaya_client import MonitorClient
+
+
+class TestRegisterLayout(object):
+    def test_shared_words(self):
+        low = ArrayRegister(FloatRegister, addresses=[0x100, 0x108],
+                            startBits=[0, 0], bits=14, norm=2**13)
+        high = ArrayRegister(FloatRegister, addresses=[0x100, 0x108],
+                             startBits=[14, 14], bits=14, norm=2**13)
+        other = ArrayRegister(FloatRegister, addresses=[0x104, 0x10C],
+                              bits=32, norm=1)
+        layout = RegisterLayout([low, high, other])
+        assert layout.compilable
+        assert (layout.start, layout.length) == (0x100, 4)
+        assert list(layout.masks) == [0x0FFFFFFF, 0xFFFFFFFF] * 2
+        bits = [0x1, 0x2, 0x3, 0x4]
+        # full words are written together, partial words with masks
+        assert layout._operations(bits, layout.masks) == [
+            ('m', 0x100, [0x1], 0x0FFFFFFF),
+            ('w', 0x104, [0x2]),
+            ('m', 0x108, [0x3], 0x0FFFFFFF),
+            ('w', 0x10C, [0x4])]
+        written = [0xFFFFFFFF] * 3 + [0]
+        assert layout._operations(bits, written) == [
+            ('w', 0x100, [0x1, 0x2, 0x3])]
+
+    def test_coalesce(self):
+        operations = [('m', 0xB0, [0x1], 0x3),
+                      ('m', 0xB0, [0x8], 0xC),
+                      ('w', 0xB4, [0x5]),
+                      ('m', 0xB4, [0x20], 0xF0),
+                      ('m', 0xB0, [0x0], 0x30)]
+        assert MonitorClient._coalesce(operations) == [
+            ('m', 0xB0, [0x9], 0xF),
+            ('w', 0xB4, [0x25]),
+            ('m', 0xB0, [0x0], 0x30)]
@@ -0,0 +1,63 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import threading
+from ..redpitaya_client import RegisterShadow, MonitorClient
+from ..redpitaya import RedPitaya
+from .test_redpitaya_client import MemoryServer
+
+
+class TestRegisterShadow(object):
+    def test_known_bits(self):
+        s = RegisterShadow()
+        assert s.get(0x100) is None
+        s.update(0x100, 0x12, 0xFF)
+        assert s.get(0x100, 0xF0) == 0x12
+        assert s.get(0x100) is None
+        s.update(0x100, 0xABCD0000, 0xFFFF0000)
+        assert s.get(0x100, 0xFFFF00FF) == 0xABCD0012
+        s.clear()
+        assert s.get(0x100, 0xFF) is None
+
+    def test_volatile_bits(self):
+        s = RegisterShadow()
+        s.declare_volatile(0x0, 0x1)
+        s.update(0x0, 0x3)
+        assert s.get(0x0, 0x2) & 0x2 == 0x2
+        assert s.get(0x0, 0x1) is None
+        # a word with volatile bits cannot be rewritten from the shadow
+        assert s.merge(0x0, 0x0, 0x2) is None
+        s.update(0x4, 0xF0)
+        assert s.merge(0x4, 0x1, 0xF) == 0xF1
+
+    def test_long_writes(self):
+        s = RegisterShadow()
+        s.update(0x10000, 1)
+        s.updates(0x10000, [0] * (s.MAX_WRITE_LENGTH + 1))
+        assert s.get(0x10000, 0x1) is None
+        s.updates(0x10000, [5, 6])
+        assert s.get(0x10004) == 6
+
+    def test_concurrent_masked_writes(self):
+        server = MemoryServer()
+        rp = RedPitaya(config=None, hostname='_FAKE_REDPITAYA_')
+        client = MonitorClient('127.0.0.1', server.port)
+        module = rp.pid0
+        module._client = client
+        module._write(0x10, 0)  # all bits of the word are known
+
+        def write_bits(shift):
+            for i in range(300):
+                module._write_masked(0x10, (i & 0xFF) << shift, 0xFF << shift)
+
+        threads = [threading.Thread(target=write_bits, args=(shift,))
+                   for shift in (0, 8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # no write merged a word that the other thread changed meanwhile
+        expected = (299 & 0xFF) * 0x101
+        assert server.read(module._absolute_address(0x10), 1)[0] == expected
+        assert module._shadow.get(module._absolute_address(0x10)) == expected
+        client.close()
+        rp.end()
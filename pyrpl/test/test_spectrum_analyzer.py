@@ -75,6 +75,37 @@ class TestClass(TestPyrpl):
                                                 sa.rbw)*sa.rbw) -
                            (asg.amplitude**2)/2)<0.01, max(curve)
 
+    def test_welch_segments(self):
+        """ the average over segments agrees with scipy.signal.welch """
+        from scipy import signal
+        sa = self.pyrpl.spectrumanalyzer
+        sa.setup(baseband=True,
+                 center=0,
+                 window='blackman',
+                 span=1e5,
+                 welch_segments=7,
+                 trace_average=1)
+        sa.stop()
+        x = np.random.normal(size=sa.data_length)
+        sa._get_iq_data = lambda: x + 0j
+        try:
+            sa._spectrum(sa._get_filtered_iq_data())
+        finally:
+            del sa._get_iq_data
+        step = (sa.data_length - sa.segment_length) // (sa.welch_segments - 1)
+        f, spectrum = signal.welch(x,
+                                   fs=1. / sa.sampling_time,
+                                   window=sa.filter_window(),
+                                   nperseg=sa.segment_length,
+                                   noverlap=sa.segment_length - step,
+                                   nfft=sa.fft_length,
+                                   detrend=False,
+                                   scaling='spectrum')
+        assert sa.fft_length == sa.segment_length * sa.PADDING_FACTOR
+        assert np.allclose(sa.frequencies, f)
+        # Vpk^2 vs. one-sided Vrms^2, apart from the DC and Nyquist bins
+        assert np.allclose(sa._last_curve_raw[0][1:-1], 2 * spectrum[1:-1])
+
     def test_white_noise_flatness(self):
         """
         Make sure a white noise results in a flat spectrum, with a PSD equal to
@@ -0,0 +1,52 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import numpy as np
+import pyqtgraph as pg
+from qtpy import QtWidgets
+from pyrpl.widgets.decimated_curve import minmax_envelope, DecimatedCurve
+
+
+class TestMinmaxEnvelope(object):
+    def test_peaks_are_kept(self):
+        x = np.linspace(0, 1, 100001)
+        y = np.zeros(len(x))
+        y[12345] = 1.
+        y[54321] = -1.
+        xenv, yenv = minmax_envelope(x, y, 0., 1., 500)
+        assert len(xenv) <= 2 * 502
+        assert yenv.max() == 1. and yenv.min() == -1.
+        assert (np.diff(xenv) >= 0).all()
+
+    def test_view_range(self):
+        x = np.arange(1000.)
+        y = np.sin(x)
+        # few points in view: returned unchanged, with one point beyond
+        # each edge of the view
+        xenv, yenv = minmax_envelope(x, y, 100.5, 110.5, 500)
+        assert (xenv == x[100:112]).all()
+        assert (yenv == y[100:112]).all()
+
+    def test_nan_is_ignored(self):
+        x = np.arange(10000.)
+        y = np.ones(len(x))
+        y[::2] = np.nan
+        xenv, yenv = minmax_envelope(x, y, 0., 9999., 100)
+        assert (yenv == 1.).all()
+
+
+class TestDecimatedCurve(object):
+    def test_clear(self):
+        app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        plot_item = pg.PlotItem()
+        curve = DecimatedCurve(plot_item.plot())
+        x = np.arange(100000.)
+        curve.setData(x, np.sin(x))
+        assert len(curve.curve.xData) < len(x)
+        curve.clear()
+        # a change of the view range must not redraw the cleared data
+        plot_item.setXRange(0, 1000)
+        assert curve.curve.xData is None or len(curve.curve.xData) == 0
+        # new data is displayed again, and follows the view range
+        curve.setData(x, np.cos(x))
+        plot_item.setXRange(0, 10, padding=0)
+        assert len(curve.curve.xData) < 20
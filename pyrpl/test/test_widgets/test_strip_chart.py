@@ -0,0 +1,26 @@
+import logging
+logger = logging.getLogger(name=__name__)
+import numpy as np
+from pyrpl.widgets.strip_chart import StripChart
+
+
+class TestStripChart(object):
+    def test_decimation(self):
+        chart = StripChart(capacity=100)
+        for i in range(1000):
+            chart.append(i, 2 * i)
+        x, y = chart.data
+        assert len(x) <= 100
+        # the whole history is kept, the latest points at full resolution
+        assert x[0] == 0 and x[-1] == 999
+        assert (np.diff(x) > 0).all()
+        assert (x[-25:] == np.arange(975, 1000)).all()
+        assert (y == 2 * x).all()
+
+    def test_no_decimation(self):
+        chart = StripChart(capacity=100, decimate=False)
+        for i in range(1000):
+            chart.append(i, i)
+        x, y = chart.data
+        assert (x == np.arange(1000 - len(x), 1000)).all()
+        assert 75 <= len(x) <= 100
@@ -9,6 +9,8 @@ import numpy as np
 from qtpy import QtCore, QtWidgets
 import pyqtgraph as pg
 from .spinbox import NumberSpinBox, IntSpinBox, FloatSpinBox, ComplexSpinBox
+from .decimated_curve import DecimatedCurve
+from .strip_chart import StripChartCurves
 from .. import pyrpl_utils
 from ..curvedb import CurveDB
 from qtpy import QtCore, QtGui, QtWidgets
@@ -914,8 +916,9 @@ class DataWidget(pg.GraphicsLayoutWidget):
             self._phase(values)
         if len(self.curves) <= i:
             color = self._defaultcolors[i % len(self._defaultcolors)]
-            self.curves.append(self.plot_item.plot(pen=color))
-            self.curves_phase.append(self.plot_item_phase.plot(pen=color))
+            self.curves.append(DecimatedCurve(self.plot_item.plot(pen=color)))
+            self.curves_phase.append(DecimatedCurve(
+                self.plot_item_phase.plot(pen=color)))
         self.curves[i].setData(x, y_mag)
         self.curves_phase[i].setData(x, y_phase)
 
@@ -955,7 +958,8 @@ class PlotAttributeWidget(BaseAttributeWidget):
         legend = getattr(self.module.__class__, self.attribute_name).legend
         self.pw = self.widget.addPlot(title="%s vs. time (s)"%legend)
         self.plot_start_time = self.time()
-        self.curves = {}
+        self.strip_charts = StripChartCurves(self.pw)
+        self.curves = self.strip_charts.curves
         setattr(self.module.__class__, '_' + self.attribute_name + '_pw', self.pw)
 
     def _set_widget_value(self, new_value):
@@ -968,7 +972,7 @@ class PlotAttributeWidget(BaseAttributeWidget):
                 args, kwargs = new_value, {}
             else:
                 args, kwargs = [new_value], {}
-        for k in kwargs.keys():
+        for k in list(kwargs.keys()):
             v = kwargs.pop(k)
             kwargs[k[0]] = v
         i=0
@@ -977,17 +981,7 @@ class PlotAttributeWidget(BaseAttributeWidget):
                 i += 1
             kwargs[self._defaultcolors[i]] = value
         t = self.time()-self.plot_start_time
-        for color, value in kwargs.items():
-            if value is not None:
-                if not color in self.curves:
-                    self.curves[color] = self.pw.plot(pen=color)
-                curve = self.curves[color]
-                x, y = curve.getData()
-                if x is None or y is None:
-                    x, y = np.array([t]), np.array([value])
-                else:
-                    x, y = np.append(x, t), np.append(y, value)
-                curve.setData(x, y)
+        self.strip_charts.append(t, **kwargs)
 
     def _magnitude(self, data):
         """ little helpers """
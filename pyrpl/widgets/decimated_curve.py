@@ -0,0 +1,164 @@
+"""
+Display-side decimation of long curves.
+
+Drawing a curve with many more points than the plot has pixels costs a lot
+of time without any visual benefit. A :class:`DecimatedCurve` wraps a
+pyqtgraph curve and only passes it a min/max envelope of the data, with
+ENVELOPE_POINTS_PER_PIXEL points per horizontal pixel of the visible range,
+such that narrow peaks remain visible. The envelope is recomputed when new
+data arrives or when the view range changes, and is reused otherwise.
+"""
+import logging
+import numpy as np
+
+logger = logging.getLogger(name=__name__)
+
+
+def minmax_envelope(x, y, xmin, xmax, bins):
+    """
+    Returns (x, y) reduced to the minimum and the maximum of y in each of
+    bins equally spaced intervals between xmin and xmax.
+
+    x must be sorted in increasing order. Points outside [xmin, xmax] are
+    dropped, except for the nearest one on each side such that the curve
+    still extends to the edges of the view. NaN values are ignored.
+    """
+    start = max(np.searchsorted(x, xmin, side='left') - 1, 0)
+    stop = min(np.searchsorted(x, xmax, side='right') + 1, len(x))
+    x, y = x[start:stop], y[start:stop]
+    if len(x) <= 2 * bins:
+        return x, y
+    edges = np.searchsorted(x, np.linspace(xmin, xmax, bins + 1))
+    # the points outside the view become bins of their own
+    starts = np.unique(np.concatenate(([0], edges, [len(x)])))
+    starts = starts[starts < len(x)]
+    ymin = np.fmin.reduceat(y, starts)
+    ymax = np.fmax.reduceat(y, starts)
+    stops = np.append(starts[1:], len(x))
+    xenv = np.empty(2 * len(starts))
+    xenv[0::2] = x[starts]
+    xenv[1::2] = x[stops - 1]
+    yenv = np.empty(2 * len(starts))
+    yenv[0::2] = ymin
+    yenv[1::2] = ymax
+    return xenv, yenv
+
+
+class DecimatedCurve(object):
+    """
+    Wraps a pyqtgraph PlotDataItem such that setData only draws the
+    min/max envelope of the data in the visible range.
+
+    Data with non-monotonic x (e.g. the xy-mode of the scope) is passed to
+    the curve unchanged.
+    """
+    ENVELOPE_POINTS_PER_PIXEL = 2
+    DEFAULT_PIXELS = 1000  # used before the plot has been shown
+
+    def __init__(self, curve):
+        self.curve = curve
+        self._x, self._y = None, None
+        self._key = None  # (view range, pixels) of the displayed envelope
+        self._view_box = None  # view box whose signals update the envelope
+
+    def __getattr__(self, name):
+        # behave like the wrapped curve for everything but setData
+        return getattr(self.curve, name)
+
+    def setData(self, x, y):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        steps = np.diff(x)
+        if not ((steps >= 0).all() or (steps <= 0).all()):
+            self._x, self._y = None, None
+            self.curve.setData(x, y)
+            return
+        if len(x) > 1 and x[0] > x[-1]:
+            x, y = x[::-1], y[::-1]
+        self._x, self._y = x, y
+        self._key = None
+        self._connect()
+        self.update_view()
+
+    def clear(self):
+        """
+        Clears the curve and forgets its data, such that a later change of
+        the view range does not redraw it.
+        """
+        self._x, self._y = None, None
+        self._key = None
+        self._disconnect()
+        self.curve.clear()
+
+    def _view_changed(self, *args):
+        self.update_view()
+
+    def _connect(self):
+        if self._view_box is not None:
+            return
+        view_box = self.curve.getViewBox()
+        if view_box is None:  # curve not yet added to a plot
+            return
+        view_box.sigXRangeChanged.connect(self._view_changed)
+        view_box.sigResized.connect(self._view_changed)
+        self._view_box = view_box
+
+    def _disconnect(self):
+        if self._view_box is None:
+            return
+        for signal in (self._view_box.sigXRangeChanged,
+                       self._view_box.sigResized):
+            try:
+                signal.disconnect(self._view_changed)
+            except (TypeError, RuntimeError):  # already disconnected
+                pass
+        self._view_box = None
+
+    def _log_x(self):
+        try:
+            return self.curve.opts['logMode'][0]
+        except (KeyError, TypeError, IndexError):
+            return False
+
+    def update_view(self):
+        """
+        Recomputes the envelope if the view range has changed since it was
+        last drawn.
+        """
+        if self._x is None:
+            return
+        view_box = self.curve.getViewBox()
+        if view_box is None:
+            xmin, xmax = -np.inf, np.inf
+            pixels = self.DEFAULT_PIXELS
+        else:
+            xmin, xmax = view_box.viewRange()[0]
+            pixels = int(view_box.width()) or self.DEFAULT_PIXELS
+        log_x = self._log_x()
+        key = (xmin, xmax, pixels, log_x)
+        if key == self._key:
+            return
+        self._key = key
+        x, y = self._x, self._y
+        if log_x:  # the view range is given in decades
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_display = np.log10(x)
+        else:
+            x_display = x
+        finite = np.isfinite(x_display)
+        if not finite.all():  # e.g. x <= 0 in log mode, cannot be displayed
+            x_display, y = x_display[finite], y[finite]
+        bins = pixels * self.ENVELOPE_POINTS_PER_PIXEL // 2
+        if not np.isfinite([xmin, xmax]).all() and len(x_display):
+            xmin, xmax = x_display[0], x_display[-1]
+        if not xmax > xmin or len(x_display) == 0:
+            self.curve.setData(self._x, self._y)
+            return
+        xenv, yenv = minmax_envelope(x_display, y, xmin, xmax, bins)
+        # keep the first and last point, such that the bounds of the curve
+        # (used for autoranging) do not depend on the view range
+        x_display = np.concatenate((x_display[:1], xenv, x_display[-1:]))
+        y = np.concatenate((y[:1], yenv, y[-1:]))
+        if log_x:
+            x_display = 10**x_display
+        self.curve.setData(x_display, y)
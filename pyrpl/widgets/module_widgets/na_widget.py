@@ -39,6 +39,7 @@ output selected in :code:`output_direct`.
 
 from .base_module_widget import ModuleWidget
 from.acquisition_module_widget import AcquisitionModuleWidget
+from ..decimated_curve import DecimatedCurve
 
 from qtpy import QtCore, QtWidgets
 import pyqtgraph as pg
@@ -99,8 +100,9 @@ class NaWidget(AcquisitionModuleWidget):
         for label, wids in [('Channels', ['input', 'output_direct']),
                             ('Frequency', ['start_freq', 'stop_freq',
                                            'points', 'logscale']),
+                            ('Adaptive', ['adaptive', 'adaptive_tolerance']),
                             ('Setup', ['amplitude', 'acbandwidth']),
-                            ('Averaging', ['average_per_point', 'rbw']),
+                            ('Averaging', ['average_per_point', 'rbw', 'parallel_iqs']),
                             ('Auto-bandwidth', ['auto_bandwidth', 'q_factor_min']),
                             ('Auto-amplitude', ['auto_amplitude', 'target_dbv',
                                                 'auto_amp_min', 'auto_amp_max'])]:
@@ -192,7 +194,7 @@ class NaWidget(AcquisitionModuleWidget):
         if in run continuous, needs to redisplay the number of averages
         """
         self.update_current_average()
-        self.update_point(self.module.points-1, force=True) # make sure all points in the scan are updated
+        self.update_point(len(self.module.data_x)-1, force=True) # make sure all points in the scan are updated
 
     def set_benchmark_text(self, text):
         self.label_benchmark.setText(text)
@@ -201,11 +203,17 @@ class NaWidget(AcquisitionModuleWidget):
         """
         To speed things up, the curves are plotted by chunks of
         self.CHUNK_SIZE points. All points between last_updated_point and
-        index will be redrawn.
+        index will be redrawn. In an adaptive sweep, points are inserted
+        anywhere into the curve, and a parallel sweep fills all blocks of
+        the curve at the same time, such that all chunks are redrawn.
         """
         # APP.processEvents()  # Give hand back to the gui since timer intervals might be very short
         last_chunk_index = self.last_updated_point//self.CHUNK_SIZE
         current_chunk_index = index//self.CHUNK_SIZE
+        if self.module._is_adaptive_sweep() or \
+                self.module._is_parallel_sweep():
+            last_chunk_index = 0
+            current_chunk_index = (len(self.module.data_x)-1)//self.CHUNK_SIZE
 
         rate = self.module.measured_time_per_point
         if not np.isnan(rate) and self._last_benchmark_value != rate:
@@ -223,7 +231,7 @@ class NaWidget(AcquisitionModuleWidget):
             self.last_updated_time = time()
 
             # draw arrow
-            cur = self.module.current_point - 1
+            cur = self.module.last_measured_point
             visible = self.module.last_valid_point != cur + 1
             logscale = self.module.logscale
             freq = self.module.data_x[cur]
@@ -256,8 +264,11 @@ class NaWidget(AcquisitionModuleWidget):
         """
         while len(self.chunks) <= chunk_index: # create as many chunks as needed to reach chunk_index (in principle only
             # one curve should be missing at most)
-            chunk = self.plot_item.plot(pen='y')
-            chunk_phase = self.plot_item_phase.plot(pen=None, symbol='o')
+            # points not yet measured in a parallel sweep are NaN
+            chunk = DecimatedCurve(self.plot_item.plot(pen='y',
+                                                       connect='finite'))
+            chunk_phase = DecimatedCurve(self.plot_item_phase.plot(pen=None,
+                                                                   symbol='o'))
             self.chunks.append(chunk)
             self.chunks_phase.append(chunk_phase)
             log_mod = self.module.logscale
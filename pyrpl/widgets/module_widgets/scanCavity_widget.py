@@ -14,8 +14,6 @@ from .base_module_widget import ModuleWidget
 from .acquisition_module_widget import AcquisitionModuleWidget
 import networkx as nx
 from ...graphCalculator import greedy_clique_partition
-import time
-import threading
 class PeakBorderLine(QtWidgets.QGraphicsLineItem):
 	def __init__(self, parent, peakLine):
 		super().__init__(0.0, 0, 0.001, 0, parent = parent)
@@ -777,34 +775,15 @@ class ScanCavity_widget(AcquisitionModuleWidget):
 		self.currentGroupIndex = newIndex
 	
 	def startIvalAcquisition(self):
-		signalWidgets = [peak.ival for peak in self.peakList]
-		if self.alreadyAcquiringIval:
-			self.alreadyAcquiringIval = False
+		'''toggles the recording of the peak telemetry (peak positions, heights and ivals, once per scan)'''
+		telemetry = self.module.telemetry
+		if telemetry.running:
+			telemetry.stop()
+			self.module._logger.info("Ival acquisition ended. Data saved in %s.", telemetry.filename)
 			return
-		self.alreadyAcquiringIval = True
-		
-		def read_values():
-			values_array = np.zeros((10*60*60, len(signalWidgets)))
-			samplingTime = 1#seconds
-			print(f"starting acquisition. f_s = {samplingTime}, duration = {samplingTime * values_array.shape[0]}")
-			iii = 0
-			for iii in range(values_array.shape[0]):
-				if not self.alreadyAcquiringIval:
-					break
-				time.sleep(samplingTime)
-				for i, widget in enumerate(signalWidgets):
-					value = widget.attribute_value
-					values_array[iii, i] = value
-			if iii < values_array.shape[0] - 1:
-				values_array = values_array[:iii, :]
-			# Save to .dat file
-			fileName = 'ival_measurements.dat'
-			
-			for i in range(len(signalWidgets)):
-				self.module.save_curve(np.arange(values_array.shape[0]) * samplingTime, values_array[:,i])
-			print(f"acquisition ended. data saved in {fileName}")
-		thread = threading.Thread(target=read_values, daemon=True)
-		thread.start()
+		fileName = 'ival_measurements.bin'
+		self.module._logger.info("Starting ival acquisition at %.3g Hz.", 1. / telemetry.scan_period)
+		telemetry.start(fileName)
 
 
 class scanSwitcher:
@@ -37,6 +37,7 @@ import pyqtgraph as pg
 from qtpy import QtCore, QtGui, QtWidgets
 import numpy as np
 from ...errors import NotReadyError
+from ..decimated_curve import DecimatedCurve
 from .base_module_widget import ModuleWidget
 from .acquisition_module_widget import AcquisitionModuleWidget
 
@@ -140,13 +141,15 @@ class ScopeWidget(AcquisitionModuleWidget):
         #self.button_continuous = QtWidgets.QPushButton("Run continuous")
         #self.button_save = QtWidgets.QPushButton("Save curve")
 
-        self.curves = [self.plot_item.plot(pen=(QtGui.QColor(color).red(),
+        self.curves = [DecimatedCurve(self.plot_item.plot(pen=(
+                                                QtGui.QColor(color).red(),
                                                 QtGui.QColor(color).green(),
                                                 QtGui.QColor(color).blue()
-                                                ))
+                                                )))
                                                 #,trans)) \
                        for color, trans in zip(self.ch_color,
                                                self.ch_transparency)]
+        self._math_code = None  # (formula, compiled formula)
         self.main_layout.addWidget(self.win, stretch=10)
 
 
@@ -256,7 +259,7 @@ class ScopeWidget(AcquisitionModuleWidget):
                 backup_np_err = np.geterr()
                 np.seterr(all='ignore')
                 try:
-                    math_data = eval(self.module.math_formula,
+                    math_data = eval(self._compiled_math_formula(),
                        dict(ch1=ch1, ch2=ch2, np=np, times=times))
                 except:
                     pass
@@ -268,6 +271,16 @@ class ScopeWidget(AcquisitionModuleWidget):
                 self.curves[2].setVisible(False)
         self.update_current_average() # to update the number of averages
 
+    def _compiled_math_formula(self):
+        """
+        The math formula is only compiled again when it has changed.
+        """
+        formula = self.module.math_formula
+        if self._math_code is None or self._math_code[0] != formula:
+            self._math_code = (formula, compile(formula, '<math_formula>',
+                                                'eval'))
+        return self._math_code[1]
+
     def set_rolling_mode(self):
         """
         Set rolling mode on or off based on the module's attribute
@@ -36,6 +36,10 @@ The following attributes can be manipulated by the SpectrumAnalyzer widget:
 * :attr:`~pyrpl.software_modules.spectrum_analyzer.SpectrumAnalyzer.window`:
   The type of window used for the Fourier transform. See
   scipy.signal.get_window for a list of available options.
+* :attr:`~pyrpl.software_modules.spectrum_analyzer.SpectrumAnalyzer.welch_segments`:
+  The number of overlapping segments into which each acquired trace is
+  split. Their spectra are averaged, which reduces the noise of each trace
+  at the expense of a wider rbw.
 * :attr:`~pyrpl.software_modules.spectrum_analyzer.SpectrumAnalyzer.acbandwidth`
   *(only available with* :code:`baseband=False` *)*: The cut-off frequency of
   the high-pass filter before frequency-shifting (=demodulation) of the input
@@ -114,7 +118,7 @@ class OtherAttributesWidget(QtWidgets.QWidget):
 
         self.v_layout2 = QtWidgets.QVBoxLayout()
         self.h_layout.addLayout(self.v_layout2)
-        for name in ["span", "window"]:
+        for name in ["span", "window", "welch_segments"]:
             widget = aws[name]
             specan_widget.attribute_layout.removeWidget(widget)
             self.v_layout2.addWidget(widget)
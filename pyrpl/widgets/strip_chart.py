@@ -0,0 +1,107 @@
+"""
+Strip charts: curves of values appended over time.
+
+Appending a point to a pyqtgraph curve with np.append copies the whole
+history, such that long-running plots get progressively slower. A
+:class:`StripChart` stores the points in preallocated arrays of fixed
+capacity instead. When the storage is full, a quarter of it is freed,
+either by dropping every other point of the older half (decimate=True, the
+whole history is kept with a resolution decreasing with age) or by dropping
+the oldest points. Both cost O(capacity) once every capacity/4 points, i.e.
+a constant amount per point.
+
+:class:`StripChartCurves` draws a set of strip charts in a plot. Redraws
+happen at most every REFRESH_INTERVAL_MS, however fast points are appended,
+and only the min/max envelope of the visible range is drawn (see
+DecimatedCurve).
+"""
+import logging
+import numpy as np
+from qtpy import QtCore
+from .decimated_curve import DecimatedCurve
+
+logger = logging.getLogger(name=__name__)
+
+
+class StripChart(object):
+    """
+    Fixed-capacity storage of the (x, y) points of a curve, with x
+    increasing.
+    """
+    def __init__(self, capacity=2**16, decimate=True):
+        self.capacity = max(4 * int(np.ceil(capacity / 4.)), 4)
+        self.decimate = decimate
+        self._data = np.zeros((2, self.capacity))
+        self.n = 0  # number of stored points
+
+    def __len__(self):
+        return self.n
+
+    def append(self, x, y):
+        if self.n == self.capacity:
+            self._compact()
+        self._data[:, self.n] = x, y
+        self.n += 1
+
+    def _compact(self):
+        """ frees a quarter of the storage """
+        quarter = self.capacity // 4
+        if self.decimate:
+            # every other point of the older half is dropped
+            self._data[:, :quarter] = self._data[:, :2 * quarter:2]
+            self._data[:, quarter:3 * quarter] = self._data[:, 2 * quarter:]
+        else:
+            self._data[:, :3 * quarter] = self._data[:, quarter:]
+        self.n = 3 * quarter
+
+    @property
+    def data(self):
+        """ copy of the stored points as a tuple of arrays (x, y) """
+        x, y = self._data[:, :self.n].copy()
+        return x, y
+
+    def clear(self):
+        self.n = 0
+
+
+class StripChartCurves(object):
+    """
+    Strip charts drawn in a pyqtgraph PlotItem, one per pen color.
+
+    append(t, color=value, ...) adds the points and schedules a redraw.
+    """
+    REFRESH_INTERVAL_MS = 16  # at most one redraw per display frame
+
+    def __init__(self, plot_item, capacity=2**16, decimate=True):
+        self.plot_item = plot_item
+        self.capacity = capacity
+        self.decimate = decimate
+        self.curves = {}
+        self.charts = {}
+        self._changed = set()
+        self._timer = QtCore.QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.REFRESH_INTERVAL_MS)
+        self._timer.timeout.connect(self.redraw)
+
+    def append(self, t, **values):
+        for color, value in values.items():
+            if value is None:
+                continue
+            if color not in self.charts:
+                self.curves[color] = DecimatedCurve(
+                    self.plot_item.plot(pen=color))
+                self.charts[color] = StripChart(self.capacity, self.decimate)
+            self.charts[color].append(t, value)
+            self._changed.add(color)
+        if self._changed and not self._timer.isActive():
+            self._timer.start()
+
+    def redraw(self):
+        """ draws the curves whose data have changed since the last redraw """
+        for color in self._changed:
+            self.curves[color].setData(*self.charts[color].data)
+        self._changed.clear()
+
+    def stop(self):
+        self._timer.stop()